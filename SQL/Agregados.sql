@@ -0,0 +1,135 @@
+-- Agregados por regla y por hora / dia (UTC)
+-- La API los mantiene en la misma transaccion de cada ingesta (services/rollup.py) y
+-- /api/v1/inactive los usa para los dias y horas completos del rango consultado.
+
+CREATE TABLE IF NOT EXISTS rule_metrics_hourly (
+    rule_id BIGINT NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL, -- Inicio del periodo en UTC
+    sample_count INT NOT NULL DEFAULT 0,
+    first_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    evaluations_first BIGINT NOT NULL,
+    evaluations_last BIGINT NOT NULL,
+    evaluations_delta BIGINT NOT NULL DEFAULT 0,
+    evaluations_delta_min BIGINT NOT NULL,
+    evaluations_delta_max BIGINT NOT NULL,
+    packets_matched_first BIGINT NOT NULL,
+    packets_matched_last BIGINT NOT NULL,
+    packets_matched_delta BIGINT NOT NULL DEFAULT 0,
+    packets_matched_delta_min BIGINT NOT NULL,
+    packets_matched_delta_max BIGINT NOT NULL,
+    bytes_matched_first BIGINT NOT NULL,
+    bytes_matched_last BIGINT NOT NULL,
+    bytes_matched_delta BIGINT NOT NULL DEFAULT 0,
+    bytes_matched_delta_min BIGINT NOT NULL,
+    bytes_matched_delta_max BIGINT NOT NULL,
+    states_created_first BIGINT NOT NULL,
+    states_created_last BIGINT NOT NULL,
+    states_created_delta BIGINT NOT NULL DEFAULT 0,
+    states_created_delta_min BIGINT NOT NULL,
+    states_created_delta_max BIGINT NOT NULL,
+    PRIMARY KEY (rule_id, bucket_start)
+);
+CREATE INDEX IF NOT EXISTS idx_rule_metrics_hourly_bucket_start ON rule_metrics_hourly (bucket_start);
+
+CREATE TABLE IF NOT EXISTS rule_metrics_daily (
+    rule_id BIGINT NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL, -- Inicio del periodo en UTC
+    sample_count INT NOT NULL DEFAULT 0,
+    first_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    evaluations_first BIGINT NOT NULL,
+    evaluations_last BIGINT NOT NULL,
+    evaluations_delta BIGINT NOT NULL DEFAULT 0,
+    evaluations_delta_min BIGINT NOT NULL,
+    evaluations_delta_max BIGINT NOT NULL,
+    packets_matched_first BIGINT NOT NULL,
+    packets_matched_last BIGINT NOT NULL,
+    packets_matched_delta BIGINT NOT NULL DEFAULT 0,
+    packets_matched_delta_min BIGINT NOT NULL,
+    packets_matched_delta_max BIGINT NOT NULL,
+    bytes_matched_first BIGINT NOT NULL,
+    bytes_matched_last BIGINT NOT NULL,
+    bytes_matched_delta BIGINT NOT NULL DEFAULT 0,
+    bytes_matched_delta_min BIGINT NOT NULL,
+    bytes_matched_delta_max BIGINT NOT NULL,
+    states_created_first BIGINT NOT NULL,
+    states_created_last BIGINT NOT NULL,
+    states_created_delta BIGINT NOT NULL DEFAULT 0,
+    states_created_delta_min BIGINT NOT NULL,
+    states_created_delta_max BIGINT NOT NULL,
+    PRIMARY KEY (rule_id, bucket_start)
+);
+CREATE INDEX IF NOT EXISTS idx_rule_metrics_daily_bucket_start ON rule_metrics_daily (bucket_start);
+
+-----------------------------------------------------------------------------------
+
+-- Cargar los agregados con las muestras historicas (ejecutar una sola vez, despues de Deltas.sql)
+INSERT INTO rule_metrics_hourly (rule_id, bucket_start, sample_count, first_sample_at, last_sample_at, evaluations_first, evaluations_last, evaluations_delta, evaluations_delta_min, evaluations_delta_max, packets_matched_first, packets_matched_last, packets_matched_delta, packets_matched_delta_min, packets_matched_delta_max, bytes_matched_first, bytes_matched_last, bytes_matched_delta, bytes_matched_delta_min, bytes_matched_delta_max, states_created_first, states_created_last, states_created_delta, states_created_delta_min, states_created_delta_max)
+SELECT
+    rule_id,
+    date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+    COUNT(*),
+    MIN(timestamp),
+    MAX(timestamp),
+    (ARRAY_AGG(evaluations ORDER BY timestamp))[1],
+    (ARRAY_AGG(evaluations ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(evaluations_delta), 0),
+    COALESCE(MIN(evaluations_delta), 0),
+    COALESCE(MAX(evaluations_delta), 0),
+    (ARRAY_AGG(packets_matched ORDER BY timestamp))[1],
+    (ARRAY_AGG(packets_matched ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(packets_matched_delta), 0),
+    COALESCE(MIN(packets_matched_delta), 0),
+    COALESCE(MAX(packets_matched_delta), 0),
+    (ARRAY_AGG(bytes_matched ORDER BY timestamp))[1],
+    (ARRAY_AGG(bytes_matched ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(bytes_matched_delta), 0),
+    COALESCE(MIN(bytes_matched_delta), 0),
+    COALESCE(MAX(bytes_matched_delta), 0),
+    (ARRAY_AGG(states_created ORDER BY timestamp))[1],
+    (ARRAY_AGG(states_created ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(states_created_delta), 0),
+    COALESCE(MIN(states_created_delta), 0),
+    COALESCE(MAX(states_created_delta), 0)
+FROM rule_metrics
+GROUP BY rule_id, bucket
+ON CONFLICT (rule_id, bucket_start) DO NOTHING;
+
+INSERT INTO rule_metrics_daily (rule_id, bucket_start, sample_count, first_sample_at, last_sample_at, evaluations_first, evaluations_last, evaluations_delta, evaluations_delta_min, evaluations_delta_max, packets_matched_first, packets_matched_last, packets_matched_delta, packets_matched_delta_min, packets_matched_delta_max, bytes_matched_first, bytes_matched_last, bytes_matched_delta, bytes_matched_delta_min, bytes_matched_delta_max, states_created_first, states_created_last, states_created_delta, states_created_delta_min, states_created_delta_max)
+SELECT
+    rule_id,
+    date_trunc('day', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+    COUNT(*),
+    MIN(timestamp),
+    MAX(timestamp),
+    (ARRAY_AGG(evaluations ORDER BY timestamp))[1],
+    (ARRAY_AGG(evaluations ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(evaluations_delta), 0),
+    COALESCE(MIN(evaluations_delta), 0),
+    COALESCE(MAX(evaluations_delta), 0),
+    (ARRAY_AGG(packets_matched ORDER BY timestamp))[1],
+    (ARRAY_AGG(packets_matched ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(packets_matched_delta), 0),
+    COALESCE(MIN(packets_matched_delta), 0),
+    COALESCE(MAX(packets_matched_delta), 0),
+    (ARRAY_AGG(bytes_matched ORDER BY timestamp))[1],
+    (ARRAY_AGG(bytes_matched ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(bytes_matched_delta), 0),
+    COALESCE(MIN(bytes_matched_delta), 0),
+    COALESCE(MAX(bytes_matched_delta), 0),
+    (ARRAY_AGG(states_created ORDER BY timestamp))[1],
+    (ARRAY_AGG(states_created ORDER BY timestamp DESC))[1],
+    COALESCE(SUM(states_created_delta), 0),
+    COALESCE(MIN(states_created_delta), 0),
+    COALESCE(MAX(states_created_delta), 0)
+FROM rule_metrics
+GROUP BY rule_id, bucket
+ON CONFLICT (rule_id, bucket_start) DO NOTHING;
+
+-----------------------------------------------------------------------------------
+
+-- Permisos
+GRANT SELECT, INSERT, UPDATE ON rule_metrics_hourly TO api_user;
+GRANT SELECT, INSERT, UPDATE ON rule_metrics_daily TO api_user;
+GRANT SELECT ON rule_metrics_daily TO proccess_user;
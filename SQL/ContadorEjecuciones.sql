@@ -0,0 +1,79 @@
+-- Contador de ejecuciones sin fila compartida
+-- Antes cada ingesta hacia UPDATE de la fila del mes en monthly_execution_counts: las
+-- ingestas simultaneas esperaban el bloqueo de esa fila hasta el commit y cada
+-- incremento dejaba una tupla muerta. Ahora la API solo inserta una fila por ejecucion
+-- en execution_log y los meses cerrados se compactan en monthly_execution_counts.
+-- El conteo exacto de un mes es la suma de ambas tablas (vista monthly_execution_totals).
+-- Ejecutar una sola vez, despues de MultiFirewall.sql.
+
+-- Bitacora de ejecuciones (solo INSERT desde la API)
+CREATE TABLE IF NOT EXISTS execution_log (
+    log_id BIGSERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    executed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_execution_log_executed_at ON execution_log (executed_at);
+
+-----------------------------------------------------------------------------------
+
+-- Conteo exacto por firewall y mes (UTC): meses compactados + ejecuciones pendientes de compactar
+CREATE OR REPLACE VIEW monthly_execution_totals AS
+SELECT
+    source,
+    month_start_date,
+    SUM(execution_count)::INT AS execution_count
+FROM (
+    SELECT source, month_start_date, execution_count
+    FROM monthly_execution_counts
+    UNION ALL
+    SELECT
+        source,
+        (date_trunc('month', executed_at AT TIME ZONE 'UTC'))::DATE AS month_start_date,
+        COUNT(*) AS execution_count
+    FROM execution_log
+    GROUP BY source, month_start_date
+) AS counts
+GROUP BY source, month_start_date;
+
+-----------------------------------------------------------------------------------
+
+-- Compacta en monthly_execution_counts las ejecuciones de los meses ya cerrados.
+-- El DELETE y el INSERT van en la misma sentencia, el conteo nunca se pierde ni se duplica.
+-- Programar junto con analyze_monthly_inactive_rules (pgAgent o cron), p. ej. una vez al dia.
+CREATE OR REPLACE PROCEDURE compact_execution_log()
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_compacted INT;
+BEGIN
+    WITH moved AS (
+        DELETE FROM execution_log
+        WHERE executed_at < (date_trunc('month', NOW() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+        RETURNING source, executed_at
+    )
+    INSERT INTO monthly_execution_counts AS mec (source, month_start_date, execution_count, last_updated_at)
+    SELECT
+        source,
+        (date_trunc('month', executed_at AT TIME ZONE 'UTC'))::DATE,
+        COUNT(*),
+        NOW()
+    FROM moved
+    GROUP BY 1, 2
+    ON CONFLICT (source, month_start_date) DO UPDATE SET
+        execution_count = mec.execution_count + EXCLUDED.execution_count,
+        last_updated_at = EXCLUDED.last_updated_at;
+
+    GET DIAGNOSTICS v_compacted = ROW_COUNT;
+    RAISE NOTICE 'Contadores mensuales compactados: %', v_compacted;
+END;
+$$;
+
+-----------------------------------------------------------------------------------
+
+-- Permisos
+GRANT SELECT, INSERT ON execution_log TO api_user;
+GRANT USAGE ON SEQUENCE execution_log_log_id_seq TO api_user;
+GRANT SELECT, DELETE ON execution_log TO proccess_user;
+GRANT SELECT, INSERT, UPDATE ON monthly_execution_counts TO proccess_user;
+GRANT SELECT ON monthly_execution_totals TO proccess_user;
+GRANT USAGE ON SEQUENCE monthly_execution_counts_count_id_seq TO proccess_user;
@@ -30,4 +30,10 @@ GRANT CONNECT ON DATABASE pf_sense TO proccess_user;
 -- ALTER DEFAULT PRIVILEGES IN SCHEMA public;
 
 GRANT CONNECT ON DATABASE pf_sense_report TO api_user;
-GRANT CONNECT ON DATABASE pf_sense_report TO proccess_user;
\ No newline at end of file
+GRANT CONNECT ON DATABASE pf_sense_report TO proccess_user;
+
+-- 5. Usuario de solo lectura para el engine de lectura de la API (DB_READ_ENGINE=1, READ_POSTGRES_USER=read_user)
+-- Sus permisos los agrega la migracion 0007
+CREATE USER read_user WITH ENCRYPTED PASSWORD 'pass';
+GRANT CONNECT ON DATABASE test_db TO read_user;
+GRANT CONNECT ON DATABASE pf_sense TO read_user;
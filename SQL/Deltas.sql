@@ -0,0 +1,44 @@
+-- Deltas por muestra en rule_metrics
+-- Los contadores de pf son acumulativos y se reinician al recargar reglas o reiniciar el firewall.
+-- La API guarda en cada fila el delta contra la muestra anterior de la misma regla.
+
+ALTER TABLE rule_metrics ADD COLUMN IF NOT EXISTS evaluations_delta BIGINT;
+ALTER TABLE rule_metrics ADD COLUMN IF NOT EXISTS packets_matched_delta BIGINT;
+ALTER TABLE rule_metrics ADD COLUMN IF NOT EXISTS bytes_matched_delta BIGINT;
+ALTER TABLE rule_metrics ADD COLUMN IF NOT EXISTS states_created_delta BIGINT;
+ALTER TABLE rule_metrics ADD COLUMN IF NOT EXISTS counter_reset BOOLEAN NOT NULL DEFAULT FALSE;
+
+-----------------------------------------------------------------------------------
+
+-- Calcular los deltas de las filas historicas (ejecutar una sola vez)
+-- Si algun contador bajo respecto a la muestra anterior se considera reinicio y el delta es el valor completo
+WITH ordered AS (
+    SELECT
+        id,
+        evaluations, packets_matched, bytes_matched, states_created,
+        LAG(evaluations) OVER w AS prev_evaluations,
+        LAG(packets_matched) OVER w AS prev_packets_matched,
+        LAG(bytes_matched) OVER w AS prev_bytes_matched,
+        LAG(states_created) OVER w AS prev_states_created
+    FROM rule_metrics
+    WINDOW w AS (PARTITION BY rule_id ORDER BY timestamp, id)
+),
+deltas AS (
+    SELECT
+        prev_evaluations IS NOT NULL AND (
+            evaluations < prev_evaluations OR packets_matched < prev_packets_matched
+            OR bytes_matched < prev_bytes_matched OR states_created < prev_states_created
+        ) AS is_reset,
+        *
+    FROM ordered
+)
+UPDATE rule_metrics rm
+SET
+    evaluations_delta = CASE WHEN d.prev_evaluations IS NULL THEN 0 WHEN d.is_reset THEN d.evaluations ELSE d.evaluations - d.prev_evaluations END,
+    packets_matched_delta = CASE WHEN d.prev_evaluations IS NULL THEN 0 WHEN d.is_reset THEN d.packets_matched ELSE d.packets_matched - d.prev_packets_matched END,
+    bytes_matched_delta = CASE WHEN d.prev_evaluations IS NULL THEN 0 WHEN d.is_reset THEN d.bytes_matched ELSE d.bytes_matched - d.prev_bytes_matched END,
+    states_created_delta = CASE WHEN d.prev_evaluations IS NULL THEN 0 WHEN d.is_reset THEN d.states_created ELSE d.states_created - d.prev_states_created END,
+    counter_reset = d.is_reset
+FROM deltas d
+WHERE rm.id = d.id
+  AND rm.bytes_matched_delta IS NULL;
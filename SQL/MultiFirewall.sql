@@ -0,0 +1,59 @@
+-- Migracion a varios firewalls: columna source en todas las tablas
+-- El id de una regla de pf solo es unico dentro de su firewall, por eso la llave de rules
+-- pasa a ser (source, rule_id) y los indices empiezan por source.
+-- Los datos existentes quedan con source = 'default' (el firewall que ya reportaba).
+-- Ejecutar una sola vez, con la API detenida y despues de Particionamiento.sql y Agregados.sql.
+
+BEGIN;
+
+-- 1. Quitar las llaves foraneas que apuntan a rules(rule_id)
+--    (los nombres cambian si las tablas las creo la API con SQLAlchemy)
+ALTER TABLE rule_metrics DROP CONSTRAINT IF EXISTS fk_rule_metrics_rule_id;
+ALTER TABLE rule_metrics DROP CONSTRAINT IF EXISTS rule_metrics_rule_id_fkey;
+ALTER TABLE inactive_rule_log DROP CONSTRAINT IF EXISTS fk_inactive_rule_log_rule_id;
+ALTER TABLE inactive_rule_log DROP CONSTRAINT IF EXISTS inactive_rule_log_rule_id_fkey;
+ALTER TABLE monthly_fully_inactive_rules DROP CONSTRAINT IF EXISTS fk_monthly_fully_inactive_rules_rule_id;
+
+-- 2. Columna source (con DEFAULT constante no se reescriben las tablas)
+ALTER TABLE rules ADD COLUMN source VARCHAR(64) NOT NULL DEFAULT 'default';
+ALTER TABLE rule_metrics ADD COLUMN source VARCHAR(64) NOT NULL DEFAULT 'default';
+ALTER TABLE inactive_rule_log ADD COLUMN source VARCHAR(64) NOT NULL DEFAULT 'default';
+ALTER TABLE monthly_execution_counts ADD COLUMN source VARCHAR(64) NOT NULL DEFAULT 'default';
+ALTER TABLE monthly_fully_inactive_rules ADD COLUMN source VARCHAR(64) NOT NULL DEFAULT 'default';
+ALTER TABLE rule_metrics_hourly ADD COLUMN source VARCHAR(64) NOT NULL DEFAULT 'default';
+ALTER TABLE rule_metrics_daily ADD COLUMN source VARCHAR(64) NOT NULL DEFAULT 'default';
+
+-- 3. Llaves primarias y restricciones UNIQUE por firewall
+ALTER TABLE rules DROP CONSTRAINT rules_pkey;
+ALTER TABLE rules ADD PRIMARY KEY (source, rule_id);
+ALTER TABLE rule_metrics_hourly DROP CONSTRAINT rule_metrics_hourly_pkey;
+ALTER TABLE rule_metrics_hourly ADD PRIMARY KEY (source, rule_id, bucket_start);
+ALTER TABLE rule_metrics_daily DROP CONSTRAINT rule_metrics_daily_pkey;
+ALTER TABLE rule_metrics_daily ADD PRIMARY KEY (source, rule_id, bucket_start);
+ALTER TABLE monthly_execution_counts DROP CONSTRAINT IF EXISTS uq_monthly_execution_count;
+ALTER TABLE monthly_execution_counts DROP CONSTRAINT IF EXISTS monthly_execution_counts_month_start_date_key;
+ALTER TABLE monthly_execution_counts ADD CONSTRAINT uq_monthly_execution_count UNIQUE (source, month_start_date);
+ALTER TABLE monthly_fully_inactive_rules DROP CONSTRAINT uq_monthly_fully_inactive;
+ALTER TABLE monthly_fully_inactive_rules ADD CONSTRAINT uq_monthly_fully_inactive UNIQUE (source, rule_id, month_start_date);
+
+-- 4. Llaves foraneas compuestas
+ALTER TABLE rule_metrics ADD CONSTRAINT fk_rule_metrics_rule_id
+    FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT;
+ALTER TABLE inactive_rule_log ADD CONSTRAINT fk_inactive_rule_log_rule_id
+    FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT;
+ALTER TABLE monthly_fully_inactive_rules ADD CONSTRAINT fk_monthly_fully_inactive_rules_rule_id
+    FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT;
+
+-- 5. Indices que empiezan por source (los de rule_id solo ya no sirven a las consultas)
+DROP INDEX IF EXISTS idx_rules_rule_label;
+DROP INDEX IF EXISTS idx_rule_metrics_rule_id;
+DROP INDEX IF EXISTS idx_rule_metrics_rule_id_timestamp;
+DROP INDEX IF EXISTS idx_inactive_rule_log_rule_id;
+DROP INDEX IF EXISTS idx_monthly_execution_counts_month;
+DROP INDEX IF EXISTS idx_monthly_fully_inactive_rules_rule_id;
+CREATE INDEX idx_rules_source_rule_label ON rules (source, rule_label);
+CREATE INDEX idx_rule_metrics_source_rule_id_timestamp ON rule_metrics (source, rule_id, timestamp DESC);
+CREATE INDEX idx_inactive_rule_log_source_rule_id ON inactive_rule_log (source, rule_id);
+CREATE INDEX idx_monthly_fully_inactive_rules_source_rule_id ON monthly_fully_inactive_rules (source, rule_id);
+
+COMMIT;
@@ -0,0 +1,110 @@
+-- Migracion de rule_metrics e inactive_rule_log a tablas particionadas por rango de tiempo
+-- Las particiones nuevas las crea `python manage.py partitions` (cron, rol dueno de las tablas) por
+-- adelantado (models/partition.py, PARTITION_INTERVAL, PARTITION_PREMAKE) y las que salen de
+-- PARTITION_RETENTION se eliminan o separan completas. La API solo verifica que existan.
+-- Ejecutar una sola vez, con la API detenida y despues de Deltas.sql.
+
+BEGIN;
+
+-- 1. Renombrar las tablas actuales
+ALTER TABLE rule_metrics RENAME TO rule_metrics_old;
+ALTER TABLE inactive_rule_log RENAME TO inactive_rule_log_old;
+ALTER SEQUENCE rule_metrics_id_seq RENAME TO rule_metrics_old_id_seq;
+ALTER SEQUENCE inactive_rule_log_log_id_seq RENAME TO inactive_rule_log_old_log_id_seq;
+ALTER INDEX rule_metrics_pkey RENAME TO rule_metrics_old_pkey;
+ALTER INDEX inactive_rule_log_pkey RENAME TO inactive_rule_log_old_pkey;
+ALTER INDEX idx_rule_metrics_rule_id RENAME TO idx_rule_metrics_old_rule_id;
+ALTER INDEX idx_rule_metrics_timestamp RENAME TO idx_rule_metrics_old_timestamp;
+ALTER INDEX idx_rule_metrics_rule_id_timestamp RENAME TO idx_rule_metrics_old_rule_id_timestamp;
+ALTER INDEX idx_inactive_rule_log_rule_id RENAME TO idx_inactive_rule_log_old_rule_id;
+ALTER INDEX idx_inactive_rule_log_created_at RENAME TO idx_inactive_rule_log_old_created_at;
+
+-- 2. Crear las tablas particionadas (la llave de la particion forma parte de la llave primaria)
+CREATE TABLE rule_metrics (
+    id BIGSERIAL,
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    rule_id BIGINT NOT NULL,
+    evaluations BIGINT NOT NULL,
+    packets_matched BIGINT NOT NULL,
+    bytes_matched BIGINT NOT NULL,
+    states_created BIGINT NOT NULL,
+    state_packets BIGINT NOT NULL,
+    state_bytes BIGINT NOT NULL,
+    input_output BIGINT,
+    evaluations_delta BIGINT,
+    packets_matched_delta BIGINT,
+    bytes_matched_delta BIGINT,
+    states_created_delta BIGINT,
+    counter_reset BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (id, timestamp),
+    CONSTRAINT fk_rule_metrics_rule_id FOREIGN KEY (rule_id) REFERENCES rules (rule_id) ON DELETE RESTRICT
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE inactive_rule_log (
+    log_id BIGSERIAL,
+    rule_id BIGINT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (log_id, created_at),
+    CONSTRAINT fk_inactive_rule_log_rule_id FOREIGN KEY (rule_id) REFERENCES rules (rule_id) ON DELETE RESTRICT
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX idx_rule_metrics_rule_id ON rule_metrics (rule_id);
+CREATE INDEX idx_rule_metrics_timestamp ON rule_metrics (timestamp);
+CREATE INDEX idx_rule_metrics_rule_id_timestamp ON rule_metrics (rule_id, timestamp DESC);
+CREATE INDEX idx_inactive_rule_log_rule_id ON inactive_rule_log (rule_id);
+CREATE INDEX idx_inactive_rule_log_created_at ON inactive_rule_log (created_at DESC);
+
+-- 3. Crear una particion mensual por cada mes con datos historicos (UTC)
+DO $$
+DECLARE
+    v_table TEXT;
+    v_column TEXT;
+    v_month TIMESTAMP WITH TIME ZONE;
+    v_last TIMESTAMP WITH TIME ZONE;
+BEGIN
+    SET LOCAL TIME ZONE 'UTC';
+    FOR v_table, v_column IN VALUES ('rule_metrics', 'timestamp'), ('inactive_rule_log', 'created_at') LOOP
+        EXECUTE format('SELECT date_trunc(''month'', MIN(%I)), date_trunc(''month'', NOW()) FROM %I', v_column, v_table || '_old')
+            INTO v_month, v_last;
+        v_month := COALESCE(v_month, v_last);
+        WHILE v_month <= v_last LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                v_table || '_p' || to_char(v_month, 'YYYY_MM'), v_table, v_month, v_month + INTERVAL '1 month'
+            );
+            v_month := v_month + INTERVAL '1 month';
+        END LOOP;
+    END LOOP;
+END;
+$$;
+
+-- 4. Copiar los datos y ajustar las secuencias
+INSERT INTO rule_metrics (
+    id, timestamp, rule_id, evaluations, packets_matched, bytes_matched, states_created,
+    state_packets, state_bytes, input_output, evaluations_delta, packets_matched_delta,
+    bytes_matched_delta, states_created_delta, counter_reset
+)
+SELECT
+    id, timestamp, rule_id, evaluations, packets_matched, bytes_matched, states_created,
+    state_packets, state_bytes, input_output, evaluations_delta, packets_matched_delta,
+    bytes_matched_delta, states_created_delta, counter_reset
+FROM rule_metrics_old;
+
+INSERT INTO inactive_rule_log (log_id, rule_id, created_at)
+SELECT log_id, rule_id, created_at FROM inactive_rule_log_old;
+
+SELECT setval(pg_get_serial_sequence('rule_metrics', 'id'), COALESCE((SELECT MAX(id) FROM rule_metrics), 0) + 1, false);
+SELECT setval(pg_get_serial_sequence('inactive_rule_log', 'log_id'), COALESCE((SELECT MAX(log_id) FROM inactive_rule_log), 0) + 1, false);
+
+-- 5. Eliminar las tablas anteriores
+DROP TABLE rule_metrics_old;
+DROP TABLE inactive_rule_log_old;
+
+-- 6. Permisos (la API solo inserta; las particiones las crea el rol dueno con manage.py partitions)
+GRANT SELECT, INSERT ON rule_metrics TO api_user;
+GRANT SELECT, INSERT ON inactive_rule_log TO api_user;
+GRANT USAGE ON SEQUENCE rule_metrics_id_seq TO api_user;
+GRANT USAGE ON SEQUENCE inactive_rule_log_log_id_seq TO api_user;
+GRANT SELECT ON rule_metrics TO proccess_user;
+
+COMMIT;
@@ -1,3 +1,4 @@
+-- Version anterior: la vigente (desde los periodos de inactividad) esta en migrations/versions/0004_periodos_inactividad.sql
 CREATE OR REPLACE PROCEDURE analyze_monthly_inactive_rules(
     p_year INT,
     p_month INT
@@ -16,10 +17,11 @@ BEGIN
     
     RAISE NOTICE 'Analizando inactividad para el mes: %-% (del % al %).', p_year, p_month, v_month_start_date, v_month_end_date;
 
-    -- 2. Obtener el número total de ejecuciones de la API para este mes
-    SELECT execution_count
+    -- 2. Obtener el número total de ejecuciones de la API para este mes (sumando todos los firewalls)
+    -- La vista suma los meses compactados y la bitacora execution_log (ver ContadorEjecuciones.sql)
+    SELECT SUM(execution_count)
     INTO v_expected_executions
-    FROM monthly_execution_counts
+    FROM monthly_execution_totals
     WHERE month_start_date = v_month_start_date;
 
     -- Si no hay registro de ejecuciones para el mes, no hay reglas que hayan estado inactivas todo el mes
@@ -30,24 +32,30 @@ BEGIN
         RAISE NOTICE 'Total de ejecuciones de la API esperadas para el mes: %', v_expected_executions;
     END IF;
 
-    -- 3. Identificar reglas que estuvieron inactivas TODOS los días del mes (en TODAS las ejecuciones)
-    -- Solo si hubo ejecuciones de la API para ese mes
+    -- 3. Identificar reglas que estuvieron inactivas TODOS los días del mes (en TODAS las ejecuciones
+    -- de su firewall). Solo si hubo ejecuciones de la API para ese mes
     IF v_expected_executions > 0 THEN
-        INSERT INTO monthly_fully_inactive_rules (rule_id, month_start_date)
+        INSERT INTO monthly_fully_inactive_rules (source, rule_id, month_start_date)
         SELECT
+            irl.source,
             irl.rule_id,
             v_month_start_date
         FROM
             inactive_rule_log irl
+            JOIN monthly_execution_totals mec
+                ON mec.source = irl.source
+                AND mec.month_start_date = v_month_start_date
         WHERE
             irl.created_at::DATE >= v_month_start_date
             AND irl.created_at::DATE <= v_month_end_date
         GROUP BY
-            irl.rule_id
-        -- Conteo de registros de inactividad para la regla debe ser igual al total de ejecuciones de la API
+            irl.source,
+            irl.rule_id,
+            mec.execution_count
+        -- Conteo de registros de inactividad para la regla debe ser igual al total de ejecuciones de su firewall
         HAVING
-            COUNT(irl.log_id) = v_expected_executions
-        ON CONFLICT (rule_id, month_start_date) DO NOTHING;
+            COUNT(irl.log_id) = mec.execution_count
+        ON CONFLICT (source, rule_id, month_start_date) DO NOTHING;
 
         GET DIAGNOSTICS v_total_monthly_detections = ROW_COUNT;
         RAISE NOTICE 'Reglas totalmente inactivas insertadas/actualizadas: %', v_total_monthly_detections;
@@ -1,17 +1,20 @@
--- Tabla Maestra de Reglas
+-- Tabla Maestra de Reglas (el id de pf solo es unico dentro de cada firewall)
 CREATE TABLE rules (
-    rule_id BIGINT PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default', -- Firewall que reporta la regla
+    rule_id BIGINT NOT NULL,
     rule_label VARCHAR(255) NOT NULL,
     rule_description VARCHAR(500),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (source, rule_id)
 );
 
 -----------------------------------------------------------------------------------
 
--- Tabla de metricas historicas
+-- Tabla de metricas historicas (particionada por mes, ver Particionamiento.sql)
 CREATE TABLE rule_metrics (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
     rule_id BIGINT NOT NULL,
     evaluations BIGINT NOT NULL,
     packets_matched BIGINT NOT NULL,
@@ -20,32 +23,45 @@ CREATE TABLE rule_metrics (
     state_packets BIGINT NOT NULL,
     state_bytes BIGINT NOT NULL,
     input_output BIGINT,
+    -- Deltas contra la muestra anterior de la misma regla (ver Deltas.sql)
+    evaluations_delta BIGINT,
+    packets_matched_delta BIGINT,
+    bytes_matched_delta BIGINT,
+    states_created_delta BIGINT,
+    counter_reset BOOLEAN NOT NULL DEFAULT FALSE,
+    -- La llave de la particion forma parte de la llave primaria
+    PRIMARY KEY (id, timestamp),
     -- Clave foránea a la tabla 'rules'
-    CONSTRAINT fk_rule_metrics_rule_id FOREIGN KEY (rule_id) REFERENCES rules (rule_id) ON DELETE RESTRICT
-);
+    CONSTRAINT fk_rule_metrics_rule_id FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT
+) PARTITION BY RANGE (timestamp);
 
 -----------------------------------------------------------------------------------
 
--- Tabla para registrar reglas inactivas
+-- Tabla para registrar reglas inactivas (particionada por mes)
 CREATE TABLE inactive_rule_log (
-    log_id SERIAL PRIMARY KEY,
+    log_id BIGSERIAL,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
     rule_id BIGINT NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (log_id, created_at),
     -- Clave foránea a la tabla 'rules'
-    CONSTRAINT fk_inactive_rule_log_rule_id FOREIGN KEY (rule_id) REFERENCES rules (rule_id) ON DELETE RESTRICT
-);
+    CONSTRAINT fk_inactive_rule_log_rule_id FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT
+) PARTITION BY RANGE (created_at);
+
+-- Las particiones (p. ej. rule_metrics_p2025_07) las crea la API por adelantado
 
 -----------------------------------------------------------------------------------
 
 -- Tabla para registrar reglas inactivas de un mes (Reglas que estuvieron inactivas TODO el mes)
 CREATE TABLE monthly_fully_inactive_rules (
     monthly_log_id SERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
     rule_id BIGINT NOT NULL,
     month_start_date DATE NOT NULL, -- La fecha de inicio del mes analizado (ej. '2025-06-01')
     -- Clave foránea a la tabla 'rules'
-    CONSTRAINT fk_monthly_fully_inactive_rules_rule_id FOREIGN KEY (rule_id) REFERENCES rules (rule_id) ON DELETE RESTRICT,
+    CONSTRAINT fk_monthly_fully_inactive_rules_rule_id FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT,
     -- Restricción de unicidad para evitar duplicar la misma regla para el mismo mes
-    CONSTRAINT uq_monthly_fully_inactive UNIQUE (rule_id, month_start_date)
+    CONSTRAINT uq_monthly_fully_inactive UNIQUE (source, rule_id, month_start_date)
 );
 
 -----------------------------------------------------------------------------------
@@ -63,36 +79,35 @@ CREATE TABLE monthly_inactive_detection_counts (
 
 -----------------------------------------------------------------------------------
 
--- Tabla para registrar la cantidad total de ejecuciones de la API por mes
+-- Tabla para registrar la cantidad total de ejecuciones de la API por firewall y mes
+-- (meses compactados desde execution_log, ver ContadorEjecuciones.sql)
 CREATE TABLE monthly_execution_counts (
     count_id SERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
     month_start_date DATE NOT NULL, -- La fecha de inicio del mes analizado (ej. '2025-06-01')
     execution_count INT NOT NULL DEFAULT 0, -- Contador de cuántas veces se ha ejecutado la API en ese mes
     last_updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
 
-    -- Restricción de unicidad para asegurar un solo conteo por mes
-    CONSTRAINT uq_monthly_execution_count UNIQUE (month_start_date)
+    -- Restricción de unicidad para asegurar un solo conteo por firewall y mes
+    CONSTRAINT uq_monthly_execution_count UNIQUE (source, month_start_date)
 );
 
 -----------------------------------------------------------------------------------
 
--- Índices para buscar por rule_id o por fecha
-CREATE INDEX idx_rule_metrics_rule_id ON rule_metrics (rule_id);
+-- Índices para buscar por fecha
 CREATE INDEX idx_rule_metrics_timestamp ON rule_metrics (timestamp);
--- Este índice compuesto para rangos de fechas por reglas
-CREATE INDEX idx_rule_metrics_rule_id_timestamp ON rule_metrics (rule_id, timestamp DESC);
--- Índice en rule_label para buscar reglas por su nombre
-CREATE INDEX idx_rules_rule_label ON rules (rule_label);
+-- Este índice compuesto para rangos de fechas por firewall y regla
+CREATE INDEX idx_rule_metrics_source_rule_id_timestamp ON rule_metrics (source, rule_id, timestamp DESC);
+-- Índice en rule_label para buscar reglas de un firewall por su nombre
+CREATE INDEX idx_rules_source_rule_label ON rules (source, rule_label);
 -- Índices
 CREATE INDEX idx_monthly_inactive_detection_counts_month ON monthly_inactive_detection_counts (inactive_month);
 -- Índices
-CREATE INDEX idx_inactive_rule_log_rule_id ON inactive_rule_log (rule_id);
+CREATE INDEX idx_inactive_rule_log_source_rule_id ON inactive_rule_log (source, rule_id);
 CREATE INDEX idx_inactive_rule_log_created_at ON inactive_rule_log (created_at DESC);
 -- Índices
-CREATE INDEX idx_monthly_fully_inactive_rules_rule_id ON monthly_fully_inactive_rules (rule_id);
+CREATE INDEX idx_monthly_fully_inactive_rules_source_rule_id ON monthly_fully_inactive_rules (source, rule_id);
 CREATE INDEX idx_monthly_fully_inactive_rules_month_start_date ON monthly_fully_inactive_rules (month_start_date);
--- Índice para búsquedas eficientes por mes
-CREATE INDEX idx_monthly_execution_counts_month ON monthly_execution_counts (month_start_date);
 
 -----------------------------------------------------------------------------------
 
@@ -100,12 +115,11 @@ CREATE INDEX idx_monthly_execution_counts_month ON monthly_execution_counts (mon
 GRANT SELECT, INSERT, UPDATE ON rules TO api_user;
 GRANT SELECT, INSERT ON rule_metrics TO api_user;
 GRANT SELECT, INSERT ON inactive_rule_log TO api_user;
-GRANT SELECT, INSERT, UPDATE ON monthly_execution_counts TO api_user;
+GRANT SELECT ON monthly_execution_counts TO api_user;
 
 -- Permisos para usar los numeros secuenciales
 GRANT USAGE ON SEQUENCE rule_metrics_id_seq TO api_user;
 GRANT USAGE ON SEQUENCE inactive_rule_log_log_id_seq TO api_user;
-GRANT USAGE ON SEQUENCE monthly_execution_counts_count_id_seq TO api_user;
 
 -----------------------------------------------------------------------------------
 
@@ -3,18 +3,19 @@ CREATE MATERIALIZED VIEW rule_counts_materialized AS
 WITH inactive_counts AS (
     SELECT
         date_trunc('day', created_at)::date AS activity_date,
-        count(DISTINCT rule_id) AS inactive_rule_count
+        count(DISTINCT (source, rule_id)) AS inactive_rule_count
     FROM
         inactive_rule_log
     GROUP BY
         activity_date
 ),
 total_counts AS (
+    -- rule_metrics_daily ya tiene una fila por regla y dia (UTC), no se recorren las muestras crudas
     SELECT
-        date_trunc('day', "timestamp")::date AS activity_date,
-        count(DISTINCT rule_id) AS total_rules_count
+        (bucket_start AT TIME ZONE 'UTC')::date AS activity_date,
+        count(*) AS total_rules_count
     FROM
-        rule_metrics
+        rule_metrics_daily
     GROUP BY
         activity_date
 )
@@ -1,13 +1,30 @@
 CREATE OR REPLACE VIEW rule_counts AS
+WITH inactive_counts AS (
+    SELECT
+        DATE_TRUNC('day', irl.created_at)::date AS activity_date,
+        COUNT(DISTINCT (irl.source, irl.rule_id)) AS inactive_rule_count
+    FROM
+        public.inactive_rule_log irl
+    GROUP BY
+        activity_date
+),
+total_counts AS (
+    -- Una fila por regla y dia en el agregado diario (UTC)
+    SELECT
+        (rmd.bucket_start AT TIME ZONE 'UTC')::date AS activity_date,
+        COUNT(*) AS total_rules_count
+    FROM
+        public.rule_metrics_daily rmd
+    GROUP BY
+        activity_date
+)
 SELECT
-    DATE_TRUNC('day', irl.created_at)::date AS activity_date,
-    COUNT(DISTINCT irl.rule_id) AS inactive_rule_count,
-    COUNT(DISTINCT rm.rule_id) AS total_rules_count
+    ic.activity_date,
+    ic.inactive_rule_count,
+    COALESCE(tc.total_rules_count, 0) AS total_rules_count
 FROM
-    public.inactive_rule_log irl
+    inactive_counts ic
 LEFT JOIN
-    public.rule_metrics rm ON DATE_TRUNC('day', irl.created_at)::date = DATE_TRUNC('day', rm."timestamp")::date
-GROUP BY
-    activity_date
+    total_counts tc ON tc.activity_date = ic.activity_date
 ORDER BY
-    activity_date ASC;
\ No newline at end of file
+    ic.activity_date ASC;
\ No newline at end of file
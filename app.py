@@ -1,36 +1,54 @@
+import os
 from flask import Flask
 from logger.logger import Logger
 from schemas.schema import Schema
-from schemas.schemaDate import DateRangeSchema
+from schemas.schemaDate import InactiveRulesSchema, IdleRulesSchema, TopRulesSchema
 from routes.route import PFRoute  
 from services.service import Service
+from services.ingest import IngestQueue
 from models.model import BDModel
+from wire.wire import FastJSONProvider
 
 #ESTO se comenta
 #from flask_cors import CORS
 
 app = Flask(__name__)
+# jsonify y request.get_json con orjson (si esta instalado)
+app.json = FastJSONProvider(app)
 
 #ESTO se comenta DEBUG
 #CORS(app)
 
-logger = Logger()
+logger = Logger(__name__)
 
 # Schema
-schema_date = DateRangeSchema()
+schema_date = InactiveRulesSchema()
+schema_idle = IdleRulesSchema()
+schema_top = TopRulesSchema()
 
 # Model
 db_model = BDModel()
 db_model.connect_to_database()
+# Una sola consulta al iniciar: la version del esquema (MIGRATE_ON_START=1 migra aqui)
+db_model.check_schema()
 
 # Service
 #service = Service(db_conn)
 # Inicializa tu servicio de métricas de reglas, pasándole el db_model
+# Los caches se cargan con el primer lote (no retrasan el arranque)
 rule_metric_service = Service(db_model)
 
 # Routes
 #routes = FileGeneratorRoute(service, form_schemaVPNMayo, form_schemaTel, form_schemaRFC, form_schemaInter, form_schemaFolio, form_schemaCampo)
-routes = PFRoute(Schema, schema_date, rule_metric_service)
+# STRICT_VALIDATION=1 vuelve a validar cada lote completo con Marshmallow
+strict_validation = os.environ.get("STRICT_VALIDATION", "0") == "1"
+# INGEST_ASYNC=1 encola los lotes y los guarda en grupo desde un hilo escritor
+ingest_queue = None
+if os.environ.get("INGEST_ASYNC", "0") == "1":
+    ingest_queue = IngestQueue(rule_metric_service)
+# INGEST_RESPONSE=resumen responde /api/v1/data solo con conteos (sin repetir el lote)
+summary_response = os.environ.get("INGEST_RESPONSE", "completa") == "resumen"
+routes = PFRoute(Schema, schema_date, rule_metric_service, strict_validation=strict_validation, ingest_queue=ingest_queue, schema_idle=schema_idle, summary_response=summary_response, schema_top=schema_top)
 
 #Blueprint
 app.register_blueprint(routes)
@@ -41,6 +59,8 @@ if __name__ == "__main__":
         #app.run(host="0.0.0.0", port=5001, debug=True)
         logger.info("Application started")
     finally:
+        if ingest_queue is not None:
+            ingest_queue.stop()
         db_model.close_connection()
         logger.info("Application closed")
         logger.info("Postgres connection closed")
\ No newline at end of file
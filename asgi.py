@@ -0,0 +1,53 @@
+# asgi.py
+# Variante ASGI de app.py (Quart + asyncpg). Uso: uvicorn asgi:app --host 0.0.0.0 --port 8000
+# Mismas rutas, parametros y variables de entorno que app.py, sin la cola de ingesta (INGEST_ASYNC)
+
+import os
+from quart import Quart
+from logger.logger import Logger
+from schemas.schema import Schema
+from schemas.schemaDate import InactiveRulesSchema, IdleRulesSchema, TopRulesSchema
+from routes.async_route import AsyncPFRoute
+from services.async_service import AsyncService
+from models.async_model import AsyncBDModel
+from wire.wire import FastJSONProvider
+
+app = Quart(__name__)
+app.json = FastJSONProvider(app)
+# Igual que con gunicorn: el limite del cuerpo es MAX_DECODED_BYTES y el volcado
+# de un firewall grande puede tardar mas de los 60 s que Quart permite por defecto
+app.config["MAX_CONTENT_LENGTH"] = None
+app.config["RESPONSE_TIMEOUT"] = None
+
+logger = Logger(__name__)
+
+# Schema
+schema_date = InactiveRulesSchema()
+schema_idle = IdleRulesSchema()
+schema_top = TopRulesSchema()
+
+# Model: migraciones y particiones con psycopg2, la API con asyncpg
+db_model = AsyncBDModel()
+db_model.connect_to_database()
+db_model.check_schema()
+
+# Service
+rule_metric_service = AsyncService(db_model)
+
+# Routes
+strict_validation = os.environ.get("STRICT_VALIDATION", "0") == "1"
+summary_response = os.environ.get("INGEST_RESPONSE", "completa") == "resumen"
+if os.environ.get("INGEST_ASYNC", "0") == "1":
+    logger.warning("INGEST_ASYNC no aplica a la variante ASGI: cada lote se guarda antes de responder")
+routes = AsyncPFRoute(Schema, schema_date, rule_metric_service, strict_validation=strict_validation, schema_idle=schema_idle, summary_response=summary_response, schema_top=schema_top)
+
+#Blueprint
+app.register_blueprint(routes)
+
+@app.after_serving
+async def close_connection():
+    await db_model.close_connection()
+    logger.info("Postgres connection closed")
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", debug=False)
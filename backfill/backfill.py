@@ -0,0 +1,358 @@
+# backfill.py
+
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from logger.logger import Logger
+from models.model import BDModel, DEFAULT_SOURCE
+from routes.route import PFRequestMixin, FIREWALL_PATTERN
+from schemas.record import RuleMetricRecord
+from services.backfill import BackfillService
+
+# Fecha y hora de la ejecucion en el nombre del archivo: api_response_20250714_163759.txt,
+# pfctl_2025-07-14T16:37.txt, ... (los segundos son opcionales)
+FILE_TIMESTAMP = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})[_T -]?(\d{2}):?(\d{2})(?::?(\d{2}))?")
+
+# Respuesta de la API cuando el lote se guardo: esas capturas ya estan en la base
+SAVED_MESSAGE = "Registro exitoso"
+
+class BackfillFile(NamedTuple):
+    """Archivo a cargar: volcado de pfctl o captura de la API de una ejecucion."""
+    path: Path
+    source: str
+    timestamp: datetime
+
+class BackfillParser(PFRequestMixin):
+    """
+    Interpreta un archivo con el mismo parser que la API.
+
+    Volcados de `pfctl -s all` (o `-vvsr`): solo las lineas USER_RULE, con las
+    reglas repetidas sumadas. Capturas de la respuesta de la API ({"data": [...],
+    "message": ...}, como las que guarda script_final.sh): los registros de "data";
+    las que dicen "Registro exitoso" ya se guardaron y se omiten salvo `include_saved`.
+    Los archivos .gz se descomprimen al leerlos.
+    """
+
+    def __init__(self, include_saved: bool = False):
+        self.logger = Logger(__name__)
+        self.include_saved = include_saved
+
+    def parse_file(self, path: Path) -> tuple[str, list[RuleMetricRecord]]:
+        """Regresa (tipo, registros); tipo es "dump", "capture" o "saved"."""
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8", errors="replace") as file:
+            content = file.read()
+        if content.lstrip().startswith("{"):
+            payload = json.loads(content)
+            if payload.get("message") == SAVED_MESSAGE and not self.include_saved:
+                return "saved", []
+            records = (RuleMetricRecord.from_dict(item) for item in payload.get("data") or [])
+            return "capture", self.merge_duplicate_rules(records)
+        return "dump", self.merge_duplicate_rules(self.iter_parsed_rules(content.splitlines()))
+
+# Un parser por proceso del pool
+_worker_parser = None
+
+def _init_worker(include_saved: bool) -> None:
+    global _worker_parser
+    _worker_parser = BackfillParser(include_saved)
+
+def _parse_in_worker(path: Path) -> tuple:
+    """Regresa (tipo, registros, error) sin lanzar excepciones al proceso principal."""
+    try:
+        kind, records = _worker_parser.parse_file(path)
+        return kind, records, None
+    except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError) as e:
+        return "error", [], f"{type(e).__name__}: {e}"
+
+def file_timestamp(name: str, zone) -> datetime:
+    """Fecha del nombre del archivo en la zona `zone`, convertida a UTC (None si no tiene)."""
+    match = FILE_TIMESTAMP.search(name)
+    if not match:
+        return None
+    year, month, day, hour, minute, second = (int(value or 0) for value in match.groups())
+    try:
+        return datetime(year, month, day, hour, minute, second, tzinfo=zone).astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+def discover(directory: Path, source: str = DEFAULT_SOURCE, source_from_dir: bool = False,
+             zone=timezone.utc, use_mtime: bool = False) -> tuple[list[BackfillFile], list[Path]]:
+    """
+    Archivos de `directory` (recursivo) con su firewall y la hora original de la ejecucion.
+
+    La hora sale del nombre del archivo; con `use_mtime` los archivos sin fecha en el
+    nombre usan su fecha de modificacion. Con `source_from_dir` el firewall es la
+    primera carpeta dentro de `directory` (fw1/..., fw2/...). Regresa (archivos, sin fecha).
+    """
+    files, undated = [], []
+    for path in sorted(directory.rglob("*")):
+        relative = path.relative_to(directory)
+        if not path.is_file() or any(part.startswith(".") for part in relative.parts):
+            continue
+        file_source = source
+        if source_from_dir and len(relative.parts) > 1:
+            file_source = relative.parts[0]
+        if not FIREWALL_PATTERN.match(file_source):
+            raise ValueError(f"Firewall invalido para {path}: {file_source!r}")
+        moment = file_timestamp(path.name, zone)
+        if moment is None and use_mtime:
+            moment = datetime.fromtimestamp(int(path.stat().st_mtime), tz=timezone.utc)
+        if moment is None:
+            undated.append(path)
+        else:
+            files.append(BackfillFile(path, file_source, moment))
+    files.sort(key=lambda item: (item.source, item.timestamp, str(item.path)))
+    return files, undated
+
+class BackfillSegment(NamedTuple):
+    """Ejecuciones seguidas de un firewall sin datos guardados entre ellas."""
+    source: str
+    tail: bool
+    files: list
+
+class BackfillPlan:
+    """Tramos a cargar y lo que se omite (ejecuciones ya guardadas, fuera de la retencion, repetidas)."""
+
+    def __init__(self):
+        self.segments = []
+        self.existing = 0
+        self.expired = 0
+        self.repeated = 0
+
+    @property
+    def files(self) -> int:
+        return sum(len(segment.files) for segment in self.segments)
+
+def build_plan(service, files: list[BackfillFile], cutoff: datetime = None) -> BackfillPlan:
+    """
+    Divide los archivos de cada firewall en tramos (ver BackfillService).
+
+    Se omiten los archivos cuya ejecucion ya esta en la base (asi una carga
+    interrumpida continua donde se quedo), los del mismo segundo que otro archivo y
+    los anteriores a la retencion de particiones (PARTITION_RETENTION), que se
+    borrarian en el siguiente mantenimiento.
+    """
+    plan = BackfillPlan()
+    by_source = {}
+    for item in files:
+        by_source.setdefault(item.source, []).append(item)
+
+    for source, source_files in by_source.items():
+        pending = []
+        for item in source_files:
+            if cutoff is not None and item.timestamp < cutoff:
+                plan.expired += 1
+            elif pending and pending[-1].timestamp == item.timestamp:
+                plan.repeated += 1
+            else:
+                pending.append(item)
+        if not pending:
+            continue
+
+        existing = service.existing_runs(source, pending[0].timestamp, pending[-1].timestamp)
+        plan.existing += sum(1 for item in pending if item.timestamp in existing)
+        pending = [item for item in pending if item.timestamp not in existing]
+        existing = sorted(existing)
+
+        segments = []
+        for item in pending:
+            # Empieza un tramo nuevo si hay una ejecucion guardada entre el archivo anterior y este
+            if segments and bisect_left(existing, item.timestamp) == bisect_left(existing, segments[-1][-1].timestamp):
+                segments[-1].append(item)
+            else:
+                segments.append([item])
+        for index, segment_files in enumerate(segments):
+            tail = index == len(segments) - 1 and service.next_run_after(source, segment_files[-1].timestamp) is None
+            plan.segments.append(BackfillSegment(source, tail, segment_files))
+    return plan
+
+class BackfillProgress:
+    """Avance de la carga en la salida estandar, como maximo cada `interval` segundos."""
+
+    def __init__(self, total: int, interval: float = 5.0, out=None):
+        self.total = total
+        self.interval = interval
+        self.out = out or sys.stdout
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.done = 0
+        self.reported = 0
+        self.loaded = 0
+        self.rules = 0
+        self.skipped = 0
+        self.errors = []
+
+    def advance(self, loaded: int = 0, rules: int = 0, skipped: int = 0, error: str = None) -> None:
+        self.done += loaded + skipped + (1 if error else 0)
+        self.loaded += loaded
+        self.rules += rules
+        self.skipped += skipped
+        if error:
+            self.errors.append(error)
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval or self.done == self.reported:
+            return
+        self.last_report = now
+        self.reported = self.done
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        remaining = (self.total - self.done) / rate if rate else 0
+        percent = 100.0 * self.done / self.total if self.total else 100.0
+        print(
+            f"{self.done}/{self.total} archivos ({percent:.1f}%), {self.rules} reglas, "
+            f"{rate:.1f} archivos/s, {self.rules / elapsed:.0f} reglas/s, "
+            f"transcurrido {_duration(elapsed)}, restante {_duration(remaining)}",
+            file=self.out, flush=True
+        )
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+class BackfillRunner:
+    """
+    Carga un plan: interpreta los archivos en un pool de procesos y los guarda en orden.
+
+    El parser usa CPU y la escritura es por firewall en orden cronologico, asi que
+    `workers` procesos interpretan por adelantado (a lo mas `workers` * 4 archivos
+    en memoria) mientras el proceso principal escribe grupos de `group` ejecuciones
+    por transaccion con BackfillService.add_metric_batches. Sin `progress` se
+    reporta el avance en la salida estandar (BackfillProgress del plan).
+    """
+
+    def __init__(self, service, workers: int = None, group: int = 200, include_saved: bool = False,
+                 progress: BackfillProgress = None):
+        self.logger = Logger(__name__)
+        self.service = service
+        self.workers = workers or os.cpu_count() or 1
+        self.group = group
+        self.include_saved = include_saved
+        self.progress = progress
+
+    def run(self, plan: BackfillPlan) -> bool:
+        """Regresa False si un grupo no se pudo guardar (lo anterior queda guardado)."""
+        if self.progress is None:
+            self.progress = BackfillProgress(plan.files)
+        tasks = [(index, item) for index, segment in enumerate(plan.segments) for item in segment.files]
+        current = None
+        batches = []
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.include_saved,)) as pool:
+            for (index, item), (kind, records, error) in self._parsed(pool, tasks):
+                if index != current:
+                    if not self._flush(batches):
+                        return False
+                    current = index
+                    segment = plan.segments[index]
+                    self.service.begin_segment(segment.tail)
+                if error:
+                    self.progress.advance(error=f"{item.path}: {error}")
+                elif not records:
+                    # Capturas ya guardadas o archivos sin reglas de usuario
+                    self.progress.advance(skipped=1)
+                else:
+                    batches.append((item.source, item.timestamp, records))
+                    if len(batches) >= self.group and not self._flush(batches):
+                        return False
+                self.progress.report()
+            if not self._flush(batches):
+                return False
+        self.progress.report(force=True)
+        return True
+
+    def _parsed(self, pool, tasks: list):
+        """Internal generator: parsed files in plan order, keeping a bounded window of futures."""
+        window = deque()
+        pending = iter(tasks)
+        for task in pending:
+            window.append((task, pool.submit(_parse_in_worker, task[1].path)))
+            if len(window) >= self.workers * 4:
+                break
+        while window:
+            task, future = window.popleft()
+            for next_task in pending:
+                window.append((next_task, pool.submit(_parse_in_worker, next_task[1].path)))
+                break
+            yield task, future.result()
+
+    def _flush(self, batches: list) -> bool:
+        """Internal method to save the current group in one transaction."""
+        if not batches:
+            return True
+        if not self.service.add_metric_batches(batches):
+            self.logger.critical("No se pudo guardar el grupo que inicia en %s (%s).", batches[0][1], batches[0][0])
+            return False
+        self.progress.advance(loaded=len(batches), rules=sum(len(records) for _, _, records in batches))
+        batches.clear()
+        return True
+
+def backfill(args) -> int:
+    """python manage.py backfill: ver main() en manage.py."""
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"No existe el directorio {directory}", file=sys.stderr)
+        return 2
+    try:
+        zone = ZoneInfo(args.timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"Zona horaria desconocida: {args.timezone}", file=sys.stderr)
+        return 2
+    try:
+        files, undated = discover(directory, args.firewall, args.firewall_from_dir, zone, args.mtime)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if undated:
+        print(f"{len(undated)} archivos sin fecha en el nombre se omiten (usa --mtime para tomar su fecha de modificacion), p. ej. {undated[0]}")
+
+    db_model = BDModel()
+    db_model.connect_to_database()
+    try:
+        service = BackfillService(db_model)
+        cutoff = db_model.partitions.retention_cutoff() if db_model.partitions else None
+        plan = build_plan(service, files, cutoff)
+        print(
+            f"{len(files)} archivos: {plan.files} por cargar en {len(plan.segments)} tramos, "
+            f"{plan.existing} ya guardados, {plan.repeated} repetidos, {plan.expired} anteriores a la retencion"
+        )
+        for segment in plan.segments:
+            print(
+                f"  {segment.source}: {len(segment.files)} ejecuciones de {segment.files[0].timestamp:%Y-%m-%d %H:%M:%S} "
+                f"a {segment.files[-1].timestamp:%Y-%m-%d %H:%M:%S} UTC{'' if segment.tail else ' (hueco)'}"
+            )
+        if args.dry_run or not plan.segments:
+            return 0
+
+        # El backfill corre con el rol dueno de las tablas: crea las particiones de todo el rango
+        db_model.partitions.ensure_partitions(
+            min(segment.files[0].timestamp for segment in plan.segments),
+            max(segment.files[-1].timestamp for segment in plan.segments),
+        )
+        progress = BackfillProgress(plan.files, args.progress_seconds)
+        runner = BackfillRunner(service, args.workers, args.group, args.include_saved, progress)
+        saved = runner.run(plan)
+        print(
+            f"Cargados {progress.loaded} archivos ({progress.rules} reglas), omitidos {progress.skipped}, "
+            f"con error {len(progress.errors)}; {service.repaired} muestras posteriores corregidas."
+        )
+        for error in progress.errors[:20]:
+            print(f"  {error}")
+        if not saved:
+            print("La carga se detuvo por un error de la base de datos; al repetir el comando continua donde se quedo.", file=sys.stderr)
+            return 1
+        return 0
+    finally:
+        db_model.close_connection()
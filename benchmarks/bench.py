@@ -0,0 +1,511 @@
+"""
+Benchmarks del camino de ingesta y de la consulta de reglas inactivas.
+
+    python -m benchmarks.bench run                       Todos los benchmarks con los tamaños por defecto
+    python -m benchmarks.bench run --suite parse,merge   Solo los que no usan base de datos
+    python -m benchmarks.bench run --sizes 10,1000,100000 --duplicates 0,0.25 --rows 100000,10000000
+    python -m benchmarks.bench compare viejo.json nuevo.json
+
+Los resultados se guardan en JSON (benchmarks/results/<commit>_<fecha>.json por
+defecto) para comparar dos commits con `compare`.
+
+Los benchmarks con base de datos (persist, suppress, backfill, inactive, top) crean una base desechable
+(BENCH_DB, por defecto pf_bench) con las mismas variables POSTGRES_* que la API;
+el usuario necesita permiso CREATEDB. La base se elimina al terminar salvo con --keep-db.
+"""
+
+import os
+import tempfile
+
+# Antes de importar la API: sin logs por registro y sin retencion de particiones
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "pf_bench", "bench.log"))
+os.environ["PARTITION_RETENTION"] = "0"
+
+import argparse
+import gzip
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from sqlalchemy import create_engine, text
+from benchmarks.payload import PayloadGenerator
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+SUITES = ("parse", "pipeline", "merge", "validate", "wire", "persist", "suppress", "backfill", "inactive", "top")
+DEFAULT_SIZES = "10,100,1000,10000,100000"
+DEFAULT_DUPLICATES = "0,0.25"
+DEFAULT_ROWS = "100000,1000000"
+
+# Reglas sin cambios entre ejecuciones en `suppress`
+DORMANT_RATIO = 0.9
+
+# Ejecuciones (archivos) maximas por medicion de `backfill`
+BACKFILL_FILES = 200
+
+# Reglas distintas en las tablas precargadas de `inactive` (las muestras son filas / reglas, una por hora)
+INACTIVE_RULES = 5000
+FIRST_RULE_ID = PayloadGenerator.FIRST_ID
+
+def measure(function, repeat: int, setup=None) -> dict:
+    """Ejecuta `function` (con el resultado de `setup`, que no se mide) y resume los tiempos."""
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "max_s": max(times),
+    }
+
+def repeat_for(size: int, base: int) -> int:
+    """Menos repeticiones para los tamaños grandes."""
+    return max(3, min(base, 10 ** 6 // max(size, 1)))
+
+class BenchmarkSuite:
+
+    def __init__(self, args):
+        self.args = args
+        self.generator = PayloadGenerator(args.seed)
+        self.results = []
+        self.route = None
+        self.db_model = None
+        self.service = None
+
+    def record(self, benchmark: str, params: dict, stats: dict, items: int = None) -> None:
+        if items:
+            stats["per_item_us"] = stats["median_s"] / items * 10 ** 6
+        self.results.append({"benchmark": benchmark, "params": params, "stats": stats})
+        per_item = f" ({stats['per_item_us']:.2f} us/item)" if "per_item_us" in stats else ""
+        print(f"{benchmark:<10} {json.dumps(params, sort_keys=True):<60} mediana {stats['median_s'] * 1000:10.3f} ms{per_item}", flush=True)
+
+    # --- Sin base de datos ---------------------------------------------------
+
+    def get_route(self):
+        if self.route is None:
+            from routes.route import PFRoute
+            from schemas.schema import Schema
+            from schemas.schemaDate import InactiveRulesSchema
+            self.route = PFRoute(Schema, InactiveRulesSchema(), service=None)
+        return self.route
+
+    def parse_lines(self, lines):
+        route = self.get_route()
+        return [record for record in map(route.parse_pfctl_line, lines) if record]
+
+    def bench_parse(self, size: int, duplicates: float) -> None:
+        lines = self.generator.rule_lines(size, duplicates)
+        route = self.get_route()
+        stats = measure(lambda _: [route.parse_pfctl_line(line) for line in lines], repeat_for(size, self.args.repeat))
+        self.record("parse", {"rules": size, "duplicates": duplicates}, stats, len(lines))
+
+    def bench_pipeline(self, size: int, duplicates: float) -> None:
+        # Lo que hace /api/v1/data con el volcado completo: descartar ruido, interpretar y combinar
+        lines = self.generator.dump(size, duplicates).splitlines()
+        route = self.get_route()
+        stats = measure(
+            lambda _: route.merge_duplicate_rules(route.iter_parsed_rules(lines)),
+            repeat_for(size, self.args.repeat)
+        )
+        self.record("pipeline", {"rules": size, "duplicates": duplicates, "lines": len(lines)}, stats, len(lines))
+
+    def bench_merge(self, size: int, duplicates: float) -> None:
+        # merge_duplicate_rules modifica los registros: se interpretan de nuevo en cada repeticion (sin medir)
+        lines = self.generator.rule_lines(size, duplicates)
+        route = self.get_route()
+        stats = measure(route.merge_duplicate_rules, repeat_for(size, self.args.repeat), setup=lambda: self.parse_lines(lines))
+        self.record("merge", {"rules": size, "duplicates": duplicates}, stats, len(lines))
+
+    def bench_validate(self, size: int, duplicates: float) -> None:
+        # Modo estricto: Schema(many=True).load sobre el lote ya combinado
+        route = self.get_route()
+        records = route.merge_duplicate_rules(self.parse_lines(self.generator.rule_lines(size, duplicates)))
+        stats = measure(lambda _: route.validate_records(records), repeat_for(size, self.args.repeat // 2 or 1))
+        self.record("validate", {"rules": size, "duplicates": duplicates}, stats, len(records))
+
+    def bench_wire(self, size: int, duplicates: float) -> None:
+        # Cuerpo gzip que envia el script y respuesta de /api/v1/data: lote completo (json / orjson) o resumen
+        from flask import Flask
+        from flask.json.provider import DefaultJSONProvider
+        from wire.wire import FastJSONProvider, iter_decoded_lines
+        repeat = repeat_for(size, self.args.repeat)
+        dump = self.generator.dump(size, duplicates).encode()
+        body = gzip.compress(dump)
+        stats = measure(lambda _: sum(1 for _ in iter_decoded_lines(io.BytesIO(body), "gzip")), repeat)
+        self.record("wire", {"rules": size, "duplicates": duplicates, "step": "gunzip", "bytes": len(body), "raw_bytes": len(dump)}, stats, size)
+
+        route = self.get_route()
+        records = route.merge_duplicate_rules(self.parse_lines(self.generator.rule_lines(size, duplicates)))
+        app = Flask(__name__)
+        for step, provider in (("response_stdlib", DefaultJSONProvider(app)), ("response_fast", FastJSONProvider(app))):
+            full = lambda _: provider.dumps({"message": "Registro exitoso", "data": [record.to_dict() for record in records]})
+            stats = measure(full, repeat)
+            self.record("wire", {"rules": size, "duplicates": duplicates, "step": step, "bytes": len(full(None))}, stats, len(records))
+        summary = lambda _: provider.dumps({"message": "Registro exitoso", "firewall": "bench", "rules": len(records)})
+        stats = measure(summary, repeat)
+        self.record("wire", {"rules": size, "duplicates": duplicates, "step": "response_summary", "bytes": len(summary(None))}, stats, len(records))
+
+    # --- Con base de datos -----------------------------------------------------
+
+    def admin_engine(self):
+        user = os.environ.get("POSTGRES_USER", "api_user")
+        password = os.environ.get("POSTGRES_PASSWORD", "pass")
+        host = os.environ.get("POSTGRES_HOST", "localhost")
+        port = os.environ.get("POSTGRES_PORT", "5002")
+        admin_db = os.environ.get("BENCH_ADMIN_DB", "postgres")
+        return create_engine(f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{admin_db}", isolation_level="AUTOCOMMIT")
+
+    def open_database(self) -> None:
+        """Crea la base desechable, aplica las migraciones y prepara el servicio."""
+        if self.service is not None:
+            return
+        from models.model import BDModel
+        from services.service import Service
+        engine = self.admin_engine()
+        with engine.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{self.args.database}"'))
+            connection.execute(text(f'CREATE DATABASE "{self.args.database}"'))
+        engine.dispose()
+        self.db_model = BDModel()
+        self.db_model.db_name = self.args.database
+        self.db_model.connect_to_database()
+        self.db_model.migrate()
+        self.service = Service(self.db_model)
+
+    def close_database(self) -> None:
+        if self.db_model is None:
+            return
+        self.db_model.close_connection()
+        if not self.args.keep_db:
+            engine = self.admin_engine()
+            with engine.connect() as connection:
+                connection.execute(text(f'DROP DATABASE IF EXISTS "{self.args.database}"'))
+            engine.dispose()
+
+    def bench_persist(self, size: int, duplicates: float) -> None:
+        """Service.add_metrics: primer lote (todas las reglas son nuevas) y lotes siguientes (solo deltas)."""
+        self.open_database()
+        source = f"bench-{size}-{duplicates}"
+        route = self.get_route()
+        steps = iter(range(1, 10 ** 6))
+
+        def batch():
+            lines = self.generator.rule_lines(size, duplicates, step=next(steps))
+            return route.merge_duplicate_rules(self.parse_lines(lines))
+
+        def add(records):
+            if not self.service.add_metrics(records, source):
+                raise RuntimeError("add_metrics regreso False")
+
+        params = {"rules": size, "duplicates": duplicates}
+        self.record("persist", dict(params, batch="first"), measure(add, 1, setup=batch), size)
+        self.record("persist", dict(params, batch="steady"), measure(add, repeat_for(size * 10, self.args.repeat), setup=batch), size)
+
+    def bench_suppress(self, size: int, duplicates: float) -> None:
+        """
+        Lotes siguientes con DORMANT_RATIO de reglas sin cambios: todas las muestras
+        contra el almacenamiento por cambios (SUPPRESS_UNCHANGED). Reporta filas por lote.
+        """
+        self.open_database()
+        route = self.get_route()
+        suppressor = self.service.suppressor
+        for mode in ("full", "changes"):
+            suppressor.enabled = mode == "changes"
+            source = f"suppress-{mode}-{size}-{duplicates}"
+            steps = iter(range(1, 10 ** 6))
+
+            def batch():
+                lines = self.generator.rule_lines(size, duplicates, step=next(steps), dormant_ratio=DORMANT_RATIO)
+                return route.merge_duplicate_rules(self.parse_lines(lines))
+
+            def add(records):
+                if not self.service.add_metrics(records, source):
+                    raise RuntimeError("add_metrics regreso False")
+
+            def count_rows():
+                with self.db_model.engine.connect() as connection:
+                    return connection.execute(text("SELECT COUNT(*) FROM rule_metrics WHERE source = :source"), {"source": source}).scalar()
+
+            # El primer lote (todas las reglas son nuevas) no se mide
+            add(batch())
+            before = count_rows()
+            repeat = repeat_for(size * 10, self.args.repeat)
+            stats = measure(add, repeat, setup=batch)
+            stats["rows_per_batch"] = (count_rows() - before) / repeat
+            self.record("suppress", {"rules": size, "duplicates": duplicates, "dormant": DORMANT_RATIO, "mode": mode}, stats, size)
+        suppressor.enabled = False
+
+    def bench_backfill(self, size: int, duplicates: float) -> None:
+        """
+        Carga de volcados archivados: uno por transaccion por el camino de la API
+        (parser + Service.add_metric_batches) contra manage.py backfill (pool de
+        procesos y grupos por transaccion). Reporta el tiempo por archivo.
+        """
+        from backfill.backfill import BackfillProgress, BackfillRunner, build_plan, discover
+        from services.backfill import BackfillService
+        self.open_database()
+        route = self.get_route()
+        files = max(10, min(BACKFILL_FILES, 2 * 10 ** 6 // size))
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        source = f"backfill-{size}-{duplicates}"
+        # Como manage.py backfill: el camino de la API solo verifica que existan las particiones
+        self.db_model.partitions.ensure_partitions(start, start + timedelta(minutes=5 * files))
+        with tempfile.TemporaryDirectory() as directory:
+            for step in range(files):
+                moment = start + timedelta(minutes=5 * step)
+                Path(directory, f"pfctl_{moment:%Y%m%d_%H%M%S}.txt").write_text(self.generator.dump(size, duplicates, step=step + 1))
+
+            def api(_):
+                for step, path in enumerate(sorted(Path(directory).iterdir())):
+                    records = route.merge_duplicate_rules(route.iter_parsed_rules(path.read_text().splitlines()))
+                    if not self.service.add_metric_batches([(f"{source}-api", start + timedelta(minutes=5 * step), records)]):
+                        raise RuntimeError("add_metric_batches regreso False")
+
+            def backfill(_):
+                service = BackfillService(self.db_model)
+                plan = build_plan(service, discover(Path(directory), f"{source}-cli")[0])
+                progress = BackfillProgress(plan.files, interval=float("inf"), out=io.StringIO())
+                if not BackfillRunner(service, progress=progress).run(plan):
+                    raise RuntimeError("BackfillRunner.run regreso False")
+
+            for mode, function in (("api", api), ("backfill", backfill)):
+                self.record("backfill", {"rules": size, "duplicates": duplicates, "files": files, "mode": mode}, measure(function, 1), files)
+
+    def prefill(self, rows: int) -> tuple[datetime, datetime]:
+        """Llena rule_metrics (una muestra por hora) y los agregados con `rows` filas sinteticas."""
+        from services.rollup import ROLLUP_TABLES, ROLLUP_METRICS
+        rules = min(INACTIVE_RULES, rows)
+        samples = rows // rules
+        end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        start = end - timedelta(hours=samples - 1)
+        source = "bench"
+
+        with self.db_model.engine.begin() as connection:
+            connection.execute(text("TRUNCATE rules, rule_metrics, inactive_rule_log, execution_log, rule_metrics_hourly, rule_metrics_daily CASCADE"))
+        moment = start
+        while moment <= end + timedelta(days=31):
+            self.db_model.maintain_partitions(moment)
+            moment += timedelta(days=28)
+
+        # inactive_pct% de las reglas no tienen trafico (rate = 0)
+        insert_metrics = text("""
+            INSERT INTO rule_metrics (timestamp, source, rule_id, evaluations, packets_matched, bytes_matched,
+                states_created, state_packets, state_bytes, input_output,
+                evaluations_delta, packets_matched_delta, bytes_matched_delta, states_created_delta)
+            SELECT CAST(:start AS TIMESTAMPTZ) + s * INTERVAL '1 hour', :source, :first_id + r,
+                s * 10, s * rate, s * rate * 100, s * rate, 0, 0, 0,
+                10, rate, rate * 100, rate
+            FROM generate_series(CAST(:from_sample AS INT), CAST(:to_sample AS INT)) AS s
+            CROSS JOIN (
+                SELECT r, CASE WHEN r % 100 < :inactive_pct THEN 0 ELSE 1 + r % 7 END AS rate
+                FROM generate_series(0, CAST(:rules AS INT) - 1) AS r
+            ) AS rule_rates
+        """)
+        chunk = max(1, 10 ** 6 // rules)
+        with self.db_model.engine.begin() as connection:
+            connection.execute(text("""
+                INSERT INTO rules (source, rule_id, rule_label)
+                SELECT :source, :first_id + r, 'BENCH_' || r FROM generate_series(0, CAST(:rules AS INT) - 1) AS r
+            """), {"source": source, "first_id": FIRST_RULE_ID, "rules": rules})
+        for from_sample in range(0, samples, chunk):
+            with self.db_model.engine.begin() as connection:
+                connection.execute(insert_metrics, {
+                    "start": start, "source": source, "first_id": FIRST_RULE_ID, "rules": rules,
+                    "from_sample": from_sample, "to_sample": min(from_sample + chunk, samples) - 1,
+                    "inactive_pct": self.args.inactive_pct
+                })
+
+        for table, precision in ROLLUP_TABLES.items():
+            columns = ["source", "rule_id", "bucket_start", "sample_count", "first_sample_at", "last_sample_at"]
+            values = ["source", "rule_id", f"date_trunc('{precision}', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'",
+                      "COUNT(*)", "MIN(timestamp)", "MAX(timestamp)"]
+            for metric in ROLLUP_METRICS:
+                delta = f"COALESCE({metric}_delta, 0)"
+                columns += [f"{metric}_first", f"{metric}_last", f"{metric}_delta", f"{metric}_delta_min", f"{metric}_delta_max"]
+                values += [f"MIN({metric})", f"MAX({metric})", f"SUM({delta})", f"MIN({delta})", f"MAX({delta})"]
+            with self.db_model.engine.begin() as connection:
+                connection.execute(text(
+                    f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(values)} "
+                    f"FROM rule_metrics GROUP BY 1, 2, 3"
+                ))
+        with self.db_model.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM ANALYZE"))
+        return start, end
+
+    def bench_inactive(self, rows: int) -> None:
+        """get_inactive_rules sobre tablas precargadas: rango completo, bordes parciales, ultimo dia y una pagina."""
+        self.open_database()
+        started = time.perf_counter()
+        start, end = self.prefill(rows)
+        print(f"inactive   {rows} filas precargadas en {time.perf_counter() - started:.1f} s", flush=True)
+        queries = {
+            "full_range": (start, end, {}),
+            "partial_edges": (start + timedelta(minutes=90), end - timedelta(minutes=30), {}),
+            "last_day": (end - timedelta(hours=24, minutes=30), end, {}),
+            "page_500": (start, end, {"limit": 500}),
+            "one_firewall": (start, end, {"source": "bench"}),
+        }
+        for name, (query_start, query_end, options) in queries.items():
+            found = []
+
+            def query(_):
+                found[:] = self.service.get_inactive_rules(query_start, query_end, **options)
+
+            stats = measure(query, self.args.repeat // 2 or 1)
+            # Sirve para confirmar que dos corridas regresan lo mismo
+            stats["rules_found"] = len(found)
+            self.record("inactive", {"rows": rows, "query": name}, stats)
+
+    def bench_top(self, rows: int) -> None:
+        """
+        Top 10 reglas por bytes sobre tablas precargadas: GROUP BY ad hoc sobre las
+        muestras crudas contra get_top_rules (agregados + top-N en la base) sin cache y con cache.
+        """
+        from services.topk import TOP_WINDOWS
+        self.open_database()
+        started = time.perf_counter()
+        _, end = self.prefill(rows)
+        print(f"top        {rows} filas precargadas en {time.perf_counter() - started:.1f} s", flush=True)
+        raw_query = text("""
+            SELECT source, rule_id, SUM(bytes_matched_delta) AS activity FROM rule_metrics
+            WHERE timestamp >= :start AND timestamp < :end
+            GROUP BY source, rule_id ORDER BY activity DESC, source, rule_id LIMIT 10
+        """)
+        for window in ("24h", "7d", "30d"):
+            window_start = end - TOP_WINDOWS[window]
+            found = {}
+
+            def raw(_):
+                with self.db_model.engine.connect() as connection:
+                    found["raw_group_by"] = [row.rule_id for row in connection.execute(raw_query, {"start": window_start, "end": end})]
+
+            def rollups(_):
+                self.service.top_cache.ttl = 0
+                found["rollups_top_n"] = [row["rule_id"] for row in self.service.get_top_rules(window_start, end)["rules"]]
+
+            def cached(_):
+                self.service.top_cache.ttl = 300
+                found["cached"] = [row["rule_id"] for row in self.service.get_top_rules(window_start, end)["rules"]]
+
+            for mode, function in (("raw_group_by", raw), ("rollups_top_n", rollups), ("cached", cached)):
+                stats = measure(function, self.args.repeat // 2 or 1)
+                # Las tres formas deben regresar las mismas reglas
+                stats["same_as_raw"] = found[mode] == found["raw_group_by"]
+                self.record("top", {"rows": rows, "window": window, "mode": mode}, stats)
+
+    # --- Ejecucion -------------------------------------------------------------
+
+    def run(self) -> None:
+        sizes = [int(size) for size in self.args.sizes.split(",")]
+        duplicates = [float(ratio) for ratio in self.args.duplicates.split(",")]
+        try:
+            for suite in self.args.suite.split(","):
+                if suite in ("inactive", "top"):
+                    for rows in [int(rows) for rows in self.args.rows.split(",")]:
+                        getattr(self, f"bench_{suite}")(rows)
+                    continue
+                bench = getattr(self, f"bench_{suite}")
+                for size in sizes:
+                    for ratio in duplicates:
+                        bench(size, ratio)
+        finally:
+            self.close_database()
+
+def git_revision() -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def run(args) -> int:
+    unknown = set(args.suite.split(",")) - set(SUITES)
+    if unknown:
+        print(f"Benchmarks desconocidos: {', '.join(sorted(unknown))}. Disponibles: {', '.join(SUITES)}")
+        return 2
+    suite = BenchmarkSuite(args)
+    suite.run()
+
+    revision = git_revision()
+    report = {
+        "meta": {
+            **revision,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "seed": args.seed,
+        },
+        "results": suite.results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{(revision['commit'] or 'sin-commit')[:10]}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, sort_keys=True), encoding="utf-8")
+    print(f"Resultados: {output}")
+    return 0
+
+def compare(args) -> int:
+    """Compara la mediana de cada benchmark; regresa 1 si alguno empeoro mas que --threshold."""
+    def load(path):
+        report = json.loads(Path(path).read_text(encoding="utf-8"))
+        return {(item["benchmark"], json.dumps(item["params"], sort_keys=True)): item["stats"] for item in report["results"]}
+
+    old, new = load(args.old), load(args.new)
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key]["median_s"], new[key]["median_s"]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  <-- mas lento"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = "  mas rapido"
+        print(f"{key[0]:<10} {key[1]:<60} {before * 1000:10.3f} ms -> {after * 1000:10.3f} ms  x{ratio:.2f}{flag}")
+    missing = old.keys() ^ new.keys()
+    if missing:
+        print(f"{len(missing)} benchmarks solo estan en uno de los archivos.")
+    return 1 if regressions else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description="Benchmarks de la API de pfSense")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Ejecuta los benchmarks y guarda los resultados en JSON")
+    run_parser.add_argument("--suite", default=",".join(SUITES), help=f"Benchmarks separados por coma ({', '.join(SUITES)})")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Reglas por lote")
+    run_parser.add_argument("--duplicates", default=DEFAULT_DUPLICATES, help="Proporcion de lineas con id repetido")
+    run_parser.add_argument("--rows", default=DEFAULT_ROWS, help="Filas precargadas en rule_metrics para `inactive` (hasta 10^8)")
+    run_parser.add_argument("--inactive-pct", type=int, default=20, help="Porcentaje de reglas sin trafico en `inactive`")
+    run_parser.add_argument("--repeat", type=int, default=20, help="Repeticiones maximas por medicion")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--database", default=os.environ.get("BENCH_DB", "pf_bench"), help="Base desechable")
+    run_parser.add_argument("--keep-db", action="store_true", help="No eliminar la base al terminar")
+    run_parser.add_argument("--output", default=None, help="Archivo JSON de resultados")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compara dos archivos de resultados")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Cambio relativo que se reporta (0.10 = 10%%)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# payload.py
+
+import random
+import re
+from pathlib import Path
+
+# Volcado real de `pfctl -s all` que sirve de semilla (etiquetas y lineas que no son reglas)
+SAMPLE_DUMP = Path(__file__).resolve().parent.parent / "Consultas" / "pfctl -s all.txt"
+
+USER_RULE_LINE = re.compile(r"^USER_RULE:?\s*(.*?)\s+id:\d+((?:\s+\d+){7,})\s*$")
+
+# Si no esta el volcado se usan lineas con el mismo formato
+FALLBACK_LABELS = ["", "250515_ACCS_pfREST_Jesus_Torres", "250513_de_TRST_a_pfSense_Jesus"]
+FALLBACK_NOISE = ["anti-lockout rule 5095 0 0 0 0 0 0 0", "pass IPv4 loopback 2325 2 100 1 60 1 40 0"]
+
+def load_seed(path: Path = SAMPLE_DUMP) -> tuple[list[str], list[str], int]:
+    """
+    Lee del volcado real las etiquetas de las reglas de usuario, las lineas de
+    estadisticas que no son USER_RULE (ruido que el parser debe descartar) y
+    cuantos contadores trae cada linea.
+    """
+    labels, noise, counters = [], [], 8
+    try:
+        lines = path.read_text(encoding="utf-8", errors="replace").splitlines()
+    except OSError:
+        return FALLBACK_LABELS, FALLBACK_NOISE, counters
+    for line in lines:
+        match = USER_RULE_LINE.match(line)
+        if match:
+            labels.append(match.group(1))
+            counters = len(match.group(2).split())
+        elif line.strip():
+            noise.append(line)
+    return sorted(set(labels)) or FALLBACK_LABELS, noise or FALLBACK_NOISE, counters
+
+class PayloadGenerator:
+    """
+    Genera volcados sinteticos de `pfctl -s all` con el formato de las lineas reales.
+
+    rules: reglas distintas (ids unicos).
+    duplicate_ratio: lineas extra que repiten un id ya generado, como una regla
+        que aparece en varias interfaces o anchors (0.25 = 25% mas lineas).
+    noise_ratio: lineas que no son USER_RULE por cada regla.
+    inactive_ratio: fraccion de reglas con contadores en cero.
+    """
+
+    FIRST_ID = 1700000000
+
+    def __init__(self, seed: int = 42):
+        self.seed = seed
+        self.labels, self.noise, self.counters = load_seed()
+
+    def rule_lines(self, rules: int, duplicate_ratio: float = 0.0, inactive_ratio: float = 0.2, step: int = 1,
+                   dormant_ratio: float = 0.0) -> list[str]:
+        """
+        Lineas USER_RULE. `step` es la ejecucion (1, 2, ...): los contadores crecen
+        con cada ejecucion para que los deltas contra la anterior no sean cero.
+        Las primeras `dormant_ratio` reglas no cambian entre ejecuciones.
+        """
+        dormant = int(rules * dormant_ratio)
+        rng = random.Random(self.seed)
+        lines = []
+        for index in range(rules):
+            rule_id = self.FIRST_ID + index
+            label = rng.choice(self.labels)
+            prefix = f"USER_RULE: {label}" if label else "USER_RULE"
+            scale = 1 if index < dormant else step
+            if rng.random() < inactive_ratio:
+                values = [rng.randint(0, 10000) * scale] + [0] * (self.counters - 1)
+            else:
+                values = [rng.randint(1, 10 ** 6) * scale for _ in range(self.counters)]
+            lines.append(f"{prefix} id:{rule_id} {' '.join(map(str, values))}")
+        for _ in range(int(rules * duplicate_ratio)):
+            # Mismo id y etiqueta que una regla existente, contadores propios
+            original = lines[rng.randrange(rules)]
+            head, _, _ = original.partition(" id:")
+            rule_id = original.split(" id:", 1)[1].split(" ", 1)[0]
+            scale = 1 if int(rule_id) - self.FIRST_ID < dormant else step
+            values = [rng.randint(0, 10 ** 5) * scale for _ in range(self.counters)]
+            lines.append(f"{head} id:{rule_id} {' '.join(map(str, values))}")
+        rng.shuffle(lines)
+        return lines
+
+    def dump(self, rules: int, duplicate_ratio: float = 0.0, noise_ratio: float = 1.0, inactive_ratio: float = 0.2, step: int = 1) -> str:
+        """Volcado completo (texto plano) con lineas de ruido intercaladas."""
+        rng = random.Random(self.seed + 1)
+        lines = self.rule_lines(rules, duplicate_ratio, inactive_ratio, step)
+        noise = [rng.choice(self.noise) for _ in range(int(len(lines) * noise_ratio))]
+        return "\n".join(noise[: len(noise) // 2] + lines + noise[len(noise) // 2:]) + "\n"
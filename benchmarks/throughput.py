@@ -0,0 +1,276 @@
+"""
+Throughput de la API completa por HTTP: WSGI (gunicorn + app.py) contra ASGI (uvicorn + asgi.py).
+
+    python -m benchmarks.throughput                                   Un proceso de cada servidor, 64 clientes
+    python -m benchmarks.throughput --concurrency 16,64,256 --duration 20
+    python -m benchmarks.throughput --servers asgi --workers 4 --rules 2000 --read-ratio 0.5
+
+Cada servidor se levanta con la misma base desechable (BENCH_DB, por defecto
+pf_bench_http) y atiende la misma mezcla de peticiones durante --duration
+segundos: POST /api/v1/data (un firewall por cliente, Idempotency-Key distinta
+en cada lote) y, con probabilidad --read-ratio, GET /api/v1/inactive paginado
+de un firewall. Los clientes mantienen la conexion abierta (keep-alive).
+
+Se reporta peticiones por segundo y latencias (p50, p90, p99) de cada servidor
+lado a lado; los resultados se guardan en benchmarks/results/throughput_<commit>_<fecha>.json.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "pf_bench", "throughput.log"))
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from sqlalchemy import text
+from benchmarks.bench import RESULTS_DIR, BenchmarkSuite, git_revision
+from benchmarks.payload import PayloadGenerator
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SERVERS = ("wsgi", "asgi")
+
+# Lotes distintos que cicla cada cliente (los contadores crecen con cada paso)
+DISTINCT_BATCHES = 20
+
+def server_command(server: str, args) -> list[str]:
+    if server == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    return [
+        sys.executable, "-m", "uvicorn", "asgi:app", "--host", args.host, "--port", str(args.port),
+        "--workers", str(args.workers), "--no-access-log", "--log-level", "warning",
+    ]
+
+def server_environment(args) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "POSTGRES_DB": args.database,
+        "GUNICORN_BIND": f"{args.host}:{args.port}",
+        "GUNICORN_WORKERS": str(args.workers),
+        "GUNICORN_THREADS": str(args.threads),
+        "GUNICORN_ACCESSLOG": "",
+        "GUNICORN_LOGLEVEL": "warning",
+        "INGEST_RESPONSE": "resumen",
+    })
+    return env
+
+def wait_until_up(args, process: subprocess.Popen, timeout: float = 30) -> None:
+    url = f"http://{args.host}:{args.port}/api/v1/healthcheck"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servidor termino con codigo {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"El servidor no respondio en {timeout} s")
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    """Lee una respuesta HTTP/1.1 completa (Content-Length o chunked) y regresa el status."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status
+
+class LoadGenerator:
+    """Clientes HTTP concurrentes (asyncio, sin dependencias) con la mezcla de escrituras y lecturas."""
+
+    def __init__(self, args, bodies: list[bytes]):
+        self.args = args
+        self.bodies = bodies
+        self.run_id = f"{time.time_ns():x}"
+
+    def request(self, client: int, sequence: int, rng: random.Random) -> tuple[str, bytes]:
+        firewall = f"bench-{client}"
+        host = f"{self.args.host}:{self.args.port}"
+        if sequence > 0 and rng.random() < self.args.read_ratio:
+            path = f"/api/v1/inactive?fechaInicio=2000-01-01&fechaFin=2100-01-01&firewall={firewall}&limite={self.args.page}"
+            return "read", f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+        body = self.bodies[sequence % len(self.bodies)]
+        head = (
+            f"POST /api/v1/data?firewall={firewall} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Content-Type: text/plain\r\nContent-Length: {len(body)}\r\n"
+            f"Idempotency-Key: {self.run_id}-{client}-{sequence}\r\n\r\n"
+        )
+        return "write", head.encode() + body
+
+    async def client(self, client: int, deadline: float, measure_from: float, samples: dict) -> None:
+        rng = random.Random(client)
+        reader, writer = await asyncio.open_connection(self.args.host, self.args.port)
+        sequence = 0
+        try:
+            while time.perf_counter() < deadline:
+                kind, payload = self.request(client, sequence, rng)
+                sequence += 1
+                start = time.perf_counter()
+                writer.write(payload)
+                await writer.drain()
+                status = await read_response(reader)
+                end = time.perf_counter()
+                if start < measure_from:
+                    continue
+                bucket = samples[kind] if 200 <= status < 300 else samples["errors"]
+                bucket.append(end - start)
+        finally:
+            writer.close()
+
+    async def run(self, concurrency: int) -> dict:
+        samples = {"write": [], "read": [], "errors": []}
+        start = time.perf_counter()
+        measure_from = start + self.args.warmup
+        deadline = measure_from + self.args.duration
+        await asyncio.gather(*(self.client(client, deadline, measure_from, samples) for client in range(concurrency)))
+        return summarize(samples, self.args.duration)
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(samples: dict, duration: float) -> dict:
+    summary = {}
+    for kind in ("write", "read"):
+        values = samples[kind]
+        summary[kind] = {
+            "requests": len(values),
+            "rps": len(values) / duration,
+            "p50_ms": (percentile(values, 0.50) or 0) * 1000,
+            "p90_ms": (percentile(values, 0.90) or 0) * 1000,
+            "p99_ms": (percentile(values, 0.99) or 0) * 1000,
+        }
+    summary["total_rps"] = (len(samples["write"]) + len(samples["read"])) / duration
+    summary["errors"] = len(samples["errors"])
+    return summary
+
+def run_server(server: str, args, bodies: list[bytes], concurrencies: list[int]) -> list[dict]:
+    process = subprocess.Popen(server_command(server, args), cwd=ROOT, env=server_environment(args))
+    results = []
+    try:
+        wait_until_up(args, process)
+        generator = LoadGenerator(args, bodies)
+        for concurrency in concurrencies:
+            summary = asyncio.run(generator.run(concurrency))
+            results.append({"server": server, "concurrency": concurrency, **summary})
+            print(
+                f"{server:<5} c={concurrency:<5} {summary['total_rps']:9.1f} req/s  "
+                f"escritura p50 {summary['write']['p50_ms']:8.1f} p99 {summary['write']['p99_ms']:8.1f} ms  "
+                f"lectura p50 {summary['read']['p50_ms']:8.1f} p99 {summary['read']['p99_ms']:8.1f} ms  "
+                f"errores {summary['errors']}",
+                flush=True
+            )
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+def print_comparison(results: list[dict]) -> None:
+    """Tabla lado a lado por concurrencia."""
+    by_key = {(item["server"], item["concurrency"]): item for item in results}
+    servers = sorted({item["server"] for item in results}, key=SERVERS.index)
+    print()
+    print(f"{'concurrencia':<13}" + "".join(f"{server + ' req/s':>14}{server + ' p99 ms':>14}" for server in servers))
+    for concurrency in sorted({item["concurrency"] for item in results}):
+        row = f"{concurrency:<13}"
+        for server in servers:
+            item = by_key.get((server, concurrency))
+            p99 = max(item["write"]["p99_ms"], item["read"]["p99_ms"]) if item else 0
+            row += f"{item['total_rps'] if item else 0:14.1f}{p99:14.1f}"
+        print(row)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.throughput", description="Throughput WSGI contra ASGI")
+    parser.add_argument("--servers", default=",".join(SERVERS), help=f"Servidores a medir ({', '.join(SERVERS)})")
+    parser.add_argument("--concurrency", default="64", help="Clientes simultaneos, separados por coma")
+    parser.add_argument("--duration", type=float, default=10, help="Segundos medidos por concurrencia")
+    parser.add_argument("--warmup", type=float, default=2, help="Segundos iniciales sin medir")
+    parser.add_argument("--rules", type=int, default=500, help="Reglas por lote")
+    parser.add_argument("--read-ratio", type=float, default=0.2, help="Proporcion de GET /api/v1/inactive")
+    parser.add_argument("--page", type=int, default=100, help="'limite' de las lecturas")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos de cada servidor")
+    parser.add_argument("--threads", type=int, default=8, help="Hilos por worker de gunicorn (gthread)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database", default=os.environ.get("BENCH_DB", "pf_bench_http"), help="Base desechable")
+    parser.add_argument("--keep-db", action="store_true", help="No eliminar la base al terminar")
+    parser.add_argument("--output", default=None, help="Archivo JSON de resultados")
+    args = parser.parse_args(argv)
+
+    servers = args.servers.split(",")
+    unknown = set(servers) - set(SERVERS)
+    if unknown:
+        print(f"Servidores desconocidos: {', '.join(sorted(unknown))}. Disponibles: {', '.join(SERVERS)}")
+        return 2
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+
+    generator = PayloadGenerator(args.seed)
+    bodies = [generator.dump(args.rules, step=step).encode() for step in range(1, DISTINCT_BATCHES + 1)]
+
+    # La base desechable se crea y migra igual que en benchmarks.bench
+    suite = BenchmarkSuite(argparse.Namespace(seed=args.seed, database=args.database, keep_db=args.keep_db))
+    suite.open_database()
+    results = []
+    try:
+        for server in servers:
+            results += run_server(server, args, bodies, concurrencies)
+            # Cada servidor empieza con las mismas tablas vacias
+            with suite.db_model.engine.begin() as connection:
+                connection.execute(text(
+                    "TRUNCATE rule_metrics, rule_metrics_hourly, rule_metrics_daily, inactivity_spans, "
+                    "inactive_rule_log, execution_log, ingest_dedupe, rules CASCADE"
+                ))
+    finally:
+        suite.close_database()
+
+    print_comparison(results)
+    revision = git_revision()
+    report = {
+        "meta": {
+            **revision,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "keep_db")},
+        },
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"throughput_{(revision['commit'] or 'sin-commit')[:10]}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, sort_keys=True), encoding="utf-8")
+    print(f"Resultados: {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
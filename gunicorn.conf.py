@@ -0,0 +1,48 @@
+# gunicorn.conf.py
+# Uso: gunicorn -c gunicorn.conf.py app:app
+
+import multiprocessing
+import os
+
+# Direccion y cola de conexiones pendientes: en una rafaga de POSTs de los firewalls las
+# peticiones esperan aqui (en orden) en lugar de amontonarse en un solo hilo
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+backlog = int(os.environ.get("GUNICORN_BACKLOG", "2048"))
+
+# Procesos x hilos. Cada worker tiene su propio pool de conexiones: conviene que
+# DB_POOL_SIZE sea al menos GUNICORN_THREADS. La ingesta no depende de lo que un
+# worker tenga en memoria: la muestra anterior (deltas y modo por cambios) y las
+# etiquetas se leen de la base con el bloqueo de cada firewall tomado
+workers = int(os.environ.get("GUNICORN_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+
+# Reciclar workers cada N peticiones (0 = nunca), con variacion para que no reinicien juntos
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# La app se carga una vez en el proceso maestro y se comparte con los workers por
+# copy-on-write; el engine se reinicia en cada worker (post_fork)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-") or None # vacio = sin log de accesos
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+def post_fork(server, worker):
+    """Cada worker descarta las conexiones heredadas del maestro y abre las suyas."""
+    if not preload_app:
+        return
+    from app import db_model
+    db_model.reset_after_fork()
+    server.log.info(f"Worker {worker.pid}: pool de conexiones reiniciado.")
+
+def worker_exit(server, worker):
+    """Guarda los lotes pendientes de la cola de ingesta y cierra las conexiones del worker."""
+    from app import db_model, ingest_queue
+    if ingest_queue is not None:
+        ingest_queue.stop()
+    db_model.close_connection()
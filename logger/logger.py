@@ -1,35 +1,145 @@
+import atexit
+import itertools
 import logging as log
+import logging.handlers
 import os
+import queue
+import threading
 
-class Logger:
+# Configuracion por variables de entorno
+#   LOG_LEVEL: nivel general (por defecto INFO).
+#   LOG_LEVELS: niveles por modulo, p. ej. "services.service=DEBUG,routes.route=WARNING".
+#   LOG_FILE: archivo de log (por defecto /app/logs/api.log).
+#   LOG_PAYLOAD_MAX: caracteres maximos al volcar un lote en el log (por defecto 500).
+#   LOG_PAYLOAD_SAMPLE: volcar solo 1 de cada N lotes (por defecto 1, todos).
+LOG_FORMAT = '%(asctime)s: %(levelname)s [%(filename)s:%(lineno)s] %(message)s'
+LOG_DATEFMT = '%I:%M:%S %p'
+
+_setup_lock = threading.Lock()
+_listener = None
+
+def _parse_levels(value: str) -> dict:
+    """Convierte "modulo=NIVEL,otro=NIVEL" en {modulo: NIVEL}."""
+    levels = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def _start_listener(handlers: list) -> None:
+    """Conecta la raiz a una cola y escribe en los handlers desde un hilo aparte."""
+    global _listener
+    log_queue = queue.SimpleQueue()
+    root = log.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def _restart_after_fork() -> None:
+    """El hilo del listener no sobrevive a fork (gunicorn con preload): se crea uno nuevo."""
+    global _setup_lock
+    _setup_lock = threading.Lock()
+    if _listener is not None:
+        _start_listener(list(_listener.handlers))
+
+def _stop_listener() -> None:
+    """Escribe lo que quede en la cola al terminar el proceso."""
+    if _listener is not None:
+        _listener.stop()
 
-    def __init__(self, log_file="/app/logs/api.log", level=log.DEBUG):
+def setup_logging(log_file: str = None, level: str = None) -> None:
+    """
+    Configura el logging una sola vez por proceso.
+
+    Los mensajes se encolan con un QueueHandler y un QueueListener los escribe
+    en consola y en archivo desde otro hilo, asi el request no espera la escritura.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_file = log_file or os.environ.get("LOG_FILE", "/app/logs/api.log")
         os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        
-        log.basicConfig(
-            level=level,
-            format='%(asctime)s: %(levelname)s [%(filename)s:%(lineno)s] %(message)s',
-            datefmt='%I:%M:%S %p',
-            handlers=[log.StreamHandler(), log.FileHandler(log_file)]
-        )
-        self.logger = log.getLogger()
-    
-    def debug(self, message):
+
+        formatter = log.Formatter(LOG_FORMAT, datefmt=LOG_DATEFMT)
+        handlers = [log.StreamHandler(), log.FileHandler(log_file)]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        root = log.getLogger()
+        root.setLevel(level or os.environ.get("LOG_LEVEL", "INFO").upper())
+        for name, module_level in _parse_levels(os.environ.get("LOG_LEVELS", "")).items():
+            log.getLogger(name).setLevel(module_level)
+
+        _start_listener(handlers)
+        atexit.register(_stop_listener)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+class Payload:
+    """
+    Envuelve un lote para el log: el repr se calcula solo si el mensaje se
+    emite y se recorta a LOG_PAYLOAD_MAX caracteres.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = repr(self.value)
+        if self.limit and len(text) > self.limit:
+            size = f"{len(self.value)} elementos, " if hasattr(self.value, "__len__") else ""
+            return f"{text[:self.limit]}... ({size}{len(text)} caracteres)"
+        return text
+
+class Logger:
+
+    # Contador compartido para el muestreo de volcados de lotes
+    _payload_counter = itertools.count()
+
+    def __init__(self, name: str = None, log_file: str = None, level: str = None):
+        setup_logging(log_file, level)
+        # Un logger por modulo para poder fijar su nivel con LOG_LEVELS
+        self.logger = log.getLogger(name)
+        self.payload_max = int(os.environ.get("LOG_PAYLOAD_MAX", "500"))
+        self.payload_sample = max(int(os.environ.get("LOG_PAYLOAD_SAMPLE", "1")), 1)
+
+    def debug(self, message, *args):
         """Log a message with severity 'DEBUG' on the logger"""
-        self.logger.debug(message, stacklevel=2)
-    
-    def info(self, message):
+        self.logger.debug(message, *args, stacklevel=2)
+
+    def info(self, message, *args):
         """Log a message with severity 'INFO' on the logger"""
-        self.logger.info(message, stacklevel=2)
-    
-    def warning(self, message):
+        self.logger.info(message, *args, stacklevel=2)
+
+    def warning(self, message, *args):
         """Log a message with severity 'WARNING' on the logger"""
-        self.logger.warning(message, stacklevel=2)
-    
-    def error(self, message):
+        self.logger.warning(message, *args, stacklevel=2)
+
+    def error(self, message, *args):
         """Log a message with severity 'ERROR' on the logger"""
-        self.logger.error(message, stacklevel=2)
-    
-    def critical(self, message):
+        self.logger.error(message, *args, stacklevel=2)
+
+    def critical(self, message, *args):
         """Log a message with severity 'CRITICAL' on the logger"""
-        self.logger.critical(message, stacklevel=2)
\ No newline at end of file
+        self.logger.critical(message, *args, stacklevel=2)
+
+    def debug_payload(self, message, *args):
+        """
+        Log a batch dump with severity 'DEBUG'. El ultimo argumento es el lote.
+        Si DEBUG no esta activo no se hace nada; si lo esta, se registra 1 de cada
+        LOG_PAYLOAD_SAMPLE lotes, recortado a LOG_PAYLOAD_MAX caracteres.
+        """
+        if not self.logger.isEnabledFor(log.DEBUG):
+            return
+        if next(self._payload_counter) % self.payload_sample:
+            return
+        *args, payload = args
+        self.logger.debug(message, *args, Payload(payload, self.payload_max), stacklevel=2)
@@ -0,0 +1,97 @@
+"""
+Comandos de administracion de la API.
+
+    python manage.py migrate             Aplica las migraciones pendientes
+    python manage.py migrate --to 2      Aplica hasta la version 2
+    python manage.py migrate --status    Muestra la version de la base y lo pendiente
+    python manage.py partitions          Crea las particiones por adelantado y aplica la retencion (cron)
+    python manage.py backfill DIR        Carga los volcados de pfctl y capturas de la API de DIR
+    python manage.py backfill DIR --firewall fw2 --timezone America/Mexico_City --dry-run
+
+Usa las mismas variables de entorno POSTGRES_* que la API, con el rol dueno de las
+tablas (migrate, partitions y backfill crean o eliminan tablas).
+"""
+
+import argparse
+import sys
+from datetime import datetime, timezone
+from models.model import BDModel, DEFAULT_SOURCE
+from migrations.runner import MigrationRunner
+from backfill.backfill import backfill
+
+def migrate(args) -> int:
+    db_model = BDModel()
+    db_model.connect_to_database()
+    try:
+        runner = MigrationRunner(db_model.engine)
+        if args.status:
+            applied = runner.applied()
+            for migration in runner.migrations():
+                if migration.version in applied:
+                    state = f"aplicada {applied[migration.version][1]:%Y-%m-%d %H:%M:%S}"
+                else:
+                    state = "pendiente"
+                print(f"{migration.version:04d}_{migration.name}: {state}")
+            print(f"Version de la base: {runner.current()} / ultima: {runner.head()}")
+            return 0
+        applied = db_model.migrate(args.to)
+        for migration in applied:
+            print(f"{migration.version:04d}_{migration.name}: aplicada")
+        print(f"Version de la base: {runner.current()}")
+        return 0
+    finally:
+        db_model.close_connection()
+
+def partitions(args) -> int:
+    db_model = BDModel()
+    db_model.connect_to_database()
+    try:
+        manager = db_model.partitions
+        if args.status:
+            for table, existing in manager.list_partitions().items():
+                print(f"{table}: {len(existing)} particiones")
+                for name, start, end in existing:
+                    print(f"  {name}: {start:%Y-%m-%d} a {end:%Y-%m-%d}")
+            return 0
+        removed = db_model.maintain_partitions()
+        last = manager.period_start(datetime.now(timezone.utc))
+        for _ in range(manager.premake):
+            last = manager.next_period(last)
+        print(f"Particiones aseguradas hasta el periodo {last:%Y-%m-%d} ({manager.interval}).")
+        for name in removed:
+            print(f"{name}: fuera de retencion ({manager.retention_mode})")
+        return 0
+    finally:
+        db_model.close_connection()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="manage.py", description="Administracion de la API de pfSense")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Aplica las migraciones de migrations/versions")
+    migrate_parser.add_argument("--to", type=int, default=None, help="Version destino (por defecto la ultima)")
+    migrate_parser.add_argument("--status", action="store_true", help="Solo muestra las versiones aplicadas y pendientes")
+    migrate_parser.set_defaults(func=migrate)
+
+    partitions_parser = commands.add_parser("partitions", help="Crea las particiones de los siguientes periodos y aplica PARTITION_RETENTION")
+    partitions_parser.add_argument("--status", action="store_true", help="Solo muestra las particiones existentes")
+    partitions_parser.set_defaults(func=partitions)
+
+    backfill_parser = commands.add_parser("backfill", help="Carga historicos: volcados de pfctl y capturas de la API con su fecha original")
+    backfill_parser.add_argument("directory", help="Carpeta con los archivos (se recorre completa, acepta .gz)")
+    backfill_parser.add_argument("--firewall", default=DEFAULT_SOURCE, help=f"Firewall de los archivos (por defecto {DEFAULT_SOURCE})")
+    backfill_parser.add_argument("--firewall-from-dir", action="store_true", help="El firewall es la primera carpeta dentro de DIR (fw1/..., fw2/...)")
+    backfill_parser.add_argument("--timezone", default="UTC", help="Zona horaria de las fechas en los nombres de archivo (por defecto UTC)")
+    backfill_parser.add_argument("--mtime", action="store_true", help="Usa la fecha de modificacion de los archivos sin fecha en el nombre")
+    backfill_parser.add_argument("--workers", type=int, default=None, help="Procesos que interpretan los archivos (por defecto uno por CPU)")
+    backfill_parser.add_argument("--group", type=int, default=200, help="Ejecuciones por transaccion (por defecto 200)")
+    backfill_parser.add_argument("--include-saved", action="store_true", help="Carga tambien las capturas con \"Registro exitoso\" (ya guardadas)")
+    backfill_parser.add_argument("--progress-seconds", type=float, default=5.0, help="Segundos entre reportes de avance (por defecto 5)")
+    backfill_parser.add_argument("--dry-run", action="store_true", help="Solo muestra lo que se cargaria")
+    backfill_parser.set_defaults(func=backfill)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# metrics.py
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets por defecto (segundos), de 1 ms a 30 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _format_value(value) -> str:
+    if value is None:
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Metric:
+    """Base de los contadores e histogramas: nombre, ayuda y etiquetas fijas."""
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}, se recibio {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    """Contador que solo crece."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Un contador no puede disminuir")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+class Histogram(Metric):
+    """Histograma con buckets fijos (acumulados al exponerlos, como espera Prometheus)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [conteo por bucket..., +Inf], suma
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa la duracion del bloque en segundos."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {key: (list(state[0]), state[1]) for key, state in self._values.items()}
+        lines = self.header()
+        for key, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket_labels = dict(labels, le=_format_value(float(bound)))
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+class Registry:
+    """
+    Metricas del proceso en formato de texto de Prometheus.
+
+    Ademas de los contadores e histogramas registrados, acepta colectores:
+    funciones que al exponer las metricas regresan familias
+    (nombre, tipo, ayuda, [(etiquetas, valor), ...]) con valores leidos en ese momento
+    (p. ej. el estado del pool de conexiones).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = {}
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrica repetida: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, key: str, function) -> None:
+        """Registra (o reemplaza) un colector con el nombre `key`."""
+        with self._lock:
+            self._collectors[key] = function
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for function in collectors:
+            for name, kind, documentation, samples in function():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+class StageTimer:
+    """
+    Acumula el tiempo de cada etapa de un lote y lo observa en un histograma
+    con la etiqueta `stage` al terminar.
+
+    Las etapas encadenadas con generadores (decodificar -> interpretar -> combinar)
+    se ejecutan intercaladas: el reloj cambia de etapa cada vez que el control
+    pasa de una a otra, asi cada etapa reporta solo su propio tiempo.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.elapsed = {}
+        self._current = None
+        self._mark = time.perf_counter()
+
+    def switch(self, stage: str) -> str:
+        """Asigna el tiempo transcurrido a la etapa actual y cambia a `stage`. Regresa la anterior."""
+        now = time.perf_counter()
+        previous = self._current
+        if previous is not None:
+            self.elapsed[previous] = self.elapsed.get(previous, 0.0) + (now - self._mark)
+        self._mark = now
+        self._current = stage
+        return previous
+
+    @contextmanager
+    def stage(self, stage: str):
+        previous = self.switch(stage)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def iter(self, stage: str, iterable):
+        """Mide cada next() del iterable como tiempo de la etapa."""
+        iterator = iter(iterable)
+        switch = self.switch
+        while True:
+            previous = switch(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                switch(previous)
+                return
+            switch(previous)
+            yield item
+
+    async def aiter(self, stage: str, iterable):
+        """Variante de iter para iterables asincronos (cuerpo de la peticion en Quart)."""
+        iterator = iterable.__aiter__()
+        switch = self.switch
+        while True:
+            previous = switch(stage)
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                switch(previous)
+                return
+            switch(previous)
+            yield item
+
+    def observe(self, **labels) -> None:
+        """Observa el tiempo acumulado de cada etapa (una observacion por etapa y lote)."""
+        for stage, seconds in self.elapsed.items():
+            self.histogram.observe(seconds, stage=stage, **labels)
+        self.elapsed = {}
+
+# Registro del proceso (con gunicorn cada worker expone el suyo)
+REGISTRY = Registry()
+
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "pf_ingest_stage_seconds",
+    "Tiempo por etapa de la ingesta de un lote (decode, parse, merge, validation, dedupe, deltas, suppress, rule_upsert, metric_insert, inactivity_spans, inactive_log_insert, rollup_upsert, counter_insert, commit).",
+    ("stage",)
+)
+INGEST_BATCH_RULES = REGISTRY.histogram(
+    "pf_ingest_batch_rules",
+    "Reglas por lote recibido (despues de combinar duplicados).",
+    buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+)
+INGEST_BATCHES = REGISTRY.counter(
+    "pf_ingest_batches_total",
+    "Lotes recibidos en /api/v1/data por resultado (saved, error, queued, duplicate, rejected, invalid, empty).",
+    ("result",)
+)
+INGEST_UNPARSABLE_LINES = REGISTRY.counter(
+    "pf_ingest_unparsable_lines_total",
+    "Lineas USER_RULE que no se pudieron interpretar."
+)
+INACTIVE_QUERY_SECONDS = REGISTRY.histogram(
+    "pf_inactive_query_seconds",
+    "Latencia de /api/v1/inactive (en ndjson hasta enviar la ultima regla), de /api/v1/idle (format=idle) y de /api/v1/rules/top (format=top).",
+    ("format",)
+)
@@ -0,0 +1,140 @@
+# runner.py
+
+import re
+from pathlib import Path
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from logger.logger import Logger
+
+# Carpeta con los scripts versionados: NNNN_descripcion.sql
+VERSIONS_DIR = Path(__file__).resolve().parent / "versions"
+VERSION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+# Clase del advisory lock que serializa migraciones simultaneas (dos contenedores iniciando)
+MIGRATION_LOCK_CLASS = 7302
+
+class Migration:
+    """Script SQL versionado."""
+
+    __slots__ = ("version", "name", "path")
+
+    def __init__(self, version: int, name: str, path: Path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def sql(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+    def __repr__(self):
+        return f"<Migration({self.version:04d}_{self.name})>"
+
+class MigrationRunner:
+    """
+    Aplica en orden los scripts de migrations/versions y registra cada version
+    aplicada en la tabla schema_version.
+
+    Cada script corre en su propia transaccion junto con el INSERT de su version:
+    si falla, la base queda en la version anterior y se puede volver a ejecutar.
+    Los scripts son el historial unico del esquema (tablas, indices, vistas,
+    procedimientos y permisos); models/model.py solo describe las tablas para el ORM.
+    """
+
+    def __init__(self, engine, versions_dir: Path = VERSIONS_DIR):
+        self.engine = engine
+        self.versions_dir = versions_dir
+        self.logger = Logger(__name__)
+
+    def migrations(self) -> list[Migration]:
+        """Scripts disponibles, ordenados por version."""
+        found = {}
+        for path in sorted(self.versions_dir.glob("*.sql")):
+            match = VERSION_FILE.match(path.name)
+            if not match:
+                self.logger.warning("Se ignora %s: el nombre debe ser NNNN_descripcion.sql", path.name)
+                continue
+            version = int(match.group(1))
+            if version in found:
+                raise ValueError(f"Version de migracion repetida: {path.name} y {found[version].path.name}")
+            found[version] = Migration(version, match.group(2), path)
+        return [found[version] for version in sorted(found)]
+
+    def head(self) -> int:
+        """Ultima version disponible en el codigo."""
+        migrations = self.migrations()
+        return migrations[-1].version if migrations else 0
+
+    def current(self) -> int:
+        """Version de la base (0 si nunca se migro). Una sola consulta."""
+        try:
+            with self.engine.connect() as connection:
+                return connection.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+        except ProgrammingError:
+            # La tabla schema_version no existe
+            return 0
+
+    def applied(self) -> dict:
+        """Versiones aplicadas: {version: (nombre, applied_at)}."""
+        try:
+            with self.engine.connect() as connection:
+                rows = connection.execute(text("SELECT version, name, applied_at FROM schema_version ORDER BY version"))
+                return {row.version: (row.name, row.applied_at) for row in rows}
+        except ProgrammingError:
+            return {}
+
+    def pending(self) -> list[Migration]:
+        """Scripts que faltan por aplicar."""
+        applied = self.applied()
+        return [migration for migration in self.migrations() if migration.version not in applied]
+
+    def migrate(self, target: int = None) -> list[Migration]:
+        """
+        Aplica los scripts pendientes hasta `target` (por defecto la ultima version).
+        Regresa los scripts aplicados.
+        """
+        self._ensure_version_table()
+        done = []
+        for migration in self.pending():
+            if target is not None and migration.version > target:
+                break
+            if self._apply(migration):
+                done.append(migration)
+        if done:
+            self.logger.info("Esquema migrado a la version %s.", done[-1].version)
+        else:
+            self.logger.info("El esquema ya esta en la version %s.", self.current())
+        return done
+
+    def _ensure_version_table(self) -> None:
+        """Internal method to create the schema_version table."""
+        with self.engine.begin() as connection:
+            connection.execute(text("SELECT pg_advisory_xact_lock(:lock_class, 0)"), {"lock_class": MIGRATION_LOCK_CLASS})
+            connection.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                " version INT PRIMARY KEY,"
+                " name VARCHAR(255) NOT NULL,"
+                " applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL)"
+            ))
+
+    def _apply(self, migration: Migration) -> bool:
+        """Internal method to run one script and record its version in the same transaction."""
+        with self.engine.begin() as connection:
+            # Otro proceso pudo aplicarla mientras se esperaba el lock
+            connection.execute(text("SELECT pg_advisory_xact_lock(:lock_class, 0)"), {"lock_class": MIGRATION_LOCK_CLASS})
+            exists = connection.execute(
+                text("SELECT 1 FROM schema_version WHERE version = :version"), {"version": migration.version}
+            ).scalar()
+            if exists:
+                return False
+            self.logger.info("Aplicando migracion %04d_%s...", migration.version, migration.name)
+            # Directo al cursor y sin parametros: el script se envia tal cual (bloques $$ y % incluidos)
+            cursor = connection.connection.cursor()
+            try:
+                cursor.execute(migration.sql())
+            finally:
+                cursor.close()
+            connection.execute(
+                text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+                {"version": migration.version, "name": migration.name}
+            )
+        return True
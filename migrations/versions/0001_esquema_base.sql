@@ -0,0 +1,154 @@
+-- 0001: Esquema base (equivale a SQL/TablasOptimizadas.sql + Agregados.sql + MultiFirewall.sql
+-- + ContadorEjecuciones.sql). Todo es IF NOT EXISTS: en una base que ya tiene esas tablas
+-- solo se registra la version.
+-- Las particiones de rule_metrics e inactive_rule_log las crea la API (models/partition.py).
+
+-- Tabla Maestra de Reglas (el id de pf solo es unico dentro de cada firewall)
+CREATE TABLE IF NOT EXISTS rules (
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    rule_id BIGINT NOT NULL,
+    rule_label VARCHAR(255) NOT NULL,
+    rule_description VARCHAR(500),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (source, rule_id)
+);
+CREATE INDEX IF NOT EXISTS idx_rules_source_rule_label ON rules (source, rule_label);
+
+-- Metricas historicas, particionadas por rango de timestamp
+CREATE TABLE IF NOT EXISTS rule_metrics (
+    id BIGSERIAL,
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    rule_id BIGINT NOT NULL,
+    evaluations BIGINT NOT NULL,
+    packets_matched BIGINT NOT NULL,
+    bytes_matched BIGINT NOT NULL,
+    states_created BIGINT NOT NULL,
+    state_packets BIGINT NOT NULL,
+    state_bytes BIGINT NOT NULL,
+    input_output BIGINT,
+    evaluations_delta BIGINT,
+    packets_matched_delta BIGINT,
+    bytes_matched_delta BIGINT,
+    states_created_delta BIGINT,
+    counter_reset BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (id, timestamp),
+    CONSTRAINT fk_rule_metrics_rule_id FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT
+) PARTITION BY RANGE (timestamp);
+CREATE INDEX IF NOT EXISTS idx_rule_metrics_timestamp ON rule_metrics (timestamp);
+CREATE INDEX IF NOT EXISTS idx_rule_metrics_source_rule_id_timestamp ON rule_metrics (source, rule_id, timestamp DESC);
+
+-- Reglas con 0 bytes en cada ejecucion, particionada por rango de created_at
+CREATE TABLE IF NOT EXISTS inactive_rule_log (
+    log_id BIGSERIAL,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    rule_id BIGINT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (log_id, created_at),
+    CONSTRAINT fk_inactive_rule_log_rule_id FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT
+) PARTITION BY RANGE (created_at);
+CREATE INDEX IF NOT EXISTS idx_inactive_rule_log_source_rule_id ON inactive_rule_log (source, rule_id);
+CREATE INDEX IF NOT EXISTS idx_inactive_rule_log_created_at ON inactive_rule_log (created_at DESC);
+
+-- Ejecuciones por firewall y mes (meses compactados desde execution_log)
+CREATE TABLE IF NOT EXISTS monthly_execution_counts (
+    count_id SERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    month_start_date DATE NOT NULL,
+    execution_count INT NOT NULL DEFAULT 0,
+    last_updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    CONSTRAINT uq_monthly_execution_count UNIQUE (source, month_start_date)
+);
+
+-- Bitacora de ejecuciones (solo INSERT desde la API)
+CREATE TABLE IF NOT EXISTS execution_log (
+    log_id BIGSERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    executed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_execution_log_executed_at ON execution_log (executed_at);
+
+-- Agregados por regla y hora / dia (UTC)
+CREATE TABLE IF NOT EXISTS rule_metrics_hourly (
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    rule_id BIGINT NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL, -- Inicio del periodo en UTC
+    sample_count INT NOT NULL DEFAULT 0,
+    first_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    evaluations_first BIGINT NOT NULL,
+    evaluations_last BIGINT NOT NULL,
+    evaluations_delta BIGINT NOT NULL DEFAULT 0,
+    evaluations_delta_min BIGINT NOT NULL,
+    evaluations_delta_max BIGINT NOT NULL,
+    packets_matched_first BIGINT NOT NULL,
+    packets_matched_last BIGINT NOT NULL,
+    packets_matched_delta BIGINT NOT NULL DEFAULT 0,
+    packets_matched_delta_min BIGINT NOT NULL,
+    packets_matched_delta_max BIGINT NOT NULL,
+    bytes_matched_first BIGINT NOT NULL,
+    bytes_matched_last BIGINT NOT NULL,
+    bytes_matched_delta BIGINT NOT NULL DEFAULT 0,
+    bytes_matched_delta_min BIGINT NOT NULL,
+    bytes_matched_delta_max BIGINT NOT NULL,
+    states_created_first BIGINT NOT NULL,
+    states_created_last BIGINT NOT NULL,
+    states_created_delta BIGINT NOT NULL DEFAULT 0,
+    states_created_delta_min BIGINT NOT NULL,
+    states_created_delta_max BIGINT NOT NULL,
+    PRIMARY KEY (source, rule_id, bucket_start)
+);
+CREATE INDEX IF NOT EXISTS idx_rule_metrics_hourly_bucket_start ON rule_metrics_hourly (bucket_start);
+
+CREATE TABLE IF NOT EXISTS rule_metrics_daily (
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    rule_id BIGINT NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL, -- Inicio del periodo en UTC
+    sample_count INT NOT NULL DEFAULT 0,
+    first_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_sample_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    evaluations_first BIGINT NOT NULL,
+    evaluations_last BIGINT NOT NULL,
+    evaluations_delta BIGINT NOT NULL DEFAULT 0,
+    evaluations_delta_min BIGINT NOT NULL,
+    evaluations_delta_max BIGINT NOT NULL,
+    packets_matched_first BIGINT NOT NULL,
+    packets_matched_last BIGINT NOT NULL,
+    packets_matched_delta BIGINT NOT NULL DEFAULT 0,
+    packets_matched_delta_min BIGINT NOT NULL,
+    packets_matched_delta_max BIGINT NOT NULL,
+    bytes_matched_first BIGINT NOT NULL,
+    bytes_matched_last BIGINT NOT NULL,
+    bytes_matched_delta BIGINT NOT NULL DEFAULT 0,
+    bytes_matched_delta_min BIGINT NOT NULL,
+    bytes_matched_delta_max BIGINT NOT NULL,
+    states_created_first BIGINT NOT NULL,
+    states_created_last BIGINT NOT NULL,
+    states_created_delta BIGINT NOT NULL DEFAULT 0,
+    states_created_delta_min BIGINT NOT NULL,
+    states_created_delta_max BIGINT NOT NULL,
+    PRIMARY KEY (source, rule_id, bucket_start)
+);
+CREATE INDEX IF NOT EXISTS idx_rule_metrics_daily_bucket_start ON rule_metrics_daily (bucket_start);
+
+-- Reglas que estuvieron inactivas TODO el mes (procedimiento analyze_monthly_inactive_rules)
+CREATE TABLE IF NOT EXISTS monthly_fully_inactive_rules (
+    monthly_log_id SERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    rule_id BIGINT NOT NULL,
+    month_start_date DATE NOT NULL,
+    CONSTRAINT fk_monthly_fully_inactive_rules_rule_id FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT,
+    CONSTRAINT uq_monthly_fully_inactive UNIQUE (source, rule_id, month_start_date)
+);
+CREATE INDEX IF NOT EXISTS idx_monthly_fully_inactive_rules_source_rule_id ON monthly_fully_inactive_rules (source, rule_id);
+CREATE INDEX IF NOT EXISTS idx_monthly_fully_inactive_rules_month_start_date ON monthly_fully_inactive_rules (month_start_date);
+
+-- Total de detecciones de inactividad por mes
+CREATE TABLE IF NOT EXISTS monthly_inactive_detection_counts (
+    count_id SERIAL PRIMARY KEY,
+    total_detections INT NOT NULL,
+    inactive_month DATE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    CONSTRAINT uq_monthly_inactive_count UNIQUE (inactive_month)
+);
+CREATE INDEX IF NOT EXISTS idx_monthly_inactive_detection_counts_month ON monthly_inactive_detection_counts (inactive_month);
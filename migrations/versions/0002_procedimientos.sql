@@ -0,0 +1,141 @@
+-- 0002: Vista y procedimientos (SQL/ContadorEjecuciones.sql y SQL/Procedimiento.sql).
+-- CREATE OR REPLACE: se puede aplicar sobre una base que ya los tiene.
+
+-- Conteo exacto por firewall y mes (UTC): meses compactados + ejecuciones pendientes de compactar
+CREATE OR REPLACE VIEW monthly_execution_totals AS
+SELECT
+    source,
+    month_start_date,
+    SUM(execution_count)::INT AS execution_count
+FROM (
+    SELECT source, month_start_date, execution_count
+    FROM monthly_execution_counts
+    UNION ALL
+    SELECT
+        source,
+        (date_trunc('month', executed_at AT TIME ZONE 'UTC'))::DATE AS month_start_date,
+        COUNT(*) AS execution_count
+    FROM execution_log
+    GROUP BY source, month_start_date
+) AS counts
+GROUP BY source, month_start_date;
+
+-----------------------------------------------------------------------------------
+
+-- Compacta en monthly_execution_counts las ejecuciones de los meses ya cerrados.
+-- El DELETE y el INSERT van en la misma sentencia, el conteo nunca se pierde ni se duplica.
+-- Programar junto con analyze_monthly_inactive_rules (pgAgent o cron), p. ej. una vez al dia.
+CREATE OR REPLACE PROCEDURE compact_execution_log()
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_compacted INT;
+BEGIN
+    WITH moved AS (
+        DELETE FROM execution_log
+        WHERE executed_at < (date_trunc('month', NOW() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+        RETURNING source, executed_at
+    )
+    INSERT INTO monthly_execution_counts AS mec (source, month_start_date, execution_count, last_updated_at)
+    SELECT
+        source,
+        (date_trunc('month', executed_at AT TIME ZONE 'UTC'))::DATE,
+        COUNT(*),
+        NOW()
+    FROM moved
+    GROUP BY 1, 2
+    ON CONFLICT (source, month_start_date) DO UPDATE SET
+        execution_count = mec.execution_count + EXCLUDED.execution_count,
+        last_updated_at = EXCLUDED.last_updated_at;
+
+    GET DIAGNOSTICS v_compacted = ROW_COUNT;
+    RAISE NOTICE 'Contadores mensuales compactados: %', v_compacted;
+END;
+$$;
+
+-----------------------------------------------------------------------------------
+
+-- Reglas inactivas todo el mes, por firewall (programar una vez al mes)
+CREATE OR REPLACE PROCEDURE analyze_monthly_inactive_rules(
+    p_year INT,
+    p_month INT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_month_start_date DATE;
+    v_month_end_date DATE;
+    v_expected_executions INT;
+    v_total_monthly_detections INT;
+BEGIN
+    -- 1. Calcular el rango de fechas para el mes
+    v_month_start_date := MAKE_DATE(p_year, p_month, 1);
+    v_month_end_date := (v_month_start_date + INTERVAL '1 month' - INTERVAL '1 day')::DATE;
+    
+    RAISE NOTICE 'Analizando inactividad para el mes: %-% (del % al %).', p_year, p_month, v_month_start_date, v_month_end_date;
+
+    -- 2. Obtener el número total de ejecuciones de la API para este mes (sumando todos los firewalls)
+    -- La vista suma los meses compactados y la bitacora execution_log (ver ContadorEjecuciones.sql)
+    SELECT SUM(execution_count)
+    INTO v_expected_executions
+    FROM monthly_execution_totals
+    WHERE month_start_date = v_month_start_date;
+
+    -- Si no hay registro de ejecuciones para el mes, no hay reglas que hayan estado inactivas todo el mes
+    IF v_expected_executions IS NULL OR v_expected_executions = 0 THEN
+        RAISE NOTICE 'No se encontraron registros de ejecuciones de la API para el mes %-%s. No se identificarán reglas totalmente inactivas.', p_year, p_month;
+        v_expected_executions := 0;
+    ELSE
+        RAISE NOTICE 'Total de ejecuciones de la API esperadas para el mes: %', v_expected_executions;
+    END IF;
+
+    -- 3. Identificar reglas que estuvieron inactivas TODOS los días del mes (en TODAS las ejecuciones
+    -- de su firewall). Solo si hubo ejecuciones de la API para ese mes
+    IF v_expected_executions > 0 THEN
+        INSERT INTO monthly_fully_inactive_rules (source, rule_id, month_start_date)
+        SELECT
+            irl.source,
+            irl.rule_id,
+            v_month_start_date
+        FROM
+            inactive_rule_log irl
+            JOIN monthly_execution_totals mec
+                ON mec.source = irl.source
+                AND mec.month_start_date = v_month_start_date
+        WHERE
+            irl.created_at::DATE >= v_month_start_date
+            AND irl.created_at::DATE <= v_month_end_date
+        GROUP BY
+            irl.source,
+            irl.rule_id,
+            mec.execution_count
+        -- Conteo de registros de inactividad para la regla debe ser igual al total de ejecuciones de su firewall
+        HAVING
+            COUNT(irl.log_id) = mec.execution_count
+        ON CONFLICT (source, rule_id, month_start_date) DO NOTHING;
+
+        GET DIAGNOSTICS v_total_monthly_detections = ROW_COUNT;
+        RAISE NOTICE 'Reglas totalmente inactivas insertadas/actualizadas: %', v_total_monthly_detections;
+    ELSE
+        RAISE NOTICE 'No se identificaron reglas totalmente inactivas debido a la falta de ejecuciones de la API.';
+    END IF;
+
+
+    -- 4. Calcular el conteo total de detecciones de inactividad para el mes
+    SELECT COUNT(log_id)
+    INTO v_total_monthly_detections
+    FROM inactive_rule_log
+    WHERE created_at::DATE >= v_month_start_date
+      AND created_at::DATE <= v_month_end_date;
+
+    -- 5. Insertar/Actualizar el conteo mensual en monthly_inactive_detection_counts
+    INSERT INTO monthly_inactive_detection_counts (total_detections, inactive_month)
+    VALUES (v_total_monthly_detections, v_month_start_date)
+    ON CONFLICT (inactive_month) DO UPDATE SET
+        total_detections = EXCLUDED.total_detections,
+        created_at = NOW();
+
+    RAISE NOTICE 'Conteo mensual de detecciones de inactividad (%s) registrado para %s.', v_total_monthly_detections, v_month_start_date;
+
+END;
+$$;
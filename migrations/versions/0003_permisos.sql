@@ -0,0 +1,33 @@
+-- 0003: Permisos de api_user y proccess_user (ver SQL/Crear database.sql).
+-- Si un rol no existe (p. ej. base de pruebas) sus permisos se omiten.
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'api_user') THEN
+        GRANT SELECT, INSERT, UPDATE ON rules TO api_user;
+        GRANT SELECT, INSERT ON rule_metrics TO api_user;
+        GRANT SELECT, INSERT ON inactive_rule_log TO api_user;
+        GRANT SELECT ON monthly_execution_counts TO api_user;
+        GRANT SELECT, INSERT ON execution_log TO api_user;
+        GRANT SELECT, INSERT, UPDATE ON rule_metrics_hourly TO api_user;
+        GRANT SELECT, INSERT, UPDATE ON rule_metrics_daily TO api_user;
+        GRANT USAGE ON SEQUENCE rule_metrics_id_seq TO api_user;
+        GRANT USAGE ON SEQUENCE inactive_rule_log_log_id_seq TO api_user;
+        GRANT USAGE ON SEQUENCE execution_log_log_id_seq TO api_user;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'proccess_user') THEN
+        GRANT SELECT ON rule_metrics TO proccess_user;
+        GRANT SELECT ON inactive_rule_log TO proccess_user;
+        GRANT SELECT ON rule_metrics_daily TO proccess_user;
+        GRANT SELECT, INSERT, UPDATE ON monthly_execution_counts TO proccess_user;
+        GRANT SELECT, DELETE ON execution_log TO proccess_user;
+        GRANT SELECT ON monthly_execution_totals TO proccess_user;
+        GRANT SELECT, INSERT ON monthly_fully_inactive_rules TO proccess_user;
+        GRANT SELECT, INSERT, UPDATE ON monthly_inactive_detection_counts TO proccess_user;
+        GRANT USAGE ON SEQUENCE monthly_execution_counts_count_id_seq TO proccess_user;
+        GRANT USAGE ON SEQUENCE monthly_fully_inactive_rules_monthly_log_id_seq TO proccess_user;
+        GRANT USAGE ON SEQUENCE monthly_inactive_detection_counts_count_id_seq TO proccess_user;
+    END IF;
+END
+$$;
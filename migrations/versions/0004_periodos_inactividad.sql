@@ -0,0 +1,166 @@
+-- 0004: Periodos de inactividad en lugar de una fila por regla inactiva en cada ejecucion.
+-- inactive_rule_log crecia ~8,600 filas por regla inactiva al mes (cron cada 5 minutos) y el
+-- procedimiento mensual contaba esas filas contra execution_count. Ahora cada regla inactiva
+-- tiene un periodo (inactive_since, last_seen_inactive) que se extiende mientras siga sin
+-- trafico y se cierra cuando vuelve a tener. inactive_rule_log se conserva como historial
+-- (y la API lo sigue llenando solo con INACTIVE_RULE_LOG=1).
+
+CREATE TABLE IF NOT EXISTS inactivity_spans (
+    span_id BIGSERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    rule_id BIGINT NOT NULL,
+    inactive_since TIMESTAMP WITH TIME ZONE NOT NULL,     -- Primera ejecucion con la regla inactiva
+    last_seen_inactive TIMESTAMP WITH TIME ZONE NOT NULL, -- Ultima ejecucion con la regla inactiva
+    closed_at TIMESTAMP WITH TIME ZONE,                   -- Ejecucion en que volvio a tener trafico (NULL = abierto)
+    samples INT NOT NULL DEFAULT 1,                       -- Ejecuciones dentro del periodo
+    CONSTRAINT fk_inactivity_spans_rule_id FOREIGN KEY (source, rule_id) REFERENCES rules (source, rule_id) ON DELETE RESTRICT
+) WITH (fillfactor = 80); -- Espacio libre para que extender un periodo sea un HOT update
+
+-- Un solo periodo abierto por regla (llave del ON CONFLICT de la ingesta)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_inactivity_spans_open ON inactivity_spans (source, rule_id) WHERE closed_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_inactivity_spans_source_since ON inactivity_spans (source, inactive_since);
+
+-----------------------------------------------------------------------------------
+
+-- Primera y ultima ejecucion de cada mes: un periodo cubre el mes si empieza antes de la
+-- primera y sigue abierto en la ultima (los meses ya compactados antes de esta version quedan en NULL)
+ALTER TABLE monthly_execution_counts ADD COLUMN IF NOT EXISTS first_executed_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE monthly_execution_counts ADD COLUMN IF NOT EXISTS last_executed_at TIMESTAMP WITH TIME ZONE;
+
+CREATE OR REPLACE VIEW monthly_execution_totals AS
+SELECT
+    source,
+    month_start_date,
+    SUM(execution_count)::INT AS execution_count,
+    MIN(first_executed_at) AS first_executed_at,
+    MAX(last_executed_at) AS last_executed_at
+FROM (
+    SELECT source, month_start_date, execution_count, first_executed_at, last_executed_at
+    FROM monthly_execution_counts
+    UNION ALL
+    SELECT
+        source,
+        (date_trunc('month', executed_at AT TIME ZONE 'UTC'))::DATE AS month_start_date,
+        COUNT(*) AS execution_count,
+        MIN(executed_at),
+        MAX(executed_at)
+    FROM execution_log
+    GROUP BY source, month_start_date
+) AS counts
+GROUP BY source, month_start_date;
+
+CREATE OR REPLACE PROCEDURE compact_execution_log()
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_compacted INT;
+BEGIN
+    WITH moved AS (
+        DELETE FROM execution_log
+        WHERE executed_at < (date_trunc('month', NOW() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+        RETURNING source, executed_at
+    )
+    INSERT INTO monthly_execution_counts AS mec (source, month_start_date, execution_count, first_executed_at, last_executed_at, last_updated_at)
+    SELECT
+        source,
+        (date_trunc('month', executed_at AT TIME ZONE 'UTC'))::DATE,
+        COUNT(*),
+        MIN(executed_at),
+        MAX(executed_at),
+        NOW()
+    FROM moved
+    GROUP BY 1, 2
+    ON CONFLICT (source, month_start_date) DO UPDATE SET
+        execution_count = mec.execution_count + EXCLUDED.execution_count,
+        first_executed_at = LEAST(mec.first_executed_at, EXCLUDED.first_executed_at),
+        last_executed_at = GREATEST(mec.last_executed_at, EXCLUDED.last_executed_at),
+        last_updated_at = EXCLUDED.last_updated_at;
+
+    GET DIAGNOSTICS v_compacted = ROW_COUNT;
+    RAISE NOTICE 'Contadores mensuales compactados: %', v_compacted;
+END;
+$$;
+
+-----------------------------------------------------------------------------------
+
+-- Reglas inactivas todo el mes, desde los periodos (una busqueda por regla en lugar de
+-- contar las filas de inactive_rule_log del mes)
+CREATE OR REPLACE PROCEDURE analyze_monthly_inactive_rules(
+    p_year INT,
+    p_month INT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_month_start_date DATE;
+    v_next_month_start TIMESTAMP WITH TIME ZONE;
+    v_expected_executions INT;
+    v_total_monthly_detections INT;
+BEGIN
+    -- 1. Calcular el rango del mes (UTC)
+    v_month_start_date := MAKE_DATE(p_year, p_month, 1);
+    v_next_month_start := (v_month_start_date + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC';
+
+    RAISE NOTICE 'Analizando inactividad para el mes: %-%.', p_year, p_month;
+
+    -- 2. Ejecuciones de la API en el mes (todos los firewalls)
+    SELECT SUM(execution_count)
+    INTO v_expected_executions
+    FROM monthly_execution_totals
+    WHERE month_start_date = v_month_start_date;
+
+    IF v_expected_executions IS NULL OR v_expected_executions = 0 THEN
+        RAISE NOTICE 'No se encontraron registros de ejecuciones de la API para el mes %-%. No se identificarán reglas totalmente inactivas.', p_year, p_month;
+    ELSE
+        -- 3. Reglas inactivas en TODAS las ejecuciones de su firewall: un periodo que empieza
+        -- antes (o en) la primera ejecucion del mes y sigue en la ultima
+        INSERT INTO monthly_fully_inactive_rules (source, rule_id, month_start_date)
+        SELECT DISTINCT
+            s.source,
+            s.rule_id,
+            v_month_start_date
+        FROM
+            inactivity_spans s
+            JOIN monthly_execution_totals m
+                ON m.source = s.source
+                AND m.month_start_date = v_month_start_date
+        WHERE
+            s.inactive_since <= m.first_executed_at
+            AND s.last_seen_inactive >= m.last_executed_at
+        ON CONFLICT (source, rule_id, month_start_date) DO NOTHING;
+
+        GET DIAGNOSTICS v_total_monthly_detections = ROW_COUNT;
+        RAISE NOTICE 'Reglas totalmente inactivas insertadas: %', v_total_monthly_detections;
+    END IF;
+
+    -- 4. Reglas que estuvieron inactivas en algun momento del mes (periodos que se cruzan con el mes)
+    SELECT COUNT(DISTINCT (source, rule_id))
+    INTO v_total_monthly_detections
+    FROM inactivity_spans
+    WHERE inactive_since < v_next_month_start
+      AND last_seen_inactive >= v_month_start_date::TIMESTAMP AT TIME ZONE 'UTC';
+
+    -- 5. Insertar/Actualizar el conteo mensual en monthly_inactive_detection_counts
+    INSERT INTO monthly_inactive_detection_counts (total_detections, inactive_month)
+    VALUES (v_total_monthly_detections, v_month_start_date)
+    ON CONFLICT (inactive_month) DO UPDATE SET
+        total_detections = EXCLUDED.total_detections,
+        created_at = NOW();
+
+    RAISE NOTICE 'Reglas con inactividad en el mes (%) registradas para %.', v_total_monthly_detections, v_month_start_date;
+END;
+$$;
+
+-----------------------------------------------------------------------------------
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'api_user') THEN
+        GRANT SELECT, INSERT, UPDATE ON inactivity_spans TO api_user;
+        GRANT USAGE ON SEQUENCE inactivity_spans_span_id_seq TO api_user;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'proccess_user') THEN
+        GRANT SELECT ON inactivity_spans TO proccess_user;
+    END IF;
+END
+$$;
@@ -0,0 +1,22 @@
+-- 0005: Llaves de los lotes recibidos para descartar reintentos y ejecuciones repetidas.
+-- Cada lote guardado registra su llave (Idempotency-Key del script o huella del contenido)
+-- en la misma transaccion que sus metricas; un lote con una llave vista dentro de la
+-- ventana (INGEST_DEDUPE_SECONDS) se confirma sin escribir nada mas. Las filas viejas
+-- se borran desde la API, la tabla solo guarda la ventana reciente.
+
+CREATE TABLE IF NOT EXISTS ingest_dedupe (
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    dedupe_key VARCHAR(160) NOT NULL,                  -- 'key:<Idempotency-Key>' o 'sha:<huella>'
+    received_at TIMESTAMP WITH TIME ZONE NOT NULL,     -- Timestamp del lote guardado con esta llave
+    PRIMARY KEY (source, dedupe_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_dedupe_received_at ON ingest_dedupe (received_at);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'api_user') THEN
+        GRANT SELECT, INSERT, UPDATE, DELETE ON ingest_dedupe TO api_user;
+    END IF;
+END
+$$;
@@ -0,0 +1,29 @@
+-- 0006: Lectura de rule_metrics con el almacenamiento por cambios (SUPPRESS_UNCHANGED=1).
+-- En ese modo una regla sin cambios no escribe muestra en cada ejecucion: solo al cambiar
+-- algun contador y una vez por periodo de heartbeat (que divide la hora, asi rule_metrics_hourly,
+-- rule_metrics_daily y las vistas sobre ellos no cambian). Una muestra vale hasta la siguiente
+-- muestra guardada de la misma regla; esta vista expone ese limite para las consultas que
+-- leen las muestras crudas. Con todas las muestras (modo por defecto) la vista tambien es valida.
+
+CREATE OR REPLACE VIEW rule_metrics_runs AS
+SELECT
+    m.*,
+    -- Los contadores de la muestra se mantienen hasta next_sample_at (NULL = ultima muestra guardada)
+    LEAD(m.timestamp) OVER (PARTITION BY m.source, m.rule_id ORDER BY m.timestamp) AS next_sample_at
+FROM rule_metrics m;
+
+-- Uso: contadores de cada regla de un firewall en un momento dado
+--   SELECT rule_id, bytes_matched FROM rule_metrics_runs
+--   WHERE source = 'fw1' AND timestamp <= '2025-07-01 12:00+00'
+--     AND (next_sample_at > '2025-07-01 12:00+00' OR next_sample_at IS NULL);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'api_user') THEN
+        GRANT SELECT ON rule_metrics_runs TO api_user;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'proccess_user') THEN
+        GRANT SELECT ON rule_metrics_runs TO proccess_user;
+    END IF;
+END
+$$;
@@ -0,0 +1,17 @@
+-- 0007: Rol de solo lectura para el engine de lectura de la API (DB_READ_ENGINE=1, ver models/replica.py).
+-- Con un rol aparte en el mismo servidor las consultas de reportes tienen su propio limite
+-- de conexiones y de tiempo; en una replica el rol llega con la replicacion.
+-- Si el rol no existe (ver SQL/Crear database.sql) sus permisos se omiten.
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'read_user') THEN
+        -- Tablas y vistas que leen /api/v1/inactive y /api/v1/idle (las particiones se leen por la tabla padre)
+        GRANT SELECT ON rules, rule_metrics, rule_metrics_hourly, rule_metrics_daily, rule_metrics_runs,
+            inactivity_spans, execution_log, monthly_execution_counts, monthly_execution_totals, inactive_rule_log TO read_user;
+        -- Aunque la conexion no lo pida, el rol no escribe y sus consultas tienen limite
+        ALTER ROLE read_user SET default_transaction_read_only = on;
+        ALTER ROLE read_user SET statement_timeout = '30s';
+    END IF;
+END
+$$;
@@ -0,0 +1,22 @@
+-- 0008: Estado de los lotes encolados por la ingesta asincrona (INGEST_ASYNC=1).
+-- GET /api/v1/data/<batch_id> lo consulta aqui cuando el lote lo encolo otro worker
+-- de gunicorn. Cada lote se registra como 'queued' al encolarse y pasa a 'committed'
+-- o 'failed' cuando el hilo escritor termina su grupo. Las filas viejas se borran
+-- desde la API (INGEST_STATUS_SECONDS).
+
+CREATE TABLE IF NOT EXISTS ingest_batches (
+    batch_id VARCHAR(32) PRIMARY KEY,                  -- uuid4 en hexadecimal (respuesta 202)
+    source VARCHAR(64) NOT NULL DEFAULT 'default',
+    status VARCHAR(16) NOT NULL,                       -- queued | committed | failed
+    received_at TIMESTAMP WITH TIME ZONE NOT NULL      -- Timestamp del lote
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_batches_received_at ON ingest_batches (received_at);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'api_user') THEN
+        GRANT SELECT, INSERT, UPDATE, DELETE ON ingest_batches TO api_user;
+    END IF;
+END
+$$;
@@ -0,0 +1,102 @@
+# async_model.py
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from logger.logger import Logger
+from models.model import BDModel
+from models.pool import InstrumentedAsyncQueuePool
+from models.replica import ReadRouter, read_settings, read_url, read_pool_options
+
+class AsyncBDModel:
+    """
+    Engine asincrono (SQLAlchemy asyncio + asyncpg) para la variante ASGI (asgi.py).
+
+    Las consultas de la API pasan por el engine asincrono: mientras una espera a
+    PostgreSQL, el event loop atiende otras peticiones con las mismas conexiones.
+    Las migraciones y la creacion de particiones (DDL, una vez por periodo) siguen
+    en el BDModel de psycopg2 con las mismas variables de entorno.
+    """
+
+    def __init__(self):
+        self.logger = Logger(__name__)
+        self.bd_model = BDModel()
+        self.engine = None
+        self.Session = None
+        self.read_engine = None
+        self.reads = None
+
+    def connect_to_database(self):
+        """Configura el engine de psycopg2 (migraciones, particiones) y el de asyncpg (sin conectarse todavia)."""
+        self.bd_model.connect_to_database()
+        try:
+            url = self.bd_model.engine.url.set(drivername="postgresql+asyncpg")
+            options = self.bd_model.pool_options()
+            options["poolclass"] = InstrumentedAsyncQueuePool
+            self.engine = create_async_engine(url, **options)
+            # Sesiones sincronas sobre el engine asincrono: solo se usan dentro de
+            # greenlet_spawn (ver services/async_service.py), donde cada consulta cede el event loop
+            self.Session = sessionmaker(bind=self.engine.sync_engine)
+            self.connect_read_engine(options)
+        except SQLAlchemyError as e:
+            self.logger.critical("Error creando el engine asincrono de PostgreSQL: %s", e)
+            raise
+        except Exception as e:
+            self.logger.critical("Ocurrio un error durante la conexion asincrona a PostgreSQL: %s", e)
+            raise
+
+    def connect_read_engine(self, pool_options: dict):
+        """Engine de lectura sobre asyncpg con la configuracion de BDModel.connect_read_engine."""
+        settings = read_settings()
+        read_sessions = None
+        if settings["enabled"]:
+            url = read_url(self.engine.url, settings)
+            self.read_engine = create_async_engine(url, **read_pool_options(pool_options, settings, driver="asyncpg"))
+            read_sessions = sessionmaker(bind=self.read_engine.sync_engine)
+            self.logger.info("Engine de lectura asincrono en %s:%s/%s (usuario %s).", url.host, url.port, url.database, url.username)
+        self.reads = ReadRouter(self.Session, read_sessions, settings)
+
+    def check_schema(self) -> int:
+        return self.bd_model.check_schema()
+
+    def migrate(self, target: int = None) -> list:
+        return self.bd_model.migrate(target)
+
+    def maintain_partitions(self, moment=None) -> list:
+        return self.bd_model.maintain_partitions(moment)
+
+    def check_partitions(self, moment=None):
+        # Solo consulta el catalogo la primera vez que ve un periodo
+        self.bd_model.check_partitions(moment)
+
+    def get_session(self):
+        """Sesion sobre el engine asincrono. Solo se puede usar dentro de greenlet_spawn."""
+        return self.Session()
+
+    def get_read_session(self):
+        """Sesion para las consultas de lectura (ver BDModel.get_read_session). Solo dentro de greenlet_spawn."""
+        return self.reads.session()
+
+    def get_pool_stats(self) -> dict:
+        """Estado del pool del engine asincrono de este proceso."""
+        if self.engine is None or not isinstance(self.engine.pool, InstrumentedAsyncQueuePool):
+            return {}
+        return self.engine.pool.usage()
+
+    def get_read_stats(self) -> dict:
+        """Uso del engine de lectura asincrono y estado de su pool."""
+        if self.reads is None:
+            return {}
+        stats = self.reads.stats()
+        if self.read_engine is not None and isinstance(self.read_engine.pool, InstrumentedAsyncQueuePool):
+            stats["pool"] = self.read_engine.pool.usage()
+        return stats
+
+    async def close_connection(self):
+        """Cierra las conexiones de los engines."""
+        if self.read_engine:
+            await self.read_engine.dispose()
+        if self.engine:
+            await self.engine.dispose()
+            self.logger.info("PostgreSQL engine asincrono detenido (conexiones cerradas).")
+        self.bd_model.close_connection()
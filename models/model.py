@@ -3,34 +3,56 @@
 import os
 from datetime import datetime, timezone
 from logger.logger import Logger
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, text, ForeignKey, Date
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, text, ForeignKeyConstraint, UniqueConstraint, Date, Boolean, func
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.schema import Index
+from models.partition import PartitionManager
+from models.pool import InstrumentedQueuePool, PoolStats
+from models.replica import ReadRouter, read_settings, read_url, read_pool_options
+from migrations.runner import MigrationRunner
 
+# Las clases solo describen las tablas para el ORM: el esquema se crea y se cambia
+# con los scripts de migrations/versions (python manage.py migrate)
 Base = declarative_base()
 
+# Firewall al que se asignan los datos que llegan sin identificador (instalacion de un solo pfSense)
+DEFAULT_SOURCE = "default"
+
+def source_column(primary_key=False):
+    """Columna con el identificador del firewall (source) que envio los datos."""
+    return Column(String(64), primary_key=primary_key, nullable=False, default=DEFAULT_SOURCE, server_default=DEFAULT_SOURCE)
+
+def utc_now():
+    """Hora actual en UTC, evaluada en cada insercion (no al importar el modulo)."""
+    return datetime.now(timezone.utc)
+
 class Rule(Base):
     __tablename__ = 'rules'
 
+    # El id de pf solo es unico dentro de un firewall
+    source = source_column(primary_key=True)
     rule_id = Column(BigInteger, primary_key=True)
     rule_label = Column(String(255), nullable=False)
     rule_description = Column(String(500), nullable=True)
-    created_at = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now(), nullable=False)
 
     __table_args__ = (
-        Index('idx_rules_rule_label', 'rule_label'),
+        Index('idx_rules_source_rule_label', 'source', 'rule_label'),
     )
 
     def __repr__(self):
-        return f"<Rule(rule_id={self.rule_id}, rule_label='{self.rule_label}', created_at='{self.created_at}')>"
+        return f"<Rule(source='{self.source}', rule_id={self.rule_id}, rule_label='{self.rule_label}', created_at='{self.created_at}')>"
 
 class RuleMetric(Base):
     __tablename__ = 'rule_metrics'
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    timestamp = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
-    rule_id = Column(BigInteger, ForeignKey('rules.rule_id', ondelete='RESTRICT'), nullable=False)
+    # Tabla particionada por rango de timestamp (ver models/partition.py),
+    # la llave de la particion debe formar parte de la llave primaria
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, default=utc_now, server_default=func.now(), nullable=False)
+    source = source_column()
+    rule_id = Column(BigInteger, nullable=False)
     evaluations = Column(BigInteger, nullable=False)
     packets_matched = Column(BigInteger, nullable=False)
     bytes_matched = Column(BigInteger, nullable=False)
@@ -38,46 +60,192 @@ class RuleMetric(Base):
     state_packets = Column(BigInteger, nullable=False)
     state_bytes = Column(BigInteger, nullable=False)
     input_output = Column(BigInteger, nullable=True)
+    # Deltas contra la muestra anterior de la misma regla (ver services/snapshot.py)
+    evaluations_delta = Column(BigInteger, nullable=True)
+    packets_matched_delta = Column(BigInteger, nullable=True)
+    bytes_matched_delta = Column(BigInteger, nullable=True)
+    states_created_delta = Column(BigInteger, nullable=True)
+    counter_reset = Column(Boolean, nullable=False, default=False, server_default=text('false'))
 
     __table_args__ = (
-        Index('idx_rule_metrics_rule_id', 'rule_id'),
+        ForeignKeyConstraint(['source', 'rule_id'], ['rules.source', 'rules.rule_id'], ondelete='RESTRICT'),
         Index('idx_rule_metrics_timestamp', 'timestamp'),
-        Index('idx_rule_metrics_rule_id_timestamp', 'rule_id', 'timestamp', unique=False),
+        # Las busquedas siempre son por firewall y regla (y rango de tiempo)
+        Index('idx_rule_metrics_source_rule_id_timestamp', 'source', 'rule_id', 'timestamp', unique=False),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
     )
 
     def __repr__(self):
-        return f"<RuleMetric(id={self.id}, rule_id={self.rule_id}, timestamp='{self.timestamp}')>"
+        return f"<RuleMetric(id={self.id}, source='{self.source}', rule_id={self.rule_id}, timestamp='{self.timestamp}')>"
     
 class InactiveRuleLog(Base):
     __tablename__ = 'inactive_rule_log'
 
-    log_id = Column(Integer, primary_key=True, autoincrement=True)
-    rule_id = Column(BigInteger, ForeignKey('rules.rule_id', ondelete='RESTRICT'), nullable=False)
-    created_at = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
+    # Tabla particionada por rango de created_at (ver models/partition.py)
+    log_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    source = source_column()
+    rule_id = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), primary_key=True, default=utc_now, server_default=func.now(), nullable=False)
 
     __table_args__ = (
-        Index('idx_inactive_rule_log_rule_id', 'rule_id'),
+        ForeignKeyConstraint(['source', 'rule_id'], ['rules.source', 'rules.rule_id'], ondelete='RESTRICT'),
+        Index('idx_inactive_rule_log_source_rule_id', 'source', 'rule_id'),
         Index('idx_inactive_rule_log_created_at', 'created_at'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
     )
 
     def __repr__(self):
-        return f"<InactiveRuleLog(id={self.log_id}, rule_id='{self.rule_id}', created_at='{self.created_at}')>"
+        return f"<InactiveRuleLog(id={self.log_id}, source='{self.source}', rule_id='{self.rule_id}', created_at='{self.created_at}')>"
     
 class MonthlyExecutionCount(Base):
     __tablename__ = 'monthly_execution_counts'
 
     count_id = Column(Integer, primary_key=True, autoincrement=True)
-    month_start_date = Column(Date, nullable=False, unique=True) # Unique constraint a nivel de columna
+    # Un contador por firewall y mes: cada firewall solo actualiza su propia fila
+    source = source_column()
+    month_start_date = Column(Date, nullable=False)
     execution_count = Column(Integer, nullable=False, default=0)
-    last_updated_at = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
+    # Primera y ultima ejecucion del mes (las llena compact_execution_log)
+    first_executed_at = Column(DateTime(timezone=True), nullable=True)
+    last_executed_at = Column(DateTime(timezone=True), nullable=True)
+    last_updated_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # El indice de la restriccion UNIQUE sirve para las busquedas por firewall y mes
+        UniqueConstraint('source', 'month_start_date', name='uq_monthly_execution_count'),
+    )
+
+    def __repr__(self):
+        return f"<MonthlyExecutionCount(source='{self.source}', month={self.month_start_date}, count={self.execution_count})>"
+
+class ExecutionLog(Base):
+    __tablename__ = 'execution_log'
+
+    # Una fila por ejecucion (lote) de cada firewall, solo INSERT: las ingestas
+    # simultaneas no comparten ninguna fila. Los meses cerrados se compactan en
+    # monthly_execution_counts (ver SQL/ContadorEjecuciones.sql).
+    log_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    source = source_column()
+    executed_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_execution_log_executed_at', 'executed_at'),
+    )
+
+    def __repr__(self):
+        return f"<ExecutionLog(id={self.log_id}, source='{self.source}', executed_at='{self.executed_at}')>"
+
+class InactivitySpan(Base):
+    __tablename__ = 'inactivity_spans'
+
+    # Periodo en que una regla estuvo inactiva en ejecuciones seguidas: se extiende
+    # mientras siga sin trafico y se cierra (closed_at) cuando vuelve a tener
+    span_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    source = source_column()
+    rule_id = Column(BigInteger, nullable=False)
+    inactive_since = Column(DateTime(timezone=True), nullable=False)
+    last_seen_inactive = Column(DateTime(timezone=True), nullable=False)
+    closed_at = Column(DateTime(timezone=True), nullable=True)
+    samples = Column(Integer, nullable=False, default=1, server_default=text('1'))
+
+    __table_args__ = (
+        ForeignKeyConstraint(['source', 'rule_id'], ['rules.source', 'rules.rule_id'], ondelete='RESTRICT'),
+        # Un solo periodo abierto por regla
+        Index('uq_inactivity_spans_open', 'source', 'rule_id', unique=True, postgresql_where=text('closed_at IS NULL')),
+        Index('idx_inactivity_spans_source_since', 'source', 'inactive_since'),
+        # La tabla se crea con fillfactor = 80 (ver migrations/versions/0004)
+    )
+
+    def __repr__(self):
+        return f"<InactivitySpan(source='{self.source}', rule_id={self.rule_id}, since='{self.inactive_since}', last='{self.last_seen_inactive}', closed='{self.closed_at}')>"
+
+class IngestDedupe(Base):
+    __tablename__ = 'ingest_dedupe'
+
+    # Llave de cada lote guardado (Idempotency-Key o huella del contenido) para
+    # confirmar los reintentos sin volver a escribir. Solo se conserva la ventana reciente.
+    source = source_column(primary_key=True)
+    dedupe_key = Column(String(160), primary_key=True)
+    received_at = Column(DateTime(timezone=True), nullable=False)
 
     __table_args__ = (
-        # No se necesita Index explícito si month_start_date ya es UNIQUE
-        # Index('idx_monthly_execution_counts_month', 'month_start_date'),
+        Index('idx_ingest_dedupe_received_at', 'received_at'),
     )
 
     def __repr__(self):
-        return f"<MonthlyExecutionCount(month={self.month_start_date}, count={self.execution_count})>"
+        return f"<IngestDedupe(source='{self.source}', key='{self.dedupe_key}', received_at='{self.received_at}')>"
+
+class IngestBatch(Base):
+    __tablename__ = 'ingest_batches'
+
+    # Estado de cada lote de la ingesta asincrona, para consultarlo desde cualquier worker
+    batch_id = Column(String(32), primary_key=True)
+    source = source_column()
+    status = Column(String(16), nullable=False)
+    received_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('idx_ingest_batches_received_at', 'received_at'),
+    )
+
+    def __repr__(self):
+        return f"<IngestBatch(batch_id='{self.batch_id}', source='{self.source}', status='{self.status}')>"
+
+class RuleMetricRollupMixin:
+    """
+    Columnas comunes de las tablas de agregados por regla y periodo (hora/dia).
+    Se mantienen con ON CONFLICT en la misma transaccion de la ingesta.
+    Las columnas <contador>_delta se llaman igual que en rule_metrics para
+    poder sumar cualquiera de las tres fuentes con la misma expresion.
+    """
+
+    source = source_column(primary_key=True)
+    rule_id = Column(BigInteger, primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True) # Inicio del periodo en UTC
+    sample_count = Column(Integer, nullable=False, default=0)
+    first_sample_at = Column(DateTime(timezone=True), nullable=False)
+    last_sample_at = Column(DateTime(timezone=True), nullable=False)
+
+    evaluations_first = Column(BigInteger, nullable=False)
+    evaluations_last = Column(BigInteger, nullable=False)
+    evaluations_delta = Column(BigInteger, nullable=False, default=0)
+    evaluations_delta_min = Column(BigInteger, nullable=False)
+    evaluations_delta_max = Column(BigInteger, nullable=False)
+
+    packets_matched_first = Column(BigInteger, nullable=False)
+    packets_matched_last = Column(BigInteger, nullable=False)
+    packets_matched_delta = Column(BigInteger, nullable=False, default=0)
+    packets_matched_delta_min = Column(BigInteger, nullable=False)
+    packets_matched_delta_max = Column(BigInteger, nullable=False)
+
+    bytes_matched_first = Column(BigInteger, nullable=False)
+    bytes_matched_last = Column(BigInteger, nullable=False)
+    bytes_matched_delta = Column(BigInteger, nullable=False, default=0)
+    bytes_matched_delta_min = Column(BigInteger, nullable=False)
+    bytes_matched_delta_max = Column(BigInteger, nullable=False)
+
+    states_created_first = Column(BigInteger, nullable=False)
+    states_created_last = Column(BigInteger, nullable=False)
+    states_created_delta = Column(BigInteger, nullable=False, default=0)
+    states_created_delta_min = Column(BigInteger, nullable=False)
+    states_created_delta_max = Column(BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}(source='{self.source}', rule_id={self.rule_id}, bucket_start='{self.bucket_start}', samples={self.sample_count})>"
+
+class RuleMetricHourly(RuleMetricRollupMixin, Base):
+    __tablename__ = 'rule_metrics_hourly'
+
+    __table_args__ = (
+        Index('idx_rule_metrics_hourly_bucket_start', 'bucket_start'),
+    )
+
+class RuleMetricDaily(RuleMetricRollupMixin, Base):
+    __tablename__ = 'rule_metrics_daily'
+
+    __table_args__ = (
+        Index('idx_rule_metrics_daily_bucket_start', 'bucket_start'),
+    )
 
 
 class BDModel:
@@ -85,11 +253,15 @@ class BDModel:
     def __init__(self):
         self.engine = None
         self.Session = None
-        self.logger = Logger()
-        self.db_name = "test_db"
+        # Engine opcional para las consultas de lectura de la API (DB_READ_ENGINE=1, ver models/replica.py)
+        self.read_engine = None
+        self.reads = None
+        self.partitions = None
+        self.logger = Logger(__name__)
+        self.db_name = os.environ.get("POSTGRES_DB", "test_db")
 
     def connect_to_database(self):
-        """Funcion para conectarse a PostgreSQL y iniciar SQLAlchemy engine."""
+        """Funcion para configurar el SQLAlchemy engine de PostgreSQL (sin conectarse todavia)."""
         db_user = os.environ.get("POSTGRES_USER", "api_user")
         db_password = os.environ.get("POSTGRES_PASSWORD", "pass")
         db_host = os.environ.get("POSTGRES_HOST", "localhost")
@@ -101,40 +273,145 @@ class BDModel:
 
         DATABASE_URL = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{self.db_name}"
 
-        self.logger.debug(f"URL: {DATABASE_URL}")
+        self.logger.debug("URL: %s", DATABASE_URL)
 
         try:
-            self.engine = create_engine(DATABASE_URL)
-            with self.engine.connect() as connection:
-                connection.execute(text("SELECT 1"))
-                self.logger.info("Conectado a PostgreSQL exitosamente.")
-            
-            # Crear las tablas si no existen (importante: Las tablas deben estar definidas)
-            Base.metadata.create_all(self.engine)
-            self.logger.debug(f"Table '{Rule.__tablename__}' asegurate que exista.")
-            self.logger.debug(f"Table '{RuleMetric.__tablename__}' asegurate que exista.")
-            self.logger.debug(f"Table '{InactiveRuleLog.__tablename__}' asegurate que exista.")
-            self.logger.debug(f"Table '{MonthlyExecutionCount.__tablename__}' asegurate que exista.")
-
+            # create_engine no abre conexiones: la primera se abre en check_schema
+            # o en la primera consulta. El esquema lo crea `python manage.py migrate`.
+            self.engine = create_engine(DATABASE_URL, **self.pool_options())
+            # Las particiones las crea `python manage.py partitions`; la API solo verifica que existan
+            self.partitions = PartitionManager(self.engine)
             self.Session = sessionmaker(bind=self.engine)
+            self.connect_read_engine()
 
         except SQLAlchemyError as e:
-            self.logger.critical(f"Error conectando a PostgreSQL o creando tabla: {e}")
+            self.logger.critical("Error creando el engine de PostgreSQL: %s", e)
             raise
         except Exception as e:
-            self.logger.critical(f"Ocurrio un error durante la conexion a PostgreSQL: {e}")
+            self.logger.critical("Ocurrio un error durante la conexion a PostgreSQL: %s", e)
+            raise
+
+    def connect_read_engine(self):
+        """
+        Configura el engine de lectura si DB_READ_ENGINE=1: replica (READ_POSTGRES_HOST...)
+        o un rol y pool aparte en el mismo servidor. Sin el, las lecturas usan el engine principal.
+        """
+        settings = read_settings()
+        read_sessions = None
+        if settings["enabled"]:
+            url = read_url(self.engine.url, settings)
+            self.read_engine = create_engine(url, **read_pool_options(self.pool_options(), settings))
+            read_sessions = sessionmaker(bind=self.read_engine)
+            self.logger.info("Engine de lectura en %s:%s/%s (usuario %s).", url.host, url.port, url.database, url.username)
+        self.reads = ReadRouter(self.Session, read_sessions, settings)
+
+    def check_schema(self) -> int:
+        """
+        Verifica con una sola consulta que la base este en la ultima version de
+        migrations/versions. Con MIGRATE_ON_START=1 aplica las migraciones pendientes;
+        si no, detiene el arranque para no atender con un esquema viejo.
+        """
+        runner = MigrationRunner(self.engine)
+        head = runner.head()
+        try:
+            current = runner.current()
+        except SQLAlchemyError as e:
+            self.logger.critical("Error conectando a PostgreSQL: %s", e)
             raise
+        if current >= head:
+            self.logger.info("Conectado a PostgreSQL, esquema en la version %s.", current)
+            return current
+        if os.environ.get("MIGRATE_ON_START", "0") == "1":
+            self.migrate()
+            return head
+        self.logger.critical("El esquema esta en la version %s y la API espera la %s.", current, head)
+        raise RuntimeError(f"Esquema desactualizado ({current} < {head}): ejecuta `python manage.py migrate`")
+
+    def migrate(self, target: int = None) -> list:
+        """Aplica las migraciones pendientes y crea las particiones del periodo actual."""
+        applied = MigrationRunner(self.engine).migrate(target)
+        self.partitions.maintain()
+        return applied
+
+    def pool_options(self) -> dict:
+        """
+        Opciones del pool de conexiones desde variables de entorno.
+
+        DB_POOL_SIZE: conexiones que se mantienen abiertas (por defecto 5).
+        DB_MAX_OVERFLOW: conexiones extra en rafagas (por defecto 10).
+        DB_POOL_TIMEOUT: segundos de espera por una conexion libre (por defecto 30).
+        DB_POOL_RECYCLE: segundos de vida de una conexion, -1 = sin limite (por defecto 1800).
+        DB_POOL_PRE_PING: "1" (por defecto) valida la conexion antes de usarla.
+        """
+        return {
+            "poolclass": InstrumentedQueuePool,
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+            "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+            "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+            "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+        }
+
+    def reset_after_fork(self):
+        """
+        Llamar en cada proceso hijo (post_fork de gunicorn) cuando la app se cargo antes del fork.
+        Descarta las conexiones heredadas sin cerrarlas (siguen siendo del proceso padre)
+        y el engine abre conexiones nuevas para este proceso.
+        """
+        if self.engine:
+            self.engine.dispose(close=False)
+            if isinstance(self.engine.pool, InstrumentedQueuePool):
+                # Los contadores heredados son del proceso padre
+                self.engine.pool.stats = PoolStats()
+            if self.read_engine:
+                self.read_engine.dispose(close=False)
+                self.read_engine.pool.stats = PoolStats()
+            self.logger.debug("Pool de conexiones reiniciado despues del fork.")
+
+    def get_pool_stats(self) -> dict:
+        """Estado del pool y tiempos de espera por conexion de este proceso."""
+        if self.engine is None or not isinstance(self.engine.pool, InstrumentedQueuePool):
+            return {}
+        return self.engine.pool.usage()
+
+    def get_read_stats(self) -> dict:
+        """Uso del engine de lectura (sesiones, fallbacks a la principal) y estado de su pool."""
+        if self.reads is None:
+            return {}
+        stats = self.reads.stats()
+        if self.read_engine is not None and isinstance(self.read_engine.pool, InstrumentedQueuePool):
+            stats["pool"] = self.read_engine.pool.usage()
+        return stats
 
     def close_connection(self):
         """Funcion para cerrar la conexion a PostgreSQL."""
+        if self.read_engine:
+            self.read_engine.dispose()
         if self.engine:
             self.engine.dispose()
             self.logger.info("PostgreSQL engine detenido (conexiones cerradas).")
 
+    def maintain_partitions(self, moment=None) -> list:
+        """Crea las particiones faltantes para `moment` y aplica la retencion configurada (rol dueno de las tablas)."""
+        if self.partitions:
+            return self.partitions.maintain(moment)
+        return []
+
+    def check_partitions(self, moment=None):
+        """Verifica que exista la particion de `moment` antes de guardar (no crea nada, ver PartitionManager)."""
+        if self.partitions:
+            self.partitions.check_partitions(moment)
+
     def get_session(self):
         """Crea una nueva SQLAlchemy session."""
         if self.Session:
             return self.Session()
         else:
             self.logger.critical("No se ha iniciado la sesion. Usa connect_to_database primero.")
-            raise RuntimeError("Base de datos no conectada.")
\ No newline at end of file
+            raise RuntimeError("Base de datos no conectada.")
+
+    def get_read_session(self):
+        """Sesion para las consultas de lectura de la API: engine de lectura o, si no hay, la principal."""
+        if self.reads is None:
+            return self.get_session()
+        return self.reads.session()
\ No newline at end of file
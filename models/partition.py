@@ -0,0 +1,216 @@
+# partition.py
+
+import os
+import re
+import threading
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import text
+from logger.logger import Logger
+
+class MissingPartitionError(RuntimeError):
+    """No existe la particion del periodo de un lote (la API no las crea)."""
+
+class PartitionManager:
+    """
+    Administra las particiones por rango de tiempo de las tablas historicas.
+
+    Crea por adelantado las particiones de los siguientes periodos y, si se
+    configura una retencion, elimina (DROP) o separa (DETACH) las particiones
+    completas que ya salieron del periodo de retencion, en lugar de borrar fila por fila.
+
+    Crear y eliminar particiones requiere ser dueno de las tablas: lo hacen
+    `python manage.py partitions` (cron), `migrate` y `backfill` con el rol dueno.
+    La API (api_user, solo SELECT/INSERT) unicamente verifica con check_partitions
+    que exista la particion del periodo antes de guardar.
+
+    Variables de entorno:
+        PARTITION_INTERVAL: "month" (por defecto) o "day".
+        PARTITION_PREMAKE: periodos a crear por adelantado (por defecto 3).
+        PARTITION_RETENTION: periodos a conservar, 0 = sin limite (por defecto 0).
+        PARTITION_RETENTION_MODE: "drop" (por defecto) o "detach".
+    """
+
+    # Tabla particionada -> columna de tiempo usada como llave de la particion
+    TABLES = {
+        "rule_metrics": "timestamp",
+        "inactive_rule_log": "created_at",
+    }
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.logger = Logger(__name__)
+        self.interval = os.environ.get("PARTITION_INTERVAL", "month")
+        self.premake = int(os.environ.get("PARTITION_PREMAKE", "3"))
+        self.retention = int(os.environ.get("PARTITION_RETENTION", "0"))
+        self.retention_mode = os.environ.get("PARTITION_RETENTION_MODE", "drop")
+        if self.interval not in ("month", "day"):
+            raise ValueError("PARTITION_INTERVAL debe ser 'month' o 'day'")
+        if self.retention_mode not in ("drop", "detach"):
+            raise ValueError("PARTITION_RETENTION_MODE debe ser 'drop' o 'detach'")
+        # Inicio de los periodos que ya se sabe que tienen particion
+        self._known_periods = set()
+        self._lock = threading.Lock()
+
+    def period_start(self, moment: datetime) -> datetime:
+        """Inicio (UTC) del periodo que contiene el momento dado."""
+        moment = moment.astimezone(timezone.utc)
+        start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.interval == "month":
+            start = start.replace(day=1)
+        return start
+
+    def next_period(self, start: datetime) -> datetime:
+        """Inicio del periodo siguiente."""
+        if self.interval == "day":
+            return start + timedelta(days=1)
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+
+    def previous_period(self, start: datetime) -> datetime:
+        """Inicio del periodo anterior."""
+        if self.interval == "day":
+            return start - timedelta(days=1)
+        if start.month == 1:
+            return start.replace(year=start.year - 1, month=12)
+        return start.replace(month=start.month - 1)
+
+    def partition_name(self, table: str, start: datetime) -> str:
+        """Nombre de la particion, p. ej. rule_metrics_p2025_07 o rule_metrics_p2025_07_15."""
+        if self.interval == "day":
+            return f"{table}_p{start:%Y_%m_%d}"
+        return f"{table}_p{start:%Y_%m}"
+
+    def check_partitions(self, moment: datetime = None) -> None:
+        """
+        Verifica que todas las tablas tengan una particion para `moment`, sin crearla
+        (solo lee el catalogo). Cada periodo se consulta una vez por proceso.
+
+        Raises:
+            MissingPartitionError: si falta la particion; se crea con `python manage.py partitions`.
+        """
+        moment = moment or datetime.now(timezone.utc)
+        start = self.period_start(moment)
+        if start in self._known_periods:
+            return
+        with self.engine.connect() as connection:
+            for table in self.TABLES:
+                if not any(first <= moment < end for _, first, end in self._list_partitions(connection, table)):
+                    self.logger.critical(
+                        "No existe la particion de %s para %s: ejecuta `python manage.py partitions` con el rol dueno de las tablas.",
+                        table, moment
+                    )
+                    raise MissingPartitionError(f"Falta la particion de {table} para {moment.isoformat()}")
+        with self._lock:
+            self._known_periods.add(start)
+
+    def ensure_partitions(self, moment: datetime = None, until: datetime = None) -> None:
+        """
+        Garantiza que existan las particiones del periodo de `moment` y de los
+        siguientes PARTITION_PREMAKE periodos. Con `until` se crean ademas todos
+        los periodos hasta el de `until` (cargas de historicos).
+        Si ya se conocen no toca la base de datos. Requiere el rol dueno de las tablas.
+        """
+        start = self.period_start(moment or datetime.now(timezone.utc))
+        periods = [start]
+        if until is not None:
+            last = self.period_start(until)
+            while periods[-1] < last:
+                periods.append(self.next_period(periods[-1]))
+        for _ in range(self.premake):
+            periods.append(self.next_period(periods[-1]))
+
+        missing = [period for period in periods if period not in self._known_periods]
+        if not missing:
+            return
+
+        with self._lock:
+            # Una transaccion propia: el bloqueo de CREATE ... PARTITION OF no se mezcla con la ingesta
+            with self.engine.begin() as connection:
+                for period in missing:
+                    self._create_partitions(connection, period)
+            self._known_periods.update(missing)
+
+    def _create_partitions(self, connection, start: datetime) -> None:
+        """Internal method to create the partitions of one period for every table."""
+        end = self.next_period(start)
+        for table in self.TABLES:
+            name = self.partition_name(table, start)
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            self.logger.debug("Particion %s asegurada.", name)
+
+    def maintain(self, moment: datetime = None) -> list[str]:
+        """
+        Crea las particiones faltantes y aplica la retencion configurada (rol dueno de
+        las tablas). Regresa las particiones eliminadas o separadas.
+        """
+        moment = moment or datetime.now(timezone.utc)
+        self.ensure_partitions(moment)
+        if self.retention <= 0:
+            return []
+        return self.apply_retention(moment)
+
+    def retention_cutoff(self, moment: datetime = None) -> datetime:
+        """Inicio del periodo mas antiguo que se conserva (None si no hay retencion)."""
+        if self.retention <= 0:
+            return None
+        cutoff = self.period_start(moment or datetime.now(timezone.utc))
+        for _ in range(self.retention):
+            cutoff = self.previous_period(cutoff)
+        return cutoff
+
+    def apply_retention(self, moment: datetime = None) -> list[str]:
+        """Elimina o separa las particiones que terminan antes del periodo de retencion."""
+        cutoff = self.retention_cutoff(moment)
+        removed = []
+        with self._lock, self.engine.begin() as connection:
+            for table in self.TABLES:
+                for name, _, end in self._list_partitions(connection, table):
+                    if end > cutoff:
+                        continue
+                    if self.retention_mode == "detach":
+                        connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    else:
+                        connection.execute(text(f"DROP TABLE {name}"))
+                    removed.append(name)
+                    self.logger.info("Particion %s fuera de retencion (%s).", name, self.retention_mode)
+        return removed
+
+    def list_partitions(self) -> dict:
+        """Particiones existentes por tabla: {tabla: [(nombre, inicio, fin)]} ordenadas por inicio."""
+        with self.engine.connect() as connection:
+            return {
+                table: sorted(self._list_partitions(connection, table), key=lambda partition: partition[1])
+                for table in self.TABLES
+            }
+
+    def _list_partitions(self, connection, table: str) -> list[tuple]:
+        """Internal method to list (name, period start, period end) of the partitions of a table."""
+        pattern = re.compile(rf"^{table}_p(\d{{4}})_(\d{{2}})(?:_(\d{{2}}))?$")
+        result = connection.execute(text("""
+            SELECT c.relname
+            FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :table
+        """), {"table": table})
+
+        partitions = []
+        for (name,) in result:
+            match = pattern.match(name)
+            if not match:
+                continue
+            year, month, day = match.groups()
+            start = datetime(int(year), int(month), int(day or 1), tzinfo=timezone.utc)
+            # El fin depende del formato del nombre, no del intervalo configurado hoy
+            if day:
+                end = start + timedelta(days=1)
+            elif start.month == 12:
+                end = start.replace(year=start.year + 1, month=1)
+            else:
+                end = start.replace(month=start.month + 1)
+            partitions.append((name, start, end))
+        return partitions
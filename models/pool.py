@@ -0,0 +1,96 @@
+# pool.py
+
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+class PoolStats:
+    """
+    Contadores de la espera para obtener una conexion del pool.
+
+    Se comparten entre los pools que recrea el engine (dispose despues de fork),
+    cada worker de gunicorn tiene los suyos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        # Checkouts que encontraron todas las conexiones ocupadas (pool_size + max_overflow)
+        self.saturated = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float, saturated: bool, timed_out: bool) -> None:
+        """Registra un checkout (o un intento que agoto pool_timeout)."""
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if saturated:
+                self.saturated += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        """Copia de los contadores, con la espera en milisegundos."""
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "saturated_checkouts": self.saturated,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+            }
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuanto espera cada checkout y si el pool estaba saturado."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        # engine.dispose() crea un pool nuevo; los contadores se conservan
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def capacity(self) -> int:
+        """Conexiones maximas (pool_size + max_overflow), None si el overflow no tiene limite."""
+        if self._max_overflow < 0:
+            return None
+        return self.size() + self._max_overflow
+
+    def _do_get(self):
+        capacity = self.capacity()
+        saturated = capacity is not None and self.checkedout() >= capacity
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - start, saturated, timed_out)
+
+    def usage(self) -> dict:
+        """Estado actual del pool y contadores de espera."""
+        capacity = self.capacity()
+        checked_out = self.checkedout()
+        usage = {
+            "pool_size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": checked_out,
+            "checked_in": self.checkedin(),
+            "overflow": self.overflow(),
+            "saturation": round(checked_out / capacity, 3) if capacity else None,
+        }
+        usage.update(self.stats.snapshot())
+        return usage
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool para el engine asincrono (asyncpg): la espera por una conexion no bloquea el event loop."""
@@ -0,0 +1,153 @@
+# replica.py
+
+import os
+import threading
+import time
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from logger.logger import Logger
+
+def read_settings() -> dict:
+    """
+    Configuracion del engine de solo lectura desde variables de entorno.
+
+    DB_READ_ENGINE: "1" separa las consultas de lectura de la API en su propio engine (por defecto 0).
+    READ_POSTGRES_HOST, READ_POSTGRES_PORT, READ_POSTGRES_USER, READ_POSTGRES_PASSWORD, READ_POSTGRES_DB:
+        replica o rol de solo lectura; cada una toma por defecto la de POSTGRES_*.
+    DB_READ_POOL_SIZE / DB_READ_MAX_OVERFLOW / DB_READ_POOL_TIMEOUT: pool de lectura (por defecto 3 / 2 / 10).
+    DB_READ_STATEMENT_TIMEOUT_MS: limite de cada consulta de lectura (por defecto 30000, 0 = sin limite).
+    DB_READ_CONNECT_TIMEOUT: segundos para conectar al engine de lectura antes de usar la base principal (por defecto 5).
+    DB_READ_RETRY_SECONDS: tiempo sin intentar el engine de lectura despues de un error de conexion (por defecto 30).
+    """
+    return {
+        "enabled": os.environ.get("DB_READ_ENGINE", "0") == "1",
+        "host": os.environ.get("READ_POSTGRES_HOST"),
+        "port": os.environ.get("READ_POSTGRES_PORT"),
+        "username": os.environ.get("READ_POSTGRES_USER"),
+        "password": os.environ.get("READ_POSTGRES_PASSWORD"),
+        "database": os.environ.get("READ_POSTGRES_DB"),
+        "pool_size": int(os.environ.get("DB_READ_POOL_SIZE", "3")),
+        "max_overflow": int(os.environ.get("DB_READ_MAX_OVERFLOW", "2")),
+        "pool_timeout": float(os.environ.get("DB_READ_POOL_TIMEOUT", "10")),
+        "statement_timeout_ms": int(os.environ.get("DB_READ_STATEMENT_TIMEOUT_MS", "30000")),
+        "connect_timeout": int(os.environ.get("DB_READ_CONNECT_TIMEOUT", "5")),
+        "retry_seconds": float(os.environ.get("DB_READ_RETRY_SECONDS", "30")),
+    }
+
+def read_url(primary_url, settings: dict):
+    """URL del engine de lectura: la de la base principal con los READ_POSTGRES_* que se hayan definido."""
+    overrides = {key: settings[key] for key in ("host", "port", "username", "password", "database") if settings[key]}
+    if "port" in overrides:
+        overrides["port"] = int(overrides["port"])
+    return primary_url.set(**overrides)
+
+def read_pool_options(pool_options: dict, settings: dict, driver: str = "psycopg2") -> dict:
+    """
+    Opciones del engine de lectura: las del pool principal (clase, recycle, pre_ping)
+    con su propio tamano, y conexiones que abren en solo lectura con el statement_timeout configurado.
+    """
+    server_settings = {"default_transaction_read_only": "on"}
+    if settings["statement_timeout_ms"] > 0:
+        server_settings["statement_timeout"] = str(settings["statement_timeout_ms"])
+    if driver == "asyncpg":
+        connect_args = {"server_settings": server_settings, "timeout": settings["connect_timeout"]}
+    else:
+        connect_args = {
+            "options": " ".join(f"-c {name}={value}" for name, value in server_settings.items()),
+            "connect_timeout": settings["connect_timeout"],
+        }
+    options = dict(pool_options)
+    options.update({
+        "pool_size": settings["pool_size"],
+        "max_overflow": settings["max_overflow"],
+        "pool_timeout": settings["pool_timeout"],
+        "connect_args": connect_args,
+    })
+    return options
+
+class ReadRouter:
+    """
+    Sesiones para las consultas de lectura de la API (reglas inactivas y periodos).
+
+    Con DB_READ_ENGINE=1 usan su propio engine (replica o rol de solo lectura) con
+    un pool aparte: una consulta larga nunca ocupa las conexiones que necesita la
+    ingesta. Si el engine de lectura no se puede conectar, las lecturas pasan a la
+    base principal durante DB_READ_RETRY_SECONDS, en una transaccion de solo
+    lectura con el mismo statement_timeout. Si el pool de lectura esta lleno no se
+    usa la principal: la consulta espera (DB_READ_POOL_TIMEOUT) o falla.
+
+    Sin engine de lectura las lecturas usan la sesion principal como antes.
+    """
+
+    def __init__(self, primary_session_factory, read_session_factory=None, settings: dict = None):
+        self.logger = Logger(__name__)
+        self.primary_session_factory = primary_session_factory
+        self.read_session_factory = read_session_factory
+        self.settings = settings or read_settings()
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        # Lecturas atendidas por cada engine y errores de conexion del engine de lectura
+        self.read_sessions = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.read_session_factory is not None
+
+    def available(self) -> bool:
+        with self._lock:
+            return self.enabled and time.monotonic() >= self._down_until
+
+    def session(self):
+        """Sesion para una consulta de lectura (la conexion ya esta abierta)."""
+        if not self.enabled:
+            return self.primary_session_factory()
+        if self.available():
+            session = self.read_session_factory()
+            try:
+                # Se abre la conexion aqui para saber si hay que usar la principal
+                session.connection()
+                with self._lock:
+                    self.read_sessions += 1
+                return session
+            except DBAPIError as e:
+                session.close()
+                self._mark_down(e)
+        return self._fallback_session()
+
+    def _mark_down(self, error) -> None:
+        """Internal method to stop using the read engine for DB_READ_RETRY_SECONDS."""
+        with self._lock:
+            self.failures += 1
+            self._down_until = time.monotonic() + self.settings["retry_seconds"]
+        self.logger.error("Engine de lectura no disponible, se usa la base principal por %s s: %s", self.settings["retry_seconds"], error)
+
+    def _fallback_session(self):
+        """Internal method to open a read-only transaction with the read statement_timeout on the primary."""
+        session = self.primary_session_factory()
+        try:
+            session.execute(text("SET TRANSACTION READ ONLY"))
+            if self.settings["statement_timeout_ms"] > 0:
+                session.execute(
+                    text("SELECT set_config('statement_timeout', :timeout, true)"),
+                    {"timeout": str(self.settings["statement_timeout_ms"])}
+                )
+        except Exception:
+            session.close()
+            raise
+        with self._lock:
+            self.fallbacks += 1
+        return session
+
+    def stats(self) -> dict:
+        """Contadores para /api/v1/stats."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "available": self.enabled and time.monotonic() >= self._down_until,
+                "read_sessions": self.read_sessions,
+                "fallbacks": self.fallbacks,
+                "failures": self.failures,
+                "statement_timeout_ms": self.settings["statement_timeout_ms"],
+            }
@@ -0,0 +1,254 @@
+from quart import Blueprint, Response, current_app, request, jsonify
+from logger.logger import Logger
+from marshmallow import ValidationError
+from schemas.schemaDate import IdleRulesSchema, TopRulesSchema
+from metrics.metrics import REGISTRY, StageTimer, INGEST_STAGE_SECONDS, INGEST_BATCH_RULES, INGEST_BATCHES, INACTIVE_QUERY_SECONDS
+from services.dedupe import BatchDeduplicator
+from wire.wire import BodyDecodeError, MSGPACK_MIMETYPES, COMPRESSION_MIN_BYTES, content_encoding, aiter_decoded_lines, decode_body, iter_msgpack_lines, negotiate_encoding, compress, acompress_stream, dumps_line
+from routes.route import PFRequestMixin
+import time as clock
+
+class AsyncPFRoute(PFRequestMixin, Blueprint):
+    """
+    Las mismas rutas que PFRoute sobre Quart (ASGI), para asgi.py.
+
+    Un proceso atiende muchas peticiones a la vez en un solo event loop: mientras
+    un lote espera a PostgreSQL (asyncpg) se siguen leyendo los cuerpos de otros
+    firewalls. Los parametros, validaciones y respuestas son los de PFRoute
+    (PFRequestMixin). No hay cola de ingesta: cada lote se guarda antes de responder.
+    """
+
+    request = request
+
+    def __init__(self, schema_class, schema_date, service, strict_validation=False, schema_idle=None, summary_response=False, schema_top=None):
+        super().__init__("pf_routes", __name__)
+        self.logger = Logger(__name__)
+        self.schema_class = schema_class
+        self.strict_validation = strict_validation
+        self.schema_date = schema_date
+        self.schema_idle = schema_idle or IdleRulesSchema()
+        self.schema_top = schema_top or TopRulesSchema()
+        # AsyncService
+        self.service = service
+        self.ingest_queue = None
+        self.summary_response = summary_response
+        REGISTRY.collector("pf_routes", self.collect_metrics)
+        self.register_routes()
+
+    def register_routes(self):
+        """Function to register the routes"""
+        self.route("/api/v1/data", methods=["POST"])(self.update)
+        self.route("/api/v1/data/<batch_id>", methods=["GET"])(self.batch_status)
+        self.route("/api/v1/inactive", methods=["GET"])(self.InactiveRules)
+        self.route("/api/v1/idle", methods=["GET"])(self.IdleRules)
+        self.route("/api/v1/rules/top", methods=["GET"])(self.TopRules)
+        self.route("/api/v1/healthcheck", methods=["GET"])(self.healthcheck)
+        self.route("/api/v1/stats", methods=["GET"])(self.stats)
+        self.route("/metrics", methods=["GET"])(self.metrics)
+        self.after_request(self.compress_response)
+
+    async def read_request_rules(self, timer: StageTimer, digest=None) -> list:
+        """
+        Lee, interpreta y combina las reglas del cuerpo (mismos formatos que
+        PFRoute.iter_request_lines). El text/plain se procesa por fragmentos
+        conforme llega, sin esperar el cuerpo completo.
+        Lanza BodyDecodeError si el cuerpo no se puede decodificar.
+        """
+        encoding = content_encoding(request.headers.get("Content-Encoding"))
+        merged = {}
+        if request.mimetype == "text/plain":
+            async for raw_lines in timer.aiter("decode", aiter_decoded_lines(request.body, encoding)):
+                if digest is not None:
+                    for raw_line in raw_lines:
+                        digest.update(raw_line)
+                lines = (raw_line.decode("utf-8", errors="replace").rstrip("\r\n") for raw_line in raw_lines)
+                parsed_rules = timer.iter("parse", self.iter_parsed_rules(lines))
+                with timer.stage("merge"):
+                    self.merge_duplicate_rules(parsed_rules, merged)
+            return list(merged.values())
+
+        data = await request.get_data()
+        with timer.stage("decode"):
+            body = decode_body(data, encoding)
+            if digest is not None:
+                digest.update(body)
+            if request.mimetype in MSGPACK_MIMETYPES:
+                raw_lines = list(iter_msgpack_lines(body))
+            elif encoding is None and not request.is_json:
+                raw_lines = []
+            else:
+                try:
+                    raw_lines = current_app.json.loads(body)
+                except ValueError as e:
+                    raise BodyDecodeError(f"JSON invalido: {e}") from e
+                if not isinstance(raw_lines, list):
+                    raw_lines = []
+        parsed_rules = timer.iter("parse", self.iter_parsed_rules(raw_lines))
+        with timer.stage("merge"):
+            return self.merge_duplicate_rules(parsed_rules, merged)
+
+    async def update(self):
+        """
+        Recibe el volcado de un firewall y lo guarda (igual que PFRoute.update, sin cola).
+        """
+        try:
+            source = self.request_source()
+            if source is None:
+                self.logger.warning("Identificador de firewall invalido")
+                return jsonify({"error": "Identificador de firewall invalido"}), 422
+
+            dedupe_key, digest, entry = self.start_dedupe(source)
+            if entry is not None:
+                return jsonify(self.duplicate_payload(source, dedupe_key, entry)), 200
+
+            timer = StageTimer(INGEST_STAGE_SECONDS)
+            filtered_data = await self.read_request_rules(timer, digest)
+            if not filtered_data:
+                INGEST_BATCHES.inc(result="empty")
+                self.logger.error("No se recibierón datos")
+                return jsonify({"error": "No se recibieron datos"}), 400
+
+            dedupe_key, entry = self.finish_dedupe(source, dedupe_key, digest)
+            if entry is not None:
+                timer.observe()
+                return jsonify(self.duplicate_payload(source, dedupe_key, entry)), 200
+
+            self.logger.debug("Reglas recibidas de %s: %s", source, len(filtered_data))
+
+            if self.strict_validation:
+                with timer.stage("validation"):
+                    filtered_data = self.validate_records(filtered_data)
+                self.logger.debug_payload("Datos validados correctamente: %s", filtered_data)
+            timer.observe()
+            INGEST_BATCH_RULES.observe(len(filtered_data))
+
+            result = await self.service.add_metrics(filtered_data, source, dedupe_key)
+            if result == BatchDeduplicator.DUPLICATE:
+                return jsonify(self.duplicate_payload(source, dedupe_key)), 200
+            response, status = self.ingest_result(result, source, filtered_data)
+            return jsonify(response), status
+
+        except BodyDecodeError as err:
+            INGEST_BATCHES.inc(result="invalid")
+            self.logger.warning("Cuerpo de la peticion invalido: %s", err)
+            return jsonify({"error": str(err)}), err.status
+        except ValidationError as err:
+            INGEST_BATCHES.inc(result="invalid")
+            self.logger.warning("Ocurrieron errores de validación")
+            self.logger.info("Errores de validación completos: %s", err.messages)
+            return jsonify({"error": "Datos invalidos"}), 422
+        except Exception as e:
+            self.logger.critical("Error critico: %s", e)
+            return jsonify({"error": "Error interno"}), 500
+        finally:
+            self.logger.info("Función finalizada")
+
+    async def batch_status(self, batch_id):
+        """Sin cola de ingesta no hay lotes pendientes que consultar."""
+        return jsonify({"error": "La ingesta asincrona no esta habilitada"}), 404
+
+    async def InactiveRules(self):
+        """Endpoint para buscar reglas sin uso (mismos parametros que PFRoute.InactiveRules)."""
+        try:
+            start_date, end_date, query_options, validated_data = self.load_inactive_query()
+
+            if validated_data['formato'] == "ndjson":
+                rows = self.service.iter_inactive_rules(start_date, end_date, **query_options)
+                return Response(self.iter_ndjson(rows, clock.perf_counter()), mimetype="application/x-ndjson")
+
+            with INACTIVE_QUERY_SECONDS.time(format="json"):
+                inactive_rules = await self.service.get_inactive_rules(start_date, end_date, **query_options)
+
+            response = self.page_response({"status": "success", "inactive_rules": inactive_rules}, inactive_rules, validated_data['limite'])
+            return jsonify(response), 200
+
+        except ValidationError as err:
+            response, status = self.invalid_query(err)
+            return jsonify(response), status
+        except Exception as e:
+            self.logger.critical("Error critico: %s", e)
+            return jsonify({"error": "Error interno"}), 500
+
+    async def IdleRules(self):
+        """Endpoint para buscar reglas inactivas a partir de los periodos (mismos parametros que PFRoute.IdleRules)."""
+        try:
+            query_options, limit = self.load_idle_query()
+
+            with INACTIVE_QUERY_SECONDS.time(format="idle"):
+                idle_rules = await self.service.get_idle_rules(**query_options)
+
+            response = self.page_response({"status": "success", "idle_rules": idle_rules}, idle_rules, limit)
+            return jsonify(response), 200
+
+        except ValidationError as err:
+            response, status = self.invalid_query(err)
+            return jsonify(response), status
+        except Exception as e:
+            self.logger.critical("Error critico: %s", e)
+            return jsonify({"error": "Error interno"}), 500
+
+    async def TopRules(self):
+        """Endpoint para buscar las reglas con mas (o menos) trafico (mismos parametros que PFRoute.TopRules)."""
+        try:
+            start_date, end_date, query_options = self.load_top_query()
+
+            with INACTIVE_QUERY_SECONDS.time(format="top"):
+                top_rules = await self.service.get_top_rules(start_date, end_date, **query_options)
+            if not top_rules:
+                return jsonify({"error": "Error interno"}), 500
+
+            return jsonify(self.top_response(top_rules, start_date, end_date, query_options)), 200
+
+        except ValidationError as err:
+            response, status = self.invalid_query(err)
+            return jsonify(response), status
+        except Exception as e:
+            self.logger.critical("Error critico: %s", e)
+            return jsonify({"error": "Error interno"}), 500
+
+    async def iter_ndjson(self, rows, started_at: float = None):
+        """Serializa cada regla en una linea JSON. Un error a media respuesta solo se registra."""
+        count = 0
+        try:
+            async for row in rows:
+                count += 1
+                yield dumps_line(row)
+        except Exception as e:
+            self.logger.critical("Error critico enviando reglas inactivas: %s", e)
+        else:
+            self.logger.info("Se enviaron %s reglas inactivas en ndjson.", count)
+        finally:
+            await rows.aclose()
+            if started_at is not None:
+                INACTIVE_QUERY_SECONDS.observe(clock.perf_counter() - started_at, format="ndjson")
+
+    async def stats(self):
+        """Function to expose the in-memory cache counters and the DB pool usage"""
+        return jsonify(self.stats_payload()), 200
+
+    async def metrics(self):
+        """Function to expose the process metrics in the Prometheus text format"""
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    async def compress_response(self, response):
+        """Igual que PFRoute.compress_response: gzip o zstd segun Accept-Encoding, el NDJSON por fragmentos."""
+        if response.status_code < 200 or response.status_code in (204, 304) or "Content-Encoding" in response.headers:
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        if isinstance(response.response, response.iterable_body_class):
+            response.response = response.iterable_body_class(acompress_stream(response.response.iter, encoding))
+            response.headers.pop("Content-Length", None)
+        else:
+            data = await response.get_data()
+            if len(data) < COMPRESSION_MIN_BYTES:
+                return response
+            response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    async def healthcheck(self):
+        """Function to check the health of the services API inside the docker container"""
+        return jsonify({"status": "Up"}), 200
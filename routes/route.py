@@ -1,25 +1,395 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from logger.logger import Logger
 from marshmallow import ValidationError
-from datetime import datetime, time
+from schemas.record import RuleMetricRecord
+from schemas.schemaDate import IdleRulesSchema, TopRulesSchema, MISSING_CURSOR_SOURCE
+from models.model import DEFAULT_SOURCE
+from metrics.metrics import REGISTRY, StageTimer, INGEST_STAGE_SECONDS, INGEST_BATCH_RULES, INGEST_BATCHES, INGEST_UNPARSABLE_LINES, INACTIVE_QUERY_SECONDS
+from services.dedupe import BatchDeduplicator
+from services.topk import window_range
+from wire.wire import BodyDecodeError, MSGPACK_MIMETYPES, COMPRESSION_MIN_BYTES, content_encoding, iter_decoded_lines, decode_body, iter_msgpack_lines, negotiate_encoding, compress, compress_stream, dumps_line
+from datetime import datetime, time, timedelta, timezone
+import hashlib
+import time as clock
 import re
 
-class PFRoute(Blueprint):
+# Prefijo de las reglas personalizadas dentro de `pfctl -s all`
+USER_RULE_PREFIX = "USER_RULE"
+
+# Se compila una sola vez para todas las lineas
+PFCTL_LINE_PATTERN = re.compile(
+    r'^(USER_RULE:?\s*(.*?))\s+id:(\d+)\s+'  # USER_RULE prefix, label, id
+    r'(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)' # 7 numeric counters
+)
+
+# Identificador de firewall aceptado en ?firewall= o en el encabezado X-Firewall-Id
+FIREWALL_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+# Encabezado Idempotency-Key: el script envia la misma llave en todos los reintentos de una ejecucion
+IDEMPOTENCY_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,128}$')
+
+class PFRequestMixin:
+    """
+    Lo que comparten PFRoute (Flask) y AsyncPFRoute (Quart): interpretar el volcado,
+    leer los parametros de la peticion y armar las respuestas. `request` es el
+    objeto de peticion del framework de cada subclase.
+    """
+
+    request = None
+
+    def request_source(self) -> str:
+        """
+        Firewall que envia el lote: parametro 'firewall' o encabezado X-Firewall-Id.
+        Sin identificador se usa DEFAULT_SOURCE. Regresa None si no es valido.
+        """
+        source = self.request.args.get("firewall") or self.request.headers.get("X-Firewall-Id") or DEFAULT_SOURCE
+        if not FIREWALL_PATTERN.match(source):
+            return None
+        return source
+
+    def request_idempotency_key(self) -> str:
+        """
+        Llave del lote a partir del encabezado Idempotency-Key ('' si no viene).
+        Regresa None si no es valida.
+        """
+        key = self.request.headers.get("Idempotency-Key")
+        if key is None:
+            return ""
+        if not IDEMPOTENCY_KEY_PATTERN.match(key):
+            return None
+        return "key:" + key
+
+    def summary_requested(self) -> bool:
+        """
+        Respuesta resumida de /api/v1/data (solo conteos, sin repetir el lote):
+        'respuesta=resumen|completa' o el encabezado Prefer: return=minimal|representation.
+        Sin ninguno se usa el valor por defecto (INGEST_RESPONSE).
+        """
+        mode = self.request.args.get("respuesta")
+        if mode in ("resumen", "completa"):
+            return mode == "resumen"
+        prefer = self.request.headers.get("Prefer", "")
+        if "return=minimal" in prefer:
+            return True
+        if "return=representation" in prefer:
+            return False
+        return self.summary_response
+
+    def parse_pfctl_line(self, line: str) -> RuleMetricRecord:
+        """Parses a single pfctl statistics line."""
+        match = PFCTL_LINE_PATTERN.match(line)
+
+        if match:
+            # La expresion ya garantiza que los contadores son enteros
+            return RuleMetricRecord(
+                int(match.group(3)),        # id
+                match.group(2).strip(),     # label
+                int(match.group(4)),        # evaluations
+                int(match.group(5)),        # packets_matched
+                int(match.group(6)),        # bytes_matched
+                int(match.group(7)),        # states_created
+                int(match.group(8)),        # state_packets
+                int(match.group(9)),        # state_bytes
+                int(match.group(10))        # input_output
+            )
+        else:
+            INGEST_UNPARSABLE_LINES.inc()
+            self.logger.warning("No se pudo interpretar la linea: %s", line)
+            return None
+
+    def iter_parsed_rules(self, lines):
+        """Parses only the USER_RULE lines of an iterable, one at a time."""
+        for line in lines:
+            # El volcado completo trae NAT, scrub, TIMEOUTS, etc. Solo nos interesan las reglas de usuario
+            if not isinstance(line, str) or not line.startswith(USER_RULE_PREFIX):
+                continue
+            parsed_rule = self.parse_pfctl_line(line)
+            if parsed_rule:
+                yield parsed_rule
+
+    def merge_duplicate_rules(self, rules, merged: dict = None) -> list[RuleMetricRecord]:
+        """
+        Merge the duplicated rules registered.
+
+        Consume cualquier iterable (p. ej. el generador de iter_parsed_rules), por lo que
+        solo se mantiene en memoria un registro por id de regla. Los registros
+        recibidos se reutilizan, no se copian. `merged` (id -> registro) permite
+        combinar el cuerpo por partes (variante ASGI).
+        """
+        merged = {} if merged is None else merged
+        for rule in rules:
+            current = merged.get(rule.id)
+            if current is not None:
+                # Suma los valores numéricos
+                current.merge(rule)
+            else:
+                merged[rule.id] = rule
+        return list(merged.values())
+
+    def validate_records(self, records: list[RuleMetricRecord]) -> list[RuleMetricRecord]:
+        """
+        Validacion completa con Marshmallow (modo estricto).
+        Lanza ValidationError igual que Schema.load.
+        """
+        schema_instance = self.schema_class(many=True)
+        validated_data = schema_instance.load([record.to_dict() for record in records])
+        return [RuleMetricRecord.from_dict(data) for data in validated_data]
+
+    def start_dedupe(self, source: str) -> tuple:
+        """
+        Llave del lote antes de leer el cuerpo: (dedupe_key, digest, entry).
+        Con Idempotency-Key, `entry` es el lote que ya se recibio con ella (duplicado);
+        sin ella, `digest` acumula la huella del cuerpo conforme se lee.
+        Lanza BodyDecodeError (422) si la llave no es valida.
+        """
+        dedupe = self.service.dedupe
+        dedupe_key = self.request_idempotency_key()
+        if dedupe_key is None:
+            raise BodyDecodeError("Idempotency-Key invalida", 422)
+        if not dedupe.enabled:
+            return None, None, None
+        if dedupe_key:
+            return dedupe_key, None, dedupe.lookup(source, dedupe_key)
+        return None, hashlib.blake2b(digest_size=16), None
+
+    def finish_dedupe(self, source: str, dedupe_key: str, digest) -> tuple:
+        """Llave del lote ya leido: (dedupe_key, entry) con la huella del cuerpo si no vino Idempotency-Key."""
+        if digest is None:
+            return dedupe_key, None
+        dedupe_key = "sha:" + digest.hexdigest()
+        return dedupe_key, self.service.dedupe.lookup(source, dedupe_key)
+
+    def duplicate_payload(self, source: str, dedupe_key: str, entry: dict = None) -> dict:
+        """Cuerpo de la respuesta (200) para un lote que ya se habia recibido."""
+        INGEST_BATCHES.inc(result="duplicate")
+        self.logger.info("Lote duplicado de %s (%s), no se guarda de nuevo", source, dedupe_key)
+        response = {"message": "Lote duplicado, ya se habia recibido", "firewall": source, "duplicate": True}
+        if entry is not None and entry["batch_id"] is not None:
+            response["batch_id"] = entry["batch_id"]
+        return response
+
+    def ingest_result(self, result, source: str, records: list[RuleMetricRecord]) -> tuple:
+        """Respuesta de /api/v1/data para el resultado de Service.add_metrics: (cuerpo, status)."""
+        INGEST_BATCHES.inc(result="saved" if result == True else "error")
+        if (result == True):
+            self.logger.info("Registro exitoso")
+            response = {"message": "Registro exitoso"}
+            status = 200
+        else:
+            self.logger.info("Ocurrio un error al guardar la informacion en la base de datos")
+            response = {"message": "Ocurrio un error al guardar la informacion en la base de datos"}
+            status = 400
+        if self.summary_requested():
+            # Solo conteos: la respuesta no crece con el lote
+            response.update({"firewall": source, "rules": len(records)})
+        else:
+            response["data"] = [record.to_dict() for record in records]
+        return response, status
+
+    def load_inactive_query(self) -> tuple:
+        """
+        Valida los parametros de /api/v1/inactive. Regresa (fecha inicial, fecha final,
+        opciones de la consulta, datos validados). Lanza ValidationError.
+        """
+        # Validacion de datos recibidos (solo se envian los opcionales presentes)
+        query_params = {
+            "fechaInicio": self.request.args.get('fechaInicio'),
+            "fechaFin": self.request.args.get('fechaFin')
+        }
+        for optional in ("tolerancia", "metrica", "limite", "despues", "formato", "firewall", "despuesFirewall"):
+            if optional in self.request.args:
+                query_params[optional] = self.request.args.get(optional)
+
+        self.logger.debug("Datos recibidos: %s", query_params)
+
+        validated_data = self.schema_date.load(query_params)
+
+        # Las fechas ya son objetos datetime.date gracias a fields.Date
+        # Convierte datetime.date a datetime.datetime y establece la hora
+        # Para start_date, queremos el inicio del día
+        start_date = datetime.combine(validated_data['fechaInicio'], time.min) # 00:00:00.000000
+
+        # Para end_date, queremos el final del día
+        end_date = datetime.combine(validated_data['fechaFin'], time.max) # 23:59:59.999999
+
+        query_options = {
+            "tolerance": validated_data['tolerancia'],
+            "metric": validated_data['metrica'],
+            "after": validated_data['despues'],
+            "limit": validated_data['limite'],
+            "source": validated_data['firewall'],
+            "after_source": validated_data['despuesFirewall']
+        }
+        return start_date, end_date, query_options, validated_data
+
+    def load_idle_query(self) -> tuple:
+        """Valida los parametros de /api/v1/idle. Regresa (opciones de Service.get_idle_rules, limite)."""
+        query_params = {
+            name: self.request.args.get(name)
+            for name in ("dias", "mes", "limite", "despues", "firewall", "despuesFirewall")
+            if name in self.request.args
+        }
+        self.logger.debug("Datos recibidos: %s", query_params)
+
+        validated_data = self.schema_idle.load(query_params)
+        query_options = {
+            "min_days": validated_data['dias'],
+            "month": validated_data['mes'],
+            "source": validated_data['firewall'],
+            "after": validated_data['despues'],
+            "after_source": validated_data['despuesFirewall'],
+            "limit": validated_data['limite']
+        }
+        return query_options, validated_data['limite']
+
+    def invalid_query(self, err: ValidationError) -> tuple:
+        """
+        Respuesta (cuerpo, status) para los parametros invalidos de /api/v1/inactive, /api/v1/idle y /api/v1/rules/top.
+        Una pagina de toda la flota sin 'despuesFirewall' es una peticion incompleta (400).
+        """
+        self.logger.warning("Ocurrieron errores de validación")
+        self.logger.info("Errores de validación completos: %s", err.messages)
+        if isinstance(err.messages, dict) and MISSING_CURSOR_SOURCE in err.messages.get("despuesFirewall", []):
+            return {"error": MISSING_CURSOR_SOURCE}, 400
+        return {"error": "Datos invalidos"}, 422
+
+    def load_top_query(self) -> tuple:
+        """Valida los parametros de /api/v1/rules/top. Regresa (inicio, fin exclusivo, opciones de Service.get_top_rules)."""
+        query_params = {
+            name: self.request.args.get(name)
+            for name in ("ventana", "fechaInicio", "fechaFin", "metrica", "orden", "limite", "firewall")
+            if name in self.request.args
+        }
+        self.logger.debug("Datos recibidos: %s", query_params)
+
+        validated_data = self.schema_top.load(query_params)
+        if validated_data['ventana'] is not None:
+            start_date, end_date = window_range(validated_data['ventana'])
+        else:
+            # Dias completos en UTC; fechaFin es inclusiva
+            start_date = datetime.combine(validated_data['fechaInicio'], time.min, tzinfo=timezone.utc)
+            end_date = datetime.combine(validated_data['fechaFin'] + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        query_options = {
+            "metric": validated_data['metrica'],
+            "order": validated_data['orden'],
+            "limit": validated_data['limite'],
+            "source": validated_data['firewall']
+        }
+        return start_date, end_date, query_options
+
+    def top_response(self, top_rules: dict, start_date: datetime, end_date: datetime, query_options: dict) -> dict:
+        """Respuesta de /api/v1/rules/top para el resultado de Service.get_top_rules."""
+        return {
+            "status": "success",
+            "top_rules": top_rules["rules"],
+            "metrica": query_options["metric"],
+            "orden": query_options["order"],
+            "desde": start_date.isoformat(),
+            "hasta": end_date.isoformat(),
+            "total": top_rules["total"],
+            "reglas": top_rules["rules_counted"],
+            "cache": top_rules["cached"]
+        }
+
+    def page_response(self, response: dict, rows: list[dict], limit: int) -> dict:
+        """Agrega la llave de la siguiente pagina ('siguiente', 'siguienteFirewall') si se pidio un limite."""
+        if limit is not None:
+            # Pagina llena: puede haber mas reglas despues de la ultima (firewall, rule_id)
+            last = rows[-1] if len(rows) == limit else None
+            response["siguiente"] = last["rule_id"] if last else None
+            response["siguienteFirewall"] = last["firewall"] if last else None
+        return response
+
+    def stats_payload(self) -> dict:
+        """Contadores de los caches en memoria, del pool de conexiones y de la cola de ingesta."""
+        response = {"status": "success", "caches": self.service.get_cache_stats(), "pool": self.service.get_pool_stats()}
+        reads = self.service.get_read_stats()
+        if reads.get("enabled"):
+            response["read_pool"] = reads
+        if self.ingest_queue is not None:
+            response["ingest"] = self.ingest_queue.stats()
+        return response
+
+    def collect_metrics(self) -> list[tuple]:
+        """Metricas que se leen al exponerlas: pools de conexiones, cola de ingesta y caches."""
+        families = []
+        pool = self.service.get_pool_stats()
+        if pool:
+            families += [
+                ("pf_db_pool_size", "gauge", "Conexiones que el pool mantiene abiertas.", [({}, pool["pool_size"])]),
+                ("pf_db_pool_checked_out", "gauge", "Conexiones en uso.", [({}, pool["checked_out"])]),
+                ("pf_db_pool_overflow", "gauge", "Conexiones abiertas sobre pool_size.", [({}, pool["overflow"])]),
+                ("pf_db_pool_checkouts_total", "counter", "Conexiones solicitadas al pool.", [({}, pool["checkouts"])]),
+                ("pf_db_pool_saturated_checkouts_total", "counter", "Solicitudes que encontraron el pool lleno.", [({}, pool["saturated_checkouts"])]),
+                ("pf_db_pool_timeouts_total", "counter", "Solicitudes que agotaron DB_POOL_TIMEOUT.", [({}, pool["timeouts"])]),
+                ("pf_db_pool_wait_seconds_total", "counter", "Tiempo total de espera por una conexion.", [({}, pool["wait_total_ms"] / 1000)]),
+                ("pf_db_pool_wait_seconds_max", "gauge", "Espera maxima por una conexion.", [({}, pool["wait_max_ms"] / 1000)]),
+            ]
+        reads = self.service.get_read_stats()
+        if reads.get("enabled"):
+            families += [
+                ("pf_db_read_available", "gauge", "1 si las lecturas usan el engine de lectura, 0 si pasaron a la base principal.",
+                    [({}, int(reads["available"]))]),
+                ("pf_db_read_sessions_total", "counter", "Consultas de lectura por engine.",
+                    [({"engine": "read"}, reads["read_sessions"]), ({"engine": "primary"}, reads["fallbacks"])]),
+                ("pf_db_read_failures_total", "counter", "Errores de conexion del engine de lectura.", [({}, reads["failures"])]),
+            ]
+            read_pool = reads.get("pool")
+            if read_pool:
+                families += [
+                    ("pf_db_read_pool_checked_out", "gauge", "Conexiones de lectura en uso.", [({}, read_pool["checked_out"])]),
+                    ("pf_db_read_pool_saturated_checkouts_total", "counter", "Lecturas que encontraron el pool de lectura lleno.",
+                        [({}, read_pool["saturated_checkouts"])]),
+                    ("pf_db_read_pool_timeouts_total", "counter", "Lecturas que agotaron DB_READ_POOL_TIMEOUT.", [({}, read_pool["timeouts"])]),
+                    ("pf_db_read_pool_wait_seconds_total", "counter", "Tiempo total de espera por una conexion de lectura.",
+                        [({}, read_pool["wait_total_ms"] / 1000)]),
+                ]
+        if self.ingest_queue is not None:
+            queue_stats = self.ingest_queue.stats()
+            families += [
+                ("pf_ingest_queue_pending", "gauge", "Lotes en espera en la cola de ingesta.", [({}, queue_stats["pending"])]),
+                ("pf_ingest_queue_batches_total", "counter", "Lotes procesados por el hilo escritor.",
+                    [({"result": "committed"}, queue_stats["committed"]), ({"result": "failed"}, queue_stats["failed"])]),
+                ("pf_ingest_queue_flushes_total", "counter", "Transacciones del hilo escritor.", [({}, queue_stats["flushes"])]),
+            ]
+        caches = self.service.get_cache_stats()
+        families.append(("pf_cache_rules", "gauge", "Reglas en los caches en memoria.",
+            [({"cache": name}, values["rules"]) for name, values in caches.items() if "rules" in values]))
+        return families
+
+class PFRoute(PFRequestMixin, Blueprint):
     """Class to handle the routes"""
 
-    def __init__(self, schema_class, schema_date, service):
+    request = request
+
+    def __init__(self, schema_class, schema_date, service, strict_validation=False, ingest_queue=None, schema_idle=None, summary_response=False, schema_top=None):
         super().__init__("pf_routes", __name__)
-        self.logger = Logger()
+        self.logger = Logger(__name__)
         self.schema_class = schema_class
+        # En modo estricto cada lote pasa ademas por Schema(many=True).load
+        self.strict_validation = strict_validation
         self.schema_date = schema_date
+        self.schema_idle = schema_idle or IdleRulesSchema()
+        self.schema_top = schema_top or TopRulesSchema()
         self.service = service
+        # Con cola de ingesta, /api/v1/data responde 202 y el guardado es asincrono
+        self.ingest_queue = ingest_queue
+        # Respuesta de /api/v1/data por defecto: solo conteos (True) o el lote completo
+        self.summary_response = summary_response
+        REGISTRY.collector("pf_routes", self.collect_metrics)
         self.register_routes()
 
     def register_routes(self):
         """Function to register the routes"""
         self.route("/api/v1/data", methods=["POST"])(self.update)
+        self.route("/api/v1/data/<batch_id>", methods=["GET"])(self.batch_status)
         self.route("/api/v1/inactive", methods=["GET"])(self.InactiveRules)
+        self.route("/api/v1/idle", methods=["GET"])(self.IdleRules)
+        self.route("/api/v1/rules/top", methods=["GET"])(self.TopRules)
         self.route("/api/v1/healthcheck", methods=["GET"])(self.healthcheck)
+        self.route("/api/v1/stats", methods=["GET"])(self.stats)
+        self.route("/metrics", methods=["GET"])(self.metrics)
+        self.after_request(self.compress_response)
 
     def fetch_request_data(self):
         """Function to fetch the request data"""
@@ -29,63 +399,50 @@ class PFRoute(Blueprint):
                 return 400, "Invalid data", None
             return 200, None, request_data
         except Exception as e:
-            self.logger.error(f"Error fetching request data: {e}")
+            self.logger.error("Error fetching request data: %s", e)
             return 500, "Error fetching request data", None
         
-    def parse_pfctl_line(self, line: str) -> dict:
-        """Parses a single pfctl statistics line."""
-        pattern = re.compile(
-            r'^(USER_RULE:?\s*(.*?))\s+id:(\d+)\s+'  # USER_RULE prefix, label, id
-            r'(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)' # 7 numeric counters
-        )
-        
-        match = pattern.match(line)
-        
-        if match:
-            full_label_prefix = match.group(1)
-            label = match.group(2).strip()
-
-            evaluations = int(match.group(4))
-            packets_matched = int(match.group(5))
-            bytes_matched = int(match.group(6))
-            states_created = int(match.group(7))
-            state_packets = int(match.group(8))
-            state_bytes = int(match.group(9))
-            input_output = int(match.group(10))
-            rule_id = int(match.group(3))
-            
-            return {
-                "label": label,
-                "id": rule_id,
-                "evaluations": evaluations,
-                "packets_matched": packets_matched,
-                "bytes_matched": bytes_matched,
-                "states_created": states_created,
-                "state_packets": state_packets,
-                "state_bytes": state_bytes,
-                "input_output": input_output
-            }
-        else:
-            print(f"WARNING: Could not parse line: {line}")
-            return None
+    def duplicate_response(self, source: str, dedupe_key: str, entry: dict = None):
+        """Respuesta para un lote que ya se habia recibido: se confirma sin volver a guardarlo."""
+        return jsonify(self.duplicate_payload(source, dedupe_key, entry)), 200
 
-    def merge_duplicate_rules(self, rules) -> dict:
-        """Merge the duplicated rules registered"""
-        merged = {}
-        for rule in rules:
-            rule_id = rule['id']
-            if rule_id in merged:
-                # Suma los valores numéricos
-                merged[rule_id]['evaluations'] += rule['evaluations']
-                merged[rule_id]['packets_matched'] += rule['packets_matched']
-                merged[rule_id]['bytes_matched'] += rule['bytes_matched']
-                merged[rule_id]['states_created'] += rule['states_created']
-                merged[rule_id]['state_packets'] += rule['state_packets']
-                merged[rule_id]['state_bytes'] += rule['state_bytes']
-                merged[rule_id]['input_output'] += rule['input_output']
-            else:
-                merged[rule_id] = rule.copy()
-        return list(merged.values())
+    def iter_request_lines(self, digest=None):
+        """
+        Genera las lineas recibidas sin materializar todo el cuerpo.
+
+        Acepta el volcado crudo de `pfctl -s all` como text/plain (se lee linea
+        por linea del stream de la peticion), el arreglo JSON de lineas que
+        enviaba la version anterior del script o el mismo arreglo en MessagePack.
+        Con Content-Encoding gzip o zstd el cuerpo se descomprime al leerlo.
+        Si se pasa `digest` (hashlib) se actualiza con el cuerpo descomprimido: es
+        la huella del lote cuando no viene Idempotency-Key.
+        Lanza BodyDecodeError si el cuerpo no se puede decodificar.
+        """
+        encoding = content_encoding(request.headers.get("Content-Encoding"))
+        if request.mimetype == "text/plain":
+            raw_lines = request.stream if encoding is None else iter_decoded_lines(request.stream, encoding)
+            for raw_line in raw_lines:
+                if digest is not None:
+                    digest.update(raw_line)
+                yield raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+            return
+
+        body = decode_body(request.get_data(), encoding)
+        if digest is not None:
+            digest.update(body)
+        if request.mimetype in MSGPACK_MIMETYPES:
+            yield from iter_msgpack_lines(body)
+            return
+        if encoding is None:
+            raw_lines = request.get_json()
+        else:
+            try:
+                raw_lines = current_app.json.loads(body)
+            except ValueError as e:
+                raise BodyDecodeError(f"JSON invalido: {e}") from e
+        if not isinstance(raw_lines, list):
+            return
+        yield from raw_lines
 
     def update(self):
         """
@@ -97,101 +454,194 @@ class PFRoute(Blueprint):
             validated_data: Datos registrados en la base de datos
         """
         try:
-            # Traer datos
-            raw_lines = request.get_json()
-            if not raw_lines:
-                self.logger.error(f"No se recibierón datos")
+            source = self.request_source()
+            if source is None:
+                self.logger.warning("Identificador de firewall invalido")
+                return jsonify({"error": "Identificador de firewall invalido"}), 422
+
+            # Reintentos: con Idempotency-Key se reconocen antes de leer el cuerpo,
+            # sin ella se usa la huella del contenido recibido
+            dedupe_key, digest, entry = self.start_dedupe(source)
+            if entry is not None:
+                return self.duplicate_response(source, dedupe_key, entry)
+
+            # Se leen, interpretan y combinan las lineas en una sola pasada;
+            # el tiempo de cada etapa se separa para /metrics
+            timer = StageTimer(INGEST_STAGE_SECONDS)
+            lines = timer.iter("decode", self.iter_request_lines(digest))
+            parsed_rules = timer.iter("parse", self.iter_parsed_rules(lines))
+            with timer.stage("merge"):
+                filtered_data = self.merge_duplicate_rules(parsed_rules)
+            if not filtered_data:
+                INGEST_BATCHES.inc(result="empty")
+                self.logger.error("No se recibierón datos")
                 return jsonify({"error": "No se recibieron datos"}), 400
-            
-            self.logger.debug(f"Datos recibidos: {raw_lines}")
-
-            # Se crea el diccionario
-            parsed_data = []
-            for line in raw_lines:
-                parsed_rule = self.parse_pfctl_line(line)
-                if parsed_rule:
-                    parsed_data.append(parsed_rule)
 
-            # Revisar si hay datos duplicados para sumarlos y guardarlos juntos
-            filtered_data = self.merge_duplicate_rules(parsed_data)
-
-            # Validacion con Marshmallow
-            schema_instance = self.schema_class(many=True)
-            validated_data = schema_instance.load(filtered_data)
-            self.logger.debug(f"Datos validados correctamente: {validated_data}")
+            dedupe_key, entry = self.finish_dedupe(source, dedupe_key, digest)
+            if entry is not None:
+                timer.observe()
+                return self.duplicate_response(source, dedupe_key, entry)
+
+            self.logger.debug("Reglas recibidas de %s: %s", source, len(filtered_data))
+
+            # Validacion con Marshmallow (opcional, el parser ya garantiza los tipos)
+            if self.strict_validation:
+                with timer.stage("validation"):
+                    filtered_data = self.validate_records(filtered_data)
+                self.logger.debug_payload("Datos validados correctamente: %s", filtered_data)
+            timer.observe()
+            INGEST_BATCH_RULES.observe(len(filtered_data))
+
+            if self.ingest_queue is not None:
+                # Modo asincrono: se encola y el hilo escritor hace el commit
+                batch_id = self.ingest_queue.submit(filtered_data, source, dedupe_key)
+                if batch_id is None:
+                    INGEST_BATCHES.inc(result="rejected")
+                    self.logger.warning("Cola de ingesta llena, lote rechazado")
+                    return jsonify({"error": "Cola de ingesta llena, reintente mas tarde"}), 503
+                INGEST_BATCHES.inc(result="queued")
+                self.logger.info("Lote %s en cola (%s reglas)", batch_id, len(filtered_data))
+                return jsonify({"message": "Lote en cola", "batch_id": batch_id, "firewall": source, "rules": len(filtered_data)}), 202
 
             # Se le llama al servicio para guardar los datos
-            result = self.service.add_metrics(validated_data)
-
-            if (result == True):
-                self.logger.info("Registro exitoso")
-                return jsonify({"message": "Registro exitoso", "data": validated_data}), 200
-            else:
-                self.logger.info("Ocurrio un error al guardar la informacion en la base de datos")
-                return jsonify({"message": "Ocurrio un error al guardar la informacion en la base de datos", "data": validated_data}), 400
-            
+            result = self.service.add_metrics(filtered_data, source, dedupe_key)
+            if result == BatchDeduplicator.DUPLICATE:
+                return self.duplicate_response(source, dedupe_key)
+            response, status = self.ingest_result(result, source, filtered_data)
+            return jsonify(response), status
+
+        except BodyDecodeError as err:
+            INGEST_BATCHES.inc(result="invalid")
+            self.logger.warning("Cuerpo de la peticion invalido: %s", err)
+            return jsonify({"error": str(err)}), err.status
         except ValidationError as err:
+            INGEST_BATCHES.inc(result="invalid")
             messages = err.messages
             self.logger.warning("Ocurrieron errores de validación")
-            self.logger.info(f"Errores de validación completos: {messages}")
+            self.logger.info("Errores de validación completos: %s", messages)
             
             # Otro error de validacion
             return jsonify({"error": "Datos invalidos"}), 422
         except Exception as e:
-            self.logger.critical(f"Error critico: {e}")
+            self.logger.critical("Error critico: %s", e)
             return jsonify({"error": "Error interno"}), 500
         finally:
             # Eliminar el directorio temporal
             self.logger.info("Función finalizada")
 
+    def batch_status(self, batch_id):
+        """Endpoint para consultar si un lote encolado ya se guardo (queued, committed o failed)."""
+        if self.ingest_queue is None:
+            return jsonify({"error": "La ingesta asincrona no esta habilitada"}), 404
+        status = self.ingest_queue.status(batch_id)
+        if status is None:
+            return jsonify({"error": "Lote desconocido"}), 404
+        return jsonify({"batch_id": batch_id, "status": status}), 200
+
     def InactiveRules(self):
         """
-        Endpoint para buscar reglas sin uso comparando "bytes_matched".
-        Espera 'start_date' y 'end_date' como parametros en formato YYYY-MM-DD.
+        Endpoint para buscar reglas sin uso.
+        Espera 'fechaInicio' y 'fechaFin' como parametros en formato YYYY-MM-DD.
+        Opcionales: 'tolerancia' (por defecto 100, minimo 1: se reportan las reglas
+        con actividad menor) y 'metrica' (bytes, packets, evaluations o states; por defecto bytes).
+        'firewall' limita la consulta a un firewall; sin el se consulta toda la flota.
+        Paginacion por llave: 'limite' y 'despues' (ultimo rule_id recibido, y en
+        consultas de toda la flota 'despuesFirewall'); la respuesta incluye
+        'siguiente' y 'siguienteFirewall' cuando puede haber mas reglas.
+        Con 'formato=ndjson' se envia una regla por linea conforme se leen del cursor.
         """
         try:
-            # Validacion de datos recibidos
-            query_params = {
-                "fechaInicio": request.args.get('fechaInicio'),
-                "fechaFin": request.args.get('fechaFin')
-            }
-            
-            self.logger.debug(f"Datos recibidos: {query_params}")
+            start_date, end_date, query_options, validated_data = self.load_inactive_query()
 
-            validated_data = self.schema_date.load(query_params)
+            if validated_data['formato'] == "ndjson":
+                rows = self.service.iter_inactive_rules(start_date, end_date, **query_options)
+                return Response(stream_with_context(self.iter_ndjson(rows, clock.perf_counter())), mimetype="application/x-ndjson")
 
-            # Las fechas ya son objetos datetime.date gracias a fields.Date
-            start_date_obj = validated_data['fechaInicio']
-            end_date_obj = validated_data['fechaFin']
+            # Llama al servicio para obtener las reglas inactivas
+            with INACTIVE_QUERY_SECONDS.time(format="json"):
+                inactive_rules = self.service.get_inactive_rules(start_date, end_date, **query_options)
 
-            # Convierte datetime.date a datetime.datetime y establece la hora
-            # Para start_date, queremos el inicio del día
-            start_date = datetime.combine(start_date_obj, time.min) # 00:00:00.000000
+            response = self.page_response({"status": "success", "inactive_rules": inactive_rules}, inactive_rules, validated_data['limite'])
+            return jsonify(response), 200
+
+        except ValidationError as err:
+            response, status = self.invalid_query(err)
+            return jsonify(response), status
+        except Exception as e:
+            self.logger.critical("Error critico: %s", e)
+            return jsonify({"error": "Error interno"}), 500
+        
+    def IdleRules(self):
+        """
+        Endpoint para buscar reglas inactivas a partir de los periodos de inactividad.
+        'dias=N': reglas que siguen inactivas y llevan al menos N dias sin trafico.
+        'mes=YYYY-MM': reglas inactivas en todas las ejecuciones de su firewall en el mes.
+        Opcionales: 'firewall' y la paginacion 'limite', 'despues', 'despuesFirewall'
+        (igual que /api/v1/inactive).
+        """
+        try:
+            query_options, limit = self.load_idle_query()
 
-            # Para end_date, queremos el final del día
-            end_date = datetime.combine(end_date_obj, time.max) # 23:59:59.999999
+            with INACTIVE_QUERY_SECONDS.time(format="idle"):
+                idle_rules = self.service.get_idle_rules(**query_options)
 
-            # Llama al servicio para obtener las reglas inactivas
-            inactive_rules = self.service.get_inactive_rules(start_date, end_date)
+            response = self.page_response({"status": "success", "idle_rules": idle_rules}, idle_rules, limit)
+            return jsonify(response), 200
+
+        except ValidationError as err:
+            response, status = self.invalid_query(err)
+            return jsonify(response), status
+        except Exception as e:
+            self.logger.critical("Error critico: %s", e)
+            return jsonify({"error": "Error interno"}), 500
+
+    def TopRules(self):
+        """
+        Endpoint para buscar las reglas con mas (o menos) trafico, p. ej. para reordenarlas.
+        'ventana' (1h, 24h, 7d o 30d, horas completas hasta la hora actual) o 'fechaInicio'
+        y 'fechaFin' (YYYY-MM-DD, dias completos en UTC).
+        Opcionales: 'metrica' (bytes, packets, evaluations o states; por defecto bytes),
+        'orden' (top o bottom; por defecto top), 'limite' (K, por defecto 10) y 'firewall'.
+        """
+        try:
+            start_date, end_date, query_options = self.load_top_query()
+
+            with INACTIVE_QUERY_SECONDS.time(format="top"):
+                top_rules = self.service.get_top_rules(start_date, end_date, **query_options)
+            if not top_rules:
+                return jsonify({"error": "Error interno"}), 500
 
-            return jsonify({"status": "success", "inactive_rules": inactive_rules}), 200
+            return jsonify(self.top_response(top_rules, start_date, end_date, query_options)), 200
 
         except ValidationError as err:
-            messages = err.messages
-            self.logger.warning("Ocurrieron errores de validación")
-            self.logger.info(f"Errores de validación completos: {messages}")
-            return jsonify({"error": "Datos invalidos"}), 422
+            response, status = self.invalid_query(err)
+            return jsonify(response), status
         except Exception as e:
-            self.logger.critical(f"Error critico: {e}")
+            self.logger.critical("Error critico: %s", e)
             return jsonify({"error": "Error interno"}), 500
-        
+
+    def iter_ndjson(self, rows, started_at: float = None):
+        """Serializa cada regla en una linea JSON. Un error a media respuesta solo se registra."""
+        count = 0
+        try:
+            for row in rows:
+                count += 1
+                yield dumps_line(row)
+        except Exception as e:
+            self.logger.critical("Error critico enviando reglas inactivas: %s", e)
+        else:
+            self.logger.info("Se enviaron %s reglas inactivas en ndjson.", count)
+        finally:
+            if started_at is not None:
+                INACTIVE_QUERY_SECONDS.observe(clock.perf_counter() - started_at, format="ndjson")
+
     def Zero(self, data):
         """
         Endpoint para actualizar la tabla que contiene los registros con 0 bytes usados.
         """
         self.logger.debug("Llamada iniciada")
         try:
-            self.logger.debug(f"Datos recibidos en Zero {data}")
+            self.logger.debug_payload("Datos recibidos en Zero %s", data)
 
             self.logger.debug("Llamando al servicio")
 
@@ -202,7 +652,7 @@ class PFRoute(Blueprint):
             
             self.logger.debug("Tabla de reglas sin uso actualizada")
 
-            self.logger.info(f"Datos agregados a tabla sin uso {data}")
+            self.logger.info("Datos agregados a tabla sin uso %s", data)
 
             # Las fechas ya son objetos datetime.date gracias a fields.Date
 
@@ -215,9 +665,41 @@ class PFRoute(Blueprint):
                 return result
 
         except Exception as e:
-            self.logger.critical(f"Error critico: {e}")
+            self.logger.critical("Error critico: %s", e)
             return False
 
+    def stats(self):
+        """Function to expose the in-memory cache counters (hits of the rules catalog, etc.) and the DB pool usage"""
+        return jsonify(self.stats_payload()), 200
+
+    def metrics(self):
+        """Function to expose the process metrics in the Prometheus text format"""
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    def compress_response(self, response):
+        """
+        Comprime la respuesta con gzip o zstd segun Accept-Encoding (las de menos de
+        COMPRESSION_MIN_BYTES se envian sin comprimir). El NDJSON se comprime por
+        fragmentos conforme se genera.
+        """
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or "Content-Encoding" in response.headers):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < COMPRESSION_MIN_BYTES:
+                return response
+            response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
     def healthcheck(self):
         """Function to check the health of the services API inside the docker container"""
         return jsonify({"status": "Up"}), 200
\ No newline at end of file
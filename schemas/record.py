@@ -0,0 +1,77 @@
+# schemas/record.py
+
+class RuleMetricRecord:
+    """
+    Registro compacto de una regla interpretada de pfctl.
+
+    Usa __slots__ para no crear un diccionario por instancia; viaja sin copias
+    desde el parser hasta el servicio. La validacion completa con Marshmallow
+    sigue disponible en modo estricto (ver PFRoute).
+    """
+
+    # Contadores que se suman cuando una regla aparece varias veces (p. ej. en varios anchors)
+    COUNTER_FIELDS = (
+        "evaluations",
+        "packets_matched",
+        "bytes_matched",
+        "states_created",
+        "state_packets",
+        "state_bytes",
+        "input_output",
+    )
+
+    __slots__ = ("id", "label") + COUNTER_FIELDS
+
+    def __init__(self, id, label, evaluations, packets_matched, bytes_matched,
+                 states_created, state_packets, state_bytes, input_output):
+        self.id = id
+        self.label = label
+        self.evaluations = evaluations
+        self.packets_matched = packets_matched
+        self.bytes_matched = bytes_matched
+        self.states_created = states_created
+        self.state_packets = state_packets
+        self.state_bytes = state_bytes
+        self.input_output = input_output
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RuleMetricRecord":
+        """Crea un registro a partir de un diccionario (p. ej. la salida de Schema.load)."""
+        return cls(
+            data["id"],
+            data["label"],
+            data["evaluations"],
+            data["packets_matched"],
+            data["bytes_matched"],
+            data["states_created"],
+            data["state_packets"],
+            data["state_bytes"],
+            data["input_output"],
+        )
+
+    def merge(self, other: "RuleMetricRecord") -> None:
+        """Suma en este registro los contadores de otra aparicion de la misma regla."""
+        self.evaluations += other.evaluations
+        self.packets_matched += other.packets_matched
+        self.bytes_matched += other.bytes_matched
+        self.states_created += other.states_created
+        self.state_packets += other.state_packets
+        self.state_bytes += other.state_bytes
+        self.input_output += other.input_output
+
+    def to_dict(self) -> dict:
+        """Representacion en diccionario, usada para las respuestas JSON y el modo estricto."""
+        return {
+            "label": self.label,
+            "id": self.id,
+            "evaluations": self.evaluations,
+            "packets_matched": self.packets_matched,
+            "bytes_matched": self.bytes_matched,
+            "states_created": self.states_created,
+            "state_packets": self.state_packets,
+            "state_bytes": self.state_bytes,
+            "input_output": self.input_output
+        }
+
+    def __repr__(self):
+        return f"<RuleMetricRecord(id={self.id}, label='{self.label}', bytes_matched={self.bytes_matched})>"
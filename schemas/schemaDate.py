@@ -1,5 +1,16 @@
 # schemas/schemaDate.py
-from marshmallow import Schema, fields, validate, EXCLUDE
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError, EXCLUDE
+
+# Mensaje de validacion de una pagina de toda la flota sin el firewall de la ultima regla
+MISSING_CURSOR_SOURCE = "Envia 'despuesFirewall' con 'despues' cuando se consulta toda la flota."
+
+def validate_fleet_cursor(data):
+    """
+    Las paginas de toda la flota se ordenan por (firewall, rule_id): con solo 'despues'
+    la siguiente pagina saltaria las reglas de otros firewalls con rule_id menor.
+    """
+    if data.get("despues") is not None and data.get("firewall") is None and data.get("despuesFirewall") is None:
+        raise ValidationError(MISSING_CURSOR_SOURCE, "despuesFirewall")
 
 class DateRangeSchema(Schema):
     # Por defecto, fields.Date espera 'YYYY-MM-DD'
@@ -9,4 +20,131 @@ class DateRangeSchema(Schema):
     class Meta:
         # Esto permite que el esquema ignore campos que no estén definidos
         # si se envían accidentalmente, en lugar de lanzar un error.
-        unknown = EXCLUDE
\ No newline at end of file
+        unknown = EXCLUDE
+
+class InactiveRulesSchema(DateRangeSchema):
+    # Parametros opcionales de /api/v1/inactive
+    tolerancia = fields.Integer(
+        load_default=100,
+        validate=validate.Range(min=1),
+        metadata={"description": "Actividad minima (en la metrica elegida) para considerar una regla en uso; 1 = sin trafico"}
+    )
+    metrica = fields.String(
+        load_default="bytes",
+        validate=validate.OneOf(["bytes", "packets", "evaluations", "states"]),
+        metadata={"description": "Contador comparado: bytes, packets, evaluations o states"}
+    )
+    limite = fields.Integer(
+        load_default=None,
+        validate=validate.Range(min=1, max=10000),
+        metadata={"description": "Numero maximo de reglas por pagina"}
+    )
+    despues = fields.Integer(
+        load_default=None,
+        validate=validate.Range(min=0),
+        metadata={"description": "Paginacion por llave: regresa reglas con rule_id mayor a este valor"}
+    )
+    firewall = fields.String(
+        load_default=None,
+        validate=validate.Regexp(r'^[A-Za-z0-9_.:-]{1,64}$'),
+        metadata={"description": "Firewall consultado; sin este parametro se consulta toda la flota"}
+    )
+    despuesFirewall = fields.String(
+        load_default=None,
+        validate=validate.Regexp(r'^[A-Za-z0-9_.:-]{1,64}$'),
+        metadata={"description": "Firewall de la ultima regla recibida (paginacion de toda la flota)"}
+    )
+    formato = fields.String(
+        load_default="json",
+        validate=validate.OneOf(["json", "ndjson"]),
+        metadata={"description": "json (por defecto) o ndjson (una regla por linea, en streaming)"}
+    )
+
+    @validates_schema
+    def validate_cursor(self, data, **kwargs):
+        validate_fleet_cursor(data)
+
+class IdleRulesSchema(Schema):
+    # Parametros de /api/v1/idle: exactamente uno de 'dias' o 'mes'
+    dias = fields.Integer(
+        load_default=None,
+        validate=validate.Range(min=0, max=3650),
+        metadata={"description": "Reglas que siguen inactivas y llevan al menos estos dias sin trafico"}
+    )
+    mes = fields.Date(
+        format="%Y-%m",
+        load_default=None,
+        metadata={"description": "Mes en formato YYYY-MM: reglas inactivas en todas las ejecuciones del mes"}
+    )
+    limite = fields.Integer(
+        load_default=None,
+        validate=validate.Range(min=1, max=10000),
+        metadata={"description": "Numero maximo de reglas por pagina"}
+    )
+    despues = fields.Integer(
+        load_default=None,
+        validate=validate.Range(min=0),
+        metadata={"description": "Paginacion por llave: regresa reglas con rule_id mayor a este valor"}
+    )
+    firewall = fields.String(
+        load_default=None,
+        validate=validate.Regexp(r'^[A-Za-z0-9_.:-]{1,64}$'),
+        metadata={"description": "Firewall consultado; sin este parametro se consulta toda la flota"}
+    )
+    despuesFirewall = fields.String(
+        load_default=None,
+        validate=validate.Regexp(r'^[A-Za-z0-9_.:-]{1,64}$'),
+        metadata={"description": "Firewall de la ultima regla recibida (paginacion de toda la flota)"}
+    )
+
+    class Meta:
+        unknown = EXCLUDE
+
+    @validates_schema
+    def validate_mode(self, data, **kwargs):
+        if (data.get("dias") is None) == (data.get("mes") is None):
+            raise ValidationError("Envia 'dias' o 'mes' (solo uno).", "_schema")
+        validate_fleet_cursor(data)
+
+class TopRulesSchema(Schema):
+    # Parametros de /api/v1/rules/top: 'ventana' o el rango 'fechaInicio'/'fechaFin'
+    ventana = fields.String(
+        load_default=None,
+        validate=validate.OneOf(["1h", "24h", "7d", "30d"]),
+        metadata={"description": "Ventana fija que termina al inicio de la hora actual: 1h, 24h, 7d o 30d"}
+    )
+    fechaInicio = fields.Date(load_default=None, metadata={"description": "Fecha de inicio en formato YYYY-MM-DD"})
+    fechaFin = fields.Date(load_default=None, metadata={"description": "Fecha de fin (inclusiva) en formato YYYY-MM-DD"})
+    metrica = fields.String(
+        load_default="bytes",
+        validate=validate.OneOf(["bytes", "packets", "evaluations", "states"]),
+        metadata={"description": "Contador sumado: bytes, packets, evaluations o states"}
+    )
+    orden = fields.String(
+        load_default="top",
+        validate=validate.OneOf(["top", "bottom"]),
+        metadata={"description": "top: reglas con mas actividad; bottom: reglas con menos actividad"}
+    )
+    limite = fields.Integer(
+        load_default=10,
+        validate=validate.Range(min=1, max=1000),
+        metadata={"description": "Numero de reglas (K)"}
+    )
+    firewall = fields.String(
+        load_default=None,
+        validate=validate.Regexp(r'^[A-Za-z0-9_.:-]{1,64}$'),
+        metadata={"description": "Firewall consultado; sin este parametro se consulta toda la flota"}
+    )
+
+    class Meta:
+        unknown = EXCLUDE
+
+    @validates_schema
+    def validate_range(self, data, **kwargs):
+        has_dates = data.get("fechaInicio") is not None or data.get("fechaFin") is not None
+        if (data.get("ventana") is None) == (not has_dates):
+            raise ValidationError("Envia 'ventana' o 'fechaInicio' y 'fechaFin' (solo uno).", "_schema")
+        if has_dates and (data.get("fechaInicio") is None or data.get("fechaFin") is None):
+            raise ValidationError("Envia 'fechaInicio' y 'fechaFin'.", "_schema")
+        if has_dates and data["fechaInicio"] > data["fechaFin"]:
+            raise ValidationError("'fechaInicio' debe ser anterior o igual a 'fechaFin'.", "_schema")
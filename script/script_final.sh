@@ -3,6 +3,8 @@
 # Configuración del API
 API_URL="http://172.29.206.227:8000/api/v1/data"
 API_TOKEN="Mazapan"
+# Identificador de este firewall (letras, numeros, _ . : -); separa sus reglas de las de otros pfSense
+FIREWALL_ID="$(hostname -s)"
 
 # Rutas para los archivos de log
 API_RESPONSE_LOG="/home/Operador5/pf/pf_sense_api_response.log"
@@ -13,6 +15,12 @@ SMTP_LOG_DIR="/home/Operador5/pf/mail"
 
 # Archivo temporal para la salida del cuerpo de la respuesta de curl
 TEMP_CURL_OUTPUT="${SMTP_LOG_DIR}/curl_output_$$"
+# Archivo temporal con el volcado de pfctl (se reutiliza en cada reintento)
+PF_STATS_FILE="${SMTP_LOG_DIR}/pfctl_stats_$$"
+# Volcado comprimido que se envia (Content-Encoding: gzip)
+PF_STATS_GZ="${PF_STATS_FILE}.gz"
+# Llave de esta ejecucion: los reintentos envian la misma y la API no guarda el lote dos veces
+BATCH_KEY="${FIREWALL_ID}-$(date +%Y%m%d%H%M%S)-$$"
 
 # Configuración del SMTP
 SMTP_SERVER="172.29.150.2"                              # IP de tu servidor SMTP
@@ -32,7 +40,7 @@ RETRY_COUNT=0   # Contador inicializado en 0
 
 # Función para limpiar archivos temporales al salir del script
 cleanup() {
-    rm -f "$TEMP_CURL_OUTPUT"
+    rm -f "$TEMP_CURL_OUTPUT" "$PF_STATS_FILE" "$PF_STATS_GZ"
 }
 # Registrar la función cleanup para que se ejecute al salir del script (éxito o fallo)
 trap cleanup EXIT
@@ -40,19 +48,18 @@ trap cleanup EXIT
 # --- Lógica principal del script ---
 echo "Recopilando estadísticas de pfSense..."
 
-# Obtener las líneas de estadísticas de reglas de usuario.
-# Usamos `awk` para filtrar solo las líneas que contienen los contadores numéricos al final.
-PF_STATS_RAW=$(pfctl -s all | awk '/^USER_RULE:/')
+# Guardar el volcado de pfctl tal cual. La API filtra las lineas USER_RULE
+# y las interpreta por streaming, ya no se necesita jq en el firewall.
+pfctl -s all > "$PF_STATS_FILE"
 
 # Verificar si se encontraron estadísticas
-if [ -z "$PF_STATS_RAW" ]; then
+if ! grep -q '^USER_RULE' "$PF_STATS_FILE"; then
     echo "No se encontraron líneas de estadísticas de USER_RULE: con contadores. No se generará archivo."
     exit 0
 fi
 
-# Convertir las líneas de PF_STATS_RAW a un array JSON usando jq
-# Cada línea se convierte en un elemento de un array JSON
-JSON_PAYLOAD=$(echo "$PF_STATS_RAW" | jq -R . | jq -s .)
+# Se comprime una sola vez; la API lo descomprime al leerlo
+gzip -c "$PF_STATS_FILE" > "$PF_STATS_GZ"
 
 # --- Bucle de reintentos para la llamada a la API ---
 while [ $RETRY_COUNT -lt $MAX_RETRIES ]; do
@@ -62,10 +69,12 @@ while [ $RETRY_COUNT -lt $MAX_RETRIES ]; do
     # La salida del cuerpo de la respuesta va al archivo temporal
     HTTP_STATUS=$(curl -s -o "$TEMP_CURL_OUTPUT" -w "%{http_code}" \
       -X POST \
-      -H "Content-Type: application/json" \
+      -H "Content-Type: text/plain" \
+      -H "Content-Encoding: gzip" \
       -H "Authorization: Bearer ${API_TOKEN}" \
-      -d "${JSON_PAYLOAD}" \
-      "${API_URL}")
+      -H "Idempotency-Key: ${BATCH_KEY}" \
+      --data-binary "@${PF_STATS_GZ}" \
+      "${API_URL}?firewall=${FIREWALL_ID}&respuesta=resumen")
 
     # Leer la respuesta de la API desde el archivo temporal
     # El '2>/dev/null || echo ""' maneja el caso de que el archivo temporal no exista o esté vacío
@@ -76,9 +85,9 @@ while [ $RETRY_COUNT -lt $MAX_RETRIES ]; do
     echo "$(date) - HTTP Status: ${HTTP_STATUS} - Response: ${API_RESPONSE}" >> "$API_RESPONSE_LOG"
     echo "$(date): Respuesta de la API (HTTP Status: ${HTTP_STATUS}): ${API_RESPONSE}"
 
-    # Evaluar el código de estado HTTP
-    if [ "$HTTP_STATUS" -eq 200 ]; then
-        echo "$(date): Datos enviados exitosamente. API respondió 200 OK."
+    # Evaluar el código de estado HTTP (202 = lote en cola con INGEST_ASYNC=1)
+    if [ "$HTTP_STATUS" -eq 200 ] || [ "$HTTP_STATUS" -eq 202 ]; then
+        echo "$(date): Datos enviados exitosamente. API respondió ${HTTP_STATUS}."
         break # Salir del bucle de reintentos si fue exitoso
     else
         echo "$(date): API no respondió con 200 OK. Código: ${HTTP_STATUS}. Guardando detalles del error y reintentando en ${RETRY_DELAY} segundos..."
@@ -91,7 +100,7 @@ while [ $RETRY_COUNT -lt $MAX_RETRIES ]; do
 done
 
 # --- Después del bucle de reintentos ---
-if [ "$HTTP_STATUS" -ne 200 ]; then
+if [ "$HTTP_STATUS" -ne 200 ] && [ "$HTTP_STATUS" -ne 202 ]; then
     echo "$(date): Falló el envío a la API después de ${MAX_RETRIES} intentos. HTTP: ${HTTP_STATUS}"
     
     # Registrar error
@@ -0,0 +1,76 @@
+from datetime import date, datetime
+from itertools import islice
+from sqlalchemy.util import greenlet_spawn
+from models.model import DEFAULT_SOURCE
+from schemas.record import RuleMetricRecord
+from services.service import Service, DEFAULT_TOLERANCE, INACTIVE_STREAM_BATCH
+from logger.logger import Logger
+
+class AsyncService:
+    """
+    Service para la variante ASGI (asgi.py), sobre el engine de AsyncBDModel.
+
+    La logica es la del Service sincrono (deltas, deduplicacion, periodos de
+    inactividad, consultas): cada operacion se ejecuta con greenlet_spawn, asi
+    las consultas de SQLAlchemy sobre asyncpg ceden el event loop en cada viaje
+    a la base de datos sin duplicar el codigo. Los caches (ultimas muestras,
+    catalogo, llaves de deduplicacion) son los del Service y se comparten entre
+    todas las peticiones del proceso.
+    """
+
+    def __init__(self, db_model):
+        self.logger = Logger(__name__)
+        self.db_model = db_model
+        self.service = Service(db_model)
+
+    @property
+    def dedupe(self):
+        return self.service.dedupe
+
+    def get_cache_stats(self) -> dict:
+        return self.service.get_cache_stats()
+
+    def get_pool_stats(self) -> dict:
+        return self.service.get_pool_stats()
+
+    def get_read_stats(self) -> dict:
+        return self.service.get_read_stats()
+
+    async def add_metrics(self, rule_metrics_list: list[RuleMetricRecord], source: str = DEFAULT_SOURCE, dedupe_key: str = None):
+        """Igual que Service.add_metrics: True, False o BatchDeduplicator.DUPLICATE."""
+        return await greenlet_spawn(self.service.add_metrics, rule_metrics_list, source, dedupe_key)
+
+    async def get_inactive_rules(self, start_date: datetime, end_date: datetime, tolerance: int = DEFAULT_TOLERANCE,
+                                 metric: str = "bytes", after: int = None, limit: int = None,
+                                 source: str = None, after_source: str = None) -> list[dict]:
+        return await greenlet_spawn(
+            self.service.get_inactive_rules, start_date, end_date, tolerance, metric, after, limit, source, after_source
+        )
+
+    async def get_idle_rules(self, min_days: int = None, month: date = None, source: str = None,
+                             after: int = None, after_source: str = None, limit: int = None) -> list[dict]:
+        return await greenlet_spawn(self.service.get_idle_rules, min_days, month, source, after, after_source, limit)
+
+    async def get_top_rules(self, start_date: datetime, end_date: datetime, metric: str = "bytes", order: str = "top",
+                            limit: int = 10, source: str = None) -> dict:
+        return await greenlet_spawn(self.service.get_top_rules, start_date, end_date, metric, order, limit, source)
+
+    async def iter_inactive_rules(self, start_date: datetime, end_date: datetime, tolerance: int = DEFAULT_TOLERANCE,
+                                  metric: str = "bytes", after: int = None, limit: int = None,
+                                  source: str = None, after_source: str = None):
+        """
+        Igual que Service.iter_inactive_rules (cursor del lado del servidor), en bloques
+        de INACTIVE_STREAM_BATCH reglas por cada salto al greenlet. Los errores se
+        propagan al consumidor.
+        """
+        rules = self.service.iter_inactive_rules(start_date, end_date, tolerance, metric, after, limit, source, after_source)
+        try:
+            while True:
+                chunk = await greenlet_spawn(lambda: list(islice(rules, INACTIVE_STREAM_BATCH)))
+                for rule in chunk:
+                    yield rule
+                if len(chunk) < INACTIVE_STREAM_BATCH:
+                    return
+        finally:
+            # Cierra el cursor y regresa la conexion al pool (tambien si el cliente se desconecta)
+            await greenlet_spawn(rules.close)
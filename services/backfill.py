@@ -0,0 +1,219 @@
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from models.model import Rule
+from services.rollup import ROLLUP_TABLES, ONE_DAY, rollup_rebuild_sql
+from services.service import Service
+from services.snapshot import RuleSnapshots
+from services.spans import EXTEND_SPANS_MANY_SQL, CLOSE_SPANS_MANY_SQL, INSERT_SPANS_SQL, collapse_spans
+
+# Ejecuciones ya guardadas de un firewall en un rango: execution_log y, para las
+# ejecuciones anteriores a execution_log o ya compactadas, los timestamps de rule_metrics
+EXISTING_RUNS_SQL = text("""
+    SELECT executed_at FROM execution_log
+    WHERE source = :source AND executed_at >= :start AND executed_at <= :end
+    UNION
+    SELECT DISTINCT timestamp FROM rule_metrics
+    WHERE source = :source AND timestamp >= :start AND timestamp <= :end
+""")
+
+NEXT_RUN_SQL = text("""
+    SELECT MIN(timestamp) FROM rule_metrics WHERE source = :source AND timestamp > :moment
+""")
+
+# Recalcula el delta de la primera muestra posterior al grupo de cada regla contra su
+# muestra anterior (ahora la ultima del grupo). Regresa los timestamps corregidos.
+_DELTA_COLUMNS = RuleSnapshots.DELTA_FIELDS
+REPAIR_NEXT_SAMPLE_SQL = text(f"""
+    WITH next_sample AS (
+        SELECT r.rule_id, n.timestamp,
+            {', '.join(f'n.{field} AS {field}' for field in _DELTA_COLUMNS)},
+            {', '.join(f'p.{field} AS previous_{field}' for field in _DELTA_COLUMNS)}
+        FROM unnest(CAST(:rule_ids AS bigint[])) AS r(rule_id)
+        CROSS JOIN LATERAL (
+            SELECT timestamp, {', '.join(_DELTA_COLUMNS)} FROM rule_metrics
+            WHERE source = :source AND rule_id = r.rule_id AND timestamp > :last
+            ORDER BY timestamp LIMIT 1
+        ) n
+        CROSS JOIN LATERAL (
+            SELECT {', '.join(_DELTA_COLUMNS)} FROM rule_metrics
+            WHERE source = :source AND rule_id = r.rule_id AND timestamp < n.timestamp
+            ORDER BY timestamp DESC LIMIT 1
+        ) p
+    ), computed AS (
+        SELECT *, ({' OR '.join(f'{field} < previous_{field}' for field in _DELTA_COLUMNS)}) AS reset
+        FROM next_sample
+    )
+    UPDATE rule_metrics m SET
+        {', '.join(f'{field}_delta = CASE WHEN c.reset THEN c.{field} ELSE c.{field} - c.previous_{field} END' for field in _DELTA_COLUMNS)},
+        counter_reset = c.reset
+    FROM computed c
+    WHERE m.source = :source AND m.rule_id = c.rule_id AND m.timestamp = c.timestamp
+    RETURNING m.timestamp
+""")
+
+class BackfillService(Service):
+    """
+    Service para cargar ejecuciones historicas (python manage.py backfill).
+
+    Usa la misma ingesta que la API (deltas, COPY, agregados, execution_log) con
+    grupos grandes por transaccion, pero las muestras pueden caer antes de otras ya
+    guardadas (un hueco de semanas con la API caida). Cada tramo de ejecuciones sin
+    datos intermedios se carga en orden con:
+
+        - la ultima muestra de cada regla anterior al grupo como referencia de los deltas;
+        - en la misma transaccion de cada grupo, el delta de la primera muestra
+          posterior de cada regla recalculado y los agregados de los dias tocados
+          reconstruidos desde rule_metrics (ver _finish_batches).
+
+    Un tramo sin datos posteriores (`tail`) actualiza etiquetas y periodos de
+    inactividad igual que la API. En un tramo intermedio las etiquetas existentes
+    no cambian y los periodos de inactividad (inactivity_spans) no se tocan: se
+    armaron con las ejecuciones que si llegaron.
+    """
+
+    def __init__(self, db_model):
+        super().__init__(db_model)
+        self.tail = True
+        # Muestras posteriores corregidas y agregados reconstruidos (dias) desde que inicio la carga
+        self.repaired = 0
+        self.rebuilt_days = 0
+
+    def existing_runs(self, source: str, start: datetime, end: datetime) -> set:
+        """Timestamps de las ejecuciones de `source` ya guardadas en [start, end]."""
+        session = self.db_model.get_session()
+        try:
+            result = session.execute(EXISTING_RUNS_SQL, {"source": source, "start": start, "end": end})
+            return {row[0] for row in result}
+        finally:
+            session.close()
+
+    def next_run_after(self, source: str, moment: datetime):
+        """Primera muestra guardada de `source` posterior a `moment` (None si no hay)."""
+        session = self.db_model.get_session()
+        try:
+            return session.execute(NEXT_RUN_SQL, {"source": source, "moment": moment}).scalar()
+        finally:
+            session.close()
+
+    def begin_segment(self, tail: bool) -> None:
+        """
+        Prepara la carga de un tramo. La referencia de los deltas y las etiquetas guardadas
+        se leen en cada grupo (ver RuleSnapshots.load), no hace falta cargarlas aqui.
+        """
+        self.tail = tail
+
+    def _lock_sources(self, session, sources: list[str]) -> None:
+        """
+        Internal method: ademas de los bloqueos, busquedas por indice en todo el grupo.
+
+        Las estadisticas de las particiones no incluyen las filas de esta transaccion
+        (no hay ANALYZE hasta el commit): sin esto el planner recorre rule_metrics e
+        inactivity_spans completas en cada busqueda por regla.
+        """
+        super()._lock_sources(session, sources)
+        session.execute(text("SET LOCAL enable_seqscan = off"))
+
+    def _upsert_rules(self, session, source: str, rule_metrics_list):
+        """Internal method: en un tramo intermedio solo se agregan las reglas que no existen."""
+        if self.tail or not rule_metrics_list:
+            return super()._upsert_rules(session, source, rule_metrics_list)
+        rule_values = [
+            {'source': source, 'rule_id': data.id, 'rule_label': data.label}
+            for data in rule_metrics_list
+        ]
+        session.execute(postgresql.insert(Rule).values(rule_values).on_conflict_do_nothing(index_elements=['source', 'rule_id']))
+
+    def _update_inactivity_spans(self, session, source: str, rule_metrics_list, batch_timestamp: datetime):
+        """Internal method: los periodos de inactividad se actualizan una vez por grupo en _finish_batches."""
+
+    def _update_spans_for_group(self, session, source: str, batches: list[tuple]) -> None:
+        """
+        Internal method to apply a whole group to inactivity_spans.
+
+        Extender el mismo periodo en cada ejecucion del grupo deja una version de la
+        fila por ejecucion que no se puede limpiar antes del commit; por grupo se
+        aplica el resultado final de cada regla (ver collapse_spans).
+        """
+        extend, close, spans = collapse_spans(
+            (batch_timestamp, records) for batch_source, batch_timestamp, records in batches if batch_source == source
+        )
+        if extend:
+            rule_ids, since, last_seen, samples = (list(column) for column in zip(*extend))
+            session.execute(EXTEND_SPANS_MANY_SQL, {"source": source, "rule_ids": rule_ids, "since": since, "last_seen": last_seen, "samples": samples})
+        if close:
+            rule_ids, closed_at = (list(column) for column in zip(*close))
+            session.execute(CLOSE_SPANS_MANY_SQL, {"source": source, "rule_ids": rule_ids, "closed_at": closed_at})
+        if spans:
+            rule_ids, since, last_seen, closed_at, samples = (list(column) for column in zip(*spans))
+            session.execute(INSERT_SPANS_SQL, {
+                "source": source, "rule_ids": rule_ids, "since": since, "last_seen": last_seen, "closed_at": closed_at, "samples": samples
+            })
+
+    def _upsert_rollups(self, session, source: str, batch_timestamp: datetime) -> None:
+        """
+        Internal method: los agregados se reconstruyen una vez por grupo en _finish_batches.
+
+        Dentro de una transaccion larga el planner no ve las filas nuevas de la
+        particion (no hay ANALYZE hasta el commit) y cada upsert por lote la recorre
+        completa; una reconstruccion por dia es una sola lectura por grupo.
+        """
+
+    def _finish_batches(self, session, batches: list[tuple]) -> None:
+        """
+        Internal method to finish the group inside its ingest transaction, before the commit: spans, deltas after the group and rollups.
+
+        La primera muestra posterior de cada regla tenia su delta contra la muestra
+        anterior al hueco; se recalcula contra la ultima del grupo y se reconstruyen
+        los agregados de los dias del grupo y de las muestras corregidas. Todo va en el
+        mismo commit que las muestras del grupo: si la carga se interrumpe, lo guardado
+        queda consistente y la siguiente ejecucion sigue.
+        """
+        groups = {}
+        for source, batch_timestamp, records in batches:
+            first, last, rule_ids = groups.setdefault(source, [batch_timestamp, batch_timestamp, set()])
+            groups[source][0] = min(first, batch_timestamp)
+            groups[source][1] = max(last, batch_timestamp)
+            rule_ids.update(record.id for record in records)
+
+        for source, (first, last, rule_ids) in groups.items():
+            if self.tail:
+                self._update_spans_for_group(session, source, batches)
+            repaired = []
+            # En la cola solo hay muestras posteriores si la API guardo lotes durante la carga
+            if not self.tail or session.execute(NEXT_RUN_SQL, {"source": source, "moment": last}).scalar() is not None:
+                repaired = [
+                    row[0] for row in session.execute(
+                        REPAIR_NEXT_SAMPLE_SQL,
+                        {"source": source, "last": last, "rule_ids": sorted(rule_ids)}
+                    )
+                ]
+            self.repaired += len(repaired)
+            # Dias a reconstruir: los del grupo y los de cada muestra corregida
+            days = {_utc_day(moment) for moment in repaired}
+            day = _utc_day(first)
+            while day <= last:
+                days.add(day)
+                day += ONE_DAY
+            for start, end in _day_ranges(sorted(days)):
+                for table in ROLLUP_TABLES:
+                    delete_sql, insert_sql = rollup_rebuild_sql(table)
+                    params = {"source": source, "start": start, "end": end}
+                    session.execute(text(delete_sql), params)
+                    session.execute(text(insert_sql), params)
+            self.rebuilt_days += len(days)
+            self.logger.debug("Tramo de %s: %s muestras posteriores corregidas, %s dias de agregados reconstruidos.", source, len(repaired), len(days))
+
+def _utc_day(moment: datetime) -> datetime:
+    """Inicio del dia UTC de `moment`."""
+    return moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _day_ranges(days: list[datetime]) -> list[tuple[datetime, datetime]]:
+    """Agrupa dias ordenados en rangos [inicio, fin) de dias consecutivos."""
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], day + ONE_DAY)
+        else:
+            ranges.append((day, day + ONE_DAY))
+    return ranges
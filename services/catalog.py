@@ -0,0 +1,40 @@
+import threading
+from schemas.record import RuleMetricRecord
+
+class RuleCatalog:
+    """
+    Filtro de las reglas que se envian al upsert de la tabla rules.
+
+    Las etiquetas casi nunca cambian entre ejecuciones: solo se envian las reglas
+    nuevas o las que cambiaron de etiqueta. La etiqueta guardada viene de
+    RuleSnapshots.load, leida con el bloqueo del firewall tomado, asi que todos los
+    workers comparan contra la misma tabla.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Reglas que no se reenviaron a la base de datos
+        self.hits = 0
+        # Reglas nuevas o con etiqueta distinta
+        self.misses = 0
+
+    def changed(self, source: str, records: list[RuleMetricRecord], previous: dict) -> list[RuleMetricRecord]:
+        """Regresa solo los registros cuya regla no existe en el firewall o cambio de etiqueta."""
+        pending = []
+        for record in records:
+            sample = previous.get((source, record.id))
+            if sample is not None and sample.label == record.label:
+                continue
+            pending.append(record)
+        with self._lock:
+            self.misses += len(pending)
+            self.hits += len(records) - len(pending)
+        return pending
+
+    def stats(self) -> dict:
+        """Contadores para confirmar la reduccion de escrituras."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import text
+
+# Reclama las llaves de los lotes dentro de la transaccion de ingesta (despues del
+# bloqueo por firewall). Solo regresa las llaves que no se vieron dentro de la ventana:
+# las demas son lotes duplicados y no se escriben.
+CLAIM_KEYS_SQL = text("""
+    INSERT INTO ingest_dedupe AS d (source, dedupe_key, received_at)
+    SELECT * FROM unnest(CAST(:sources AS VARCHAR[]), CAST(:keys AS VARCHAR[]), CAST(:timestamps AS TIMESTAMPTZ[]))
+    ON CONFLICT (source, dedupe_key) DO UPDATE SET
+        received_at = EXCLUDED.received_at
+    WHERE d.received_at < EXCLUDED.received_at - make_interval(secs => :window)
+    RETURNING source, dedupe_key
+""")
+
+PURGE_KEYS_SQL = text("DELETE FROM ingest_dedupe WHERE received_at < :cutoff")
+
+class BatchDeduplicator:
+    """
+    Llaves de los lotes recibidos en una ventana de tiempo, para confirmar los
+    reintentos del script (y ejecuciones repetidas) sin volver a escribir metricas.
+
+    La llave es el encabezado Idempotency-Key o, si no viene, una huella del
+    contenido del lote. En memoria se guardan las llaves recientes del proceso
+    (respuesta inmediata, sin tocar la base); la tabla ingest_dedupe es la copia
+    compartida entre workers y reinicios, y se reclama en la misma transaccion
+    que las metricas del lote.
+
+    Variables de entorno:
+        INGEST_DEDUPE_SECONDS: ventana en segundos (por defecto 240, menor que el
+            intervalo del cron; 0 deshabilita la deduplicacion).
+        INGEST_DEDUPE_ENTRIES: llaves maximas en memoria (por defecto 10000).
+    """
+
+    DUPLICATE = "duplicate"
+
+    def __init__(self):
+        self.window = int(os.environ.get("INGEST_DEDUPE_SECONDS", "240"))
+        self.max_entries = int(os.environ.get("INGEST_DEDUPE_ENTRIES", "10000"))
+        # (source, llave) -> {"received_at", "batch_id"}, en orden de llegada
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = None
+        # Duplicados detectados en memoria y en la base de datos
+        self.memory_hits = 0
+        self.database_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def lookup(self, source: str, key: str) -> dict:
+        """Regresa el lote que ya se recibio con la llave dentro de la ventana, o None."""
+        if not self.enabled or key is None:
+            return None
+        with self._lock:
+            self._expire(datetime.now(timezone.utc))
+            entry = self._entries.get((source, key))
+            if entry is not None:
+                self.memory_hits += 1
+            return entry
+
+    def remember(self, source: str, key: str, received_at: datetime, batch_id: str = None) -> None:
+        """Registra la llave de un lote aceptado (conserva el batch_id si ya se conocia)."""
+        if not self.enabled or key is None:
+            return
+        with self._lock:
+            previous = self._entries.pop((source, key), None)
+            if batch_id is None and previous is not None:
+                batch_id = previous["batch_id"]
+            self._entries[(source, key)] = {"received_at": received_at, "batch_id": batch_id}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, source: str, key: str) -> None:
+        """Olvida la llave de un lote que no se pudo guardar, para que su reintento si se escriba."""
+        if key is None:
+            return
+        with self._lock:
+            self._entries.pop((source, key), None)
+
+    def claim(self, session, batches: list[tuple]) -> set:
+        """
+        Reclama en la base de datos las llaves de los lotes (source, llave, batch_timestamp).
+        Regresa los indices de los lotes duplicados (llave vista dentro de la ventana o
+        repetida en el mismo grupo). Las llaves quedan registradas con el commit de la sesion.
+        """
+        duplicates = set()
+        pending = {}
+        for index, (source, key, _) in enumerate(batches):
+            if key is None:
+                continue
+            if (source, key) in pending:
+                duplicates.add(index)
+            else:
+                pending[(source, key)] = index
+        if not pending:
+            return duplicates
+
+        self._purge(session, max(batches[index][2] for index in pending.values()))
+        result = session.execute(CLAIM_KEYS_SQL, {
+            "sources": [source for source, _ in pending],
+            "keys": [key for _, key in pending],
+            "timestamps": [batches[index][2] for index in pending.values()],
+            "window": self.window
+        })
+        claimed = {(row.source, row.dedupe_key) for row in result}
+        for source_key, index in pending.items():
+            if source_key not in claimed:
+                duplicates.add(index)
+        with self._lock:
+            self.database_hits += len(duplicates)
+        return duplicates
+
+    def stats(self) -> dict:
+        """Contadores para /api/v1/stats."""
+        with self._lock:
+            return {
+                "window_seconds": self.window,
+                "keys": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "database_hits": self.database_hits
+            }
+
+    def _expire(self, now: datetime) -> None:
+        """Internal method to drop the keys outside the window. Requires self._lock."""
+        cutoff = now - timedelta(seconds=self.window)
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry["received_at"] >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    def _purge(self, session, now: datetime) -> None:
+        """Internal method to delete the expired keys from the table, at most once per window."""
+        with self._lock:
+            if self._last_purge is not None and now - self._last_purge < timedelta(seconds=self.window):
+                return
+            self._last_purge = now
+        session.execute(PURGE_KEYS_SQL, {"cutoff": now - timedelta(seconds=self.window)})
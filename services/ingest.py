@@ -0,0 +1,245 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from schemas.record import RuleMetricRecord
+from models.model import DEFAULT_SOURCE
+from logger.logger import Logger
+
+# Estado de los lotes en ingest_batches (migracion 0008), compartido entre workers. Un
+# estado final nunca se reemplaza con 'queued'.
+STORE_STATUS_SQL = text("""
+    INSERT INTO ingest_batches AS b (batch_id, source, status, received_at)
+    SELECT * FROM unnest(
+        CAST(:batch_ids AS VARCHAR[]), CAST(:sources AS VARCHAR[]), CAST(:statuses AS VARCHAR[]), CAST(:timestamps AS TIMESTAMPTZ[])
+    )
+    ON CONFLICT (batch_id) DO UPDATE SET status = EXCLUDED.status
+    WHERE EXCLUDED.status <> 'queued'
+""")
+
+LOAD_STATUS_SQL = text("SELECT status FROM ingest_batches WHERE batch_id = :batch_id")
+
+PURGE_STATUS_SQL = text("DELETE FROM ingest_batches WHERE received_at < :cutoff")
+
+class IngestQueue:
+    """
+    Cola de ingesta asincrona para /api/v1/data.
+
+    La ruta solo interpreta el lote, lo encola y responde 202 con un batch_id.
+    Un hilo escritor junta los lotes encolados y los guarda en una sola
+    transaccion (group commit) con Service.add_metric_batches, asi una rafaga de
+    ejecuciones se guarda con un solo commit en lugar de una transaccion por POST.
+
+    El estado de cada lote se guarda en memoria y en la tabla ingest_batches: con
+    varios workers la consulta de un lote puede llegar a un worker que no lo encolo.
+    La tabla solo la escribe el hilo escritor ('queued' al tomar el grupo, antes de
+    guardarlo, y despues el estado final); la peticion solo encola. Otro worker no
+    conoce el lote mientras espera en la cola de este (a lo mas INGEST_FLUSH_MS mas
+    lo que tarde el grupo anterior).
+
+    Variables de entorno:
+        INGEST_QUEUE_SIZE: lotes maximos en espera (por defecto 100).
+        INGEST_FLUSH_BATCHES: lotes maximos por transaccion (por defecto 20).
+        INGEST_FLUSH_MS: espera maxima para juntar lotes, en milisegundos (por defecto 200).
+        INGEST_STATUS_HISTORY: estados de lotes que se conservan en memoria (por defecto 10000).
+        INGEST_STATUS_SECONDS: tiempo que se conserva el estado en ingest_batches (por defecto 86400).
+    """
+
+    QUEUED = "queued"
+    COMMITTED = "committed"
+    FAILED = "failed"
+
+    def __init__(self, service):
+        self.logger = Logger(__name__)
+        self.service = service
+        self.flush_batches = int(os.environ.get("INGEST_FLUSH_BATCHES", "20"))
+        self.flush_latency = int(os.environ.get("INGEST_FLUSH_MS", "200")) / 1000
+        self.status_history = int(os.environ.get("INGEST_STATUS_HISTORY", "10000"))
+        self.status_retention = int(os.environ.get("INGEST_STATUS_SECONDS", "86400"))
+        self._last_purge = None
+        self._queue = queue.Queue(maxsize=int(os.environ.get("INGEST_QUEUE_SIZE", "100")))
+        # batch_id -> estado, en orden de llegada para descartar los mas viejos
+        self._status = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._writer = None
+        self._last_timestamp = None
+        # Contadores para /api/v1/stats
+        self.committed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.flushes = 0
+
+    def start(self) -> None:
+        """Inicia el hilo escritor si no esta corriendo."""
+        with self._lock:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._stop.clear()
+            self._writer = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._writer.start()
+            self.logger.info("Hilo escritor de la cola de ingesta iniciado.")
+
+    def stop(self, timeout: float = 10) -> None:
+        """Detiene el hilo escritor despues de guardar lo que queda en la cola."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join(timeout)
+            self.logger.info("Hilo escritor de la cola de ingesta detenido.")
+
+    def submit(self, records: list[RuleMetricRecord], source: str = DEFAULT_SOURCE, dedupe_key: str = None) -> str:
+        """
+        Encola un lote. Regresa su batch_id, o None si la cola esta llena.
+        El timestamp del lote es el momento en que se recibio. La llave del lote
+        (dedupe_key) se registra al encolarlo, asi un reintento mientras espera
+        en la cola tambien se reconoce como duplicado.
+        """
+        self.start()
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            batch_timestamp = datetime.now(timezone.utc)
+            # Timestamps distintos por lote: los agregados se calculan por timestamp de lote
+            if self._last_timestamp is not None and batch_timestamp <= self._last_timestamp:
+                batch_timestamp = self._last_timestamp + timedelta(microseconds=1)
+            try:
+                self._queue.put_nowait((batch_id, source, batch_timestamp, records, dedupe_key))
+            except queue.Full:
+                self.rejected += 1
+                return None
+            self._last_timestamp = batch_timestamp
+            self._set_status(batch_id, self.QUEUED)
+        self.service.dedupe.remember(source, dedupe_key, batch_timestamp, batch_id)
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        """Estado de un lote (queued, committed o failed), o None si no se conoce."""
+        with self._lock:
+            status = self._status.get(batch_id)
+        if status is not None:
+            return status
+        # Lote encolado por otro worker (o ya fuera de la memoria de este)
+        session = None
+        try:
+            session = self.service.db_model.get_session()
+            return session.execute(LOAD_STATUS_SQL, {"batch_id": batch_id}).scalar()
+        except SQLAlchemyError as e:
+            self.logger.error("No se pudo consultar el estado del lote %s: %s", batch_id, e)
+            return None
+        finally:
+            if session:
+                session.close()
+
+    def stats(self) -> dict:
+        """Contadores de la cola."""
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "committed": self.committed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "flushes": self.flushes
+            }
+
+    def _set_status(self, batch_id: str, status: str) -> None:
+        """Internal method to record a batch status. Requires self._lock."""
+        self._status[batch_id] = status
+        self._status.move_to_end(batch_id)
+        while len(self._status) > self.status_history:
+            self._status.popitem(last=False)
+
+    def _run(self) -> None:
+        """Internal method: writer loop that groups queued batches and flushes them."""
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                group = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            # Junta lotes hasta llenar el grupo o agotar la espera
+            deadline = time.monotonic() + self.flush_latency
+            while len(group) < self.flush_batches:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    group.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Visible para los demas workers antes de la transaccion del grupo
+            self._store_status([item[:3] for item in group], self.QUEUED)
+            self._flush(group)
+
+    def _flush(self, group: list[tuple]) -> None:
+        """Internal method to write a group in one transaction."""
+        try:
+            # Los lotes duplicados (misma llave ya guardada por otro worker) se omiten y cuentan como guardados
+            if self.service.add_metric_batches([item[1:4] for item in group], [item[4] for item in group]):
+                self._finish(group, self.COMMITTED)
+                return
+            if len(group) == 1:
+                self._finish(group, self.FAILED)
+                return
+            # Un lote con problemas no debe tirar a los demas: se reintenta uno por uno
+            self.logger.warning("Fallo el grupo de %s lotes, se reintentan por separado.", len(group))
+            for item in group:
+                ok = self.service.add_metric_batches([item[1:4]], [item[4]])
+                self._finish([item], self.COMMITTED if ok else self.FAILED)
+        except Exception as e:
+            self.logger.critical("Error inesperado en el hilo escritor: %s", e)
+            self._finish(group, self.FAILED)
+        finally:
+            for _ in group:
+                self._queue.task_done()
+
+    def _finish(self, group: list[tuple], status: str) -> None:
+        """Internal method to publish the result of a flush."""
+        if status == self.FAILED:
+            # Sin olvidar la llave el reintento del script se confirmaria sin guardarse
+            for _, source, _, _, dedupe_key in group:
+                self.service.dedupe.forget(source, dedupe_key)
+        with self._lock:
+            for batch_id, *_ in group:
+                self._set_status(batch_id, status)
+            if status == self.COMMITTED:
+                self.committed += len(group)
+            else:
+                self.failed += len(group)
+            self.flushes += 1
+        self._store_status([(batch_id, source, batch_timestamp) for batch_id, source, batch_timestamp, _, _ in group], status)
+        self.logger.info("Cola de ingesta: %s lotes %s.", len(group), status)
+
+    def _store_status(self, batches: list[tuple], status: str) -> None:
+        """
+        Internal method to save the status of (batch_id, source, batch_timestamp) batches in ingest_batches.
+        Si la base no responde el estado solo queda en la memoria de este worker.
+        """
+        session = None
+        try:
+            session = self.service.db_model.get_session()
+            self._purge_status(session, batches[-1][2])
+            session.execute(STORE_STATUS_SQL, {
+                "batch_ids": [batch_id for batch_id, _, _ in batches],
+                "sources": [source for _, source, _ in batches],
+                "statuses": [status] * len(batches),
+                "timestamps": [batch_timestamp for _, _, batch_timestamp in batches]
+            })
+            session.commit()
+        except SQLAlchemyError as e:
+            if session:
+                session.rollback()
+            self.logger.error("No se pudo guardar el estado de %s lotes (%s): %s", len(batches), status, e)
+        finally:
+            if session:
+                session.close()
+
+    def _purge_status(self, session, now: datetime) -> None:
+        """Internal method to delete the old statuses from the table, at most once per retention period."""
+        with self._lock:
+            if self._last_purge is not None and now - self._last_purge < timedelta(seconds=self.status_retention):
+                return
+            self._last_purge = now
+        session.execute(PURGE_STATUS_SQL, {"cutoff": now - timedelta(seconds=self.status_retention)})
@@ -0,0 +1,129 @@
+from datetime import datetime, timezone, timedelta
+from services.snapshot import RuleSnapshots
+
+# Contadores agregados en rule_metrics_hourly y rule_metrics_daily
+ROLLUP_METRICS = RuleSnapshots.DELTA_FIELDS
+
+# Tabla de agregados -> precision de date_trunc
+ROLLUP_TABLES = {
+    "rule_metrics_hourly": "hour",
+    "rule_metrics_daily": "day",
+}
+
+ONE_HOUR = timedelta(hours=1)
+ONE_DAY = timedelta(days=1)
+
+def rollup_upsert_sql(table: str) -> str:
+    """
+    Construye el INSERT ... SELECT ... ON CONFLICT que acumula en `table` las
+    filas de rule_metrics escritas por un firewall (:source) con un timestamp de
+    lote (:batch_timestamp). Los periodos se calculan en UTC.
+    """
+    precision = ROLLUP_TABLES[table]
+    insert_columns = ["source", "rule_id", "bucket_start", "sample_count", "first_sample_at", "last_sample_at"]
+    select_columns = [
+        "source",
+        "rule_id",
+        f"date_trunc('{precision}', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'",
+        "1",
+        "timestamp",
+        "timestamp",
+    ]
+    updates = [
+        "sample_count = t.sample_count + EXCLUDED.sample_count",
+        "last_sample_at = EXCLUDED.last_sample_at",
+    ]
+    for metric in ROLLUP_METRICS:
+        insert_columns += [f"{metric}_first", f"{metric}_last", f"{metric}_delta", f"{metric}_delta_min", f"{metric}_delta_max"]
+        delta = f"COALESCE({metric}_delta, 0)"
+        select_columns += [metric, metric, delta, delta, delta]
+        updates += [
+            f"{metric}_last = EXCLUDED.{metric}_last",
+            f"{metric}_delta = t.{metric}_delta + EXCLUDED.{metric}_delta",
+            f"{metric}_delta_min = LEAST(t.{metric}_delta_min, EXCLUDED.{metric}_delta_min)",
+            f"{metric}_delta_max = GREATEST(t.{metric}_delta_max, EXCLUDED.{metric}_delta_max)",
+        ]
+    return (
+        f"INSERT INTO {table} AS t ({', '.join(insert_columns)}) "
+        f"SELECT {', '.join(select_columns)} FROM rule_metrics WHERE timestamp = :batch_timestamp AND source = :source "
+        f"ON CONFLICT (source, rule_id, bucket_start) DO UPDATE SET {', '.join(updates)}"
+    )
+
+def rollup_rebuild_sql(table: str) -> tuple[str, str]:
+    """
+    Construye (DELETE, INSERT ... SELECT) que recalculan desde rule_metrics los
+    periodos de `table` de un firewall (:source) en [:start, :end), con limites
+    alineados al dia. Se usa cuando llegan muestras fuera de orden (carga de
+    historicos) y el acumulado de rollup_upsert_sql ya no sirve.
+    """
+    precision = ROLLUP_TABLES[table]
+    insert_columns = ["source", "rule_id", "bucket_start", "sample_count", "first_sample_at", "last_sample_at"]
+    select_columns = [
+        "source",
+        "rule_id",
+        f"date_trunc('{precision}', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'",
+        "COUNT(*)",
+        "MIN(timestamp)",
+        "MAX(timestamp)",
+    ]
+    for metric in ROLLUP_METRICS:
+        insert_columns += [f"{metric}_first", f"{metric}_last", f"{metric}_delta", f"{metric}_delta_min", f"{metric}_delta_max"]
+        delta = f"COALESCE({metric}_delta, 0)"
+        select_columns += [
+            f"(array_agg({metric} ORDER BY timestamp))[1]",
+            f"(array_agg({metric} ORDER BY timestamp DESC))[1]",
+            f"SUM({delta})",
+            f"MIN({delta})",
+            f"MAX({delta})",
+        ]
+    delete_sql = f"DELETE FROM {table} WHERE source = :source AND bucket_start >= :start AND bucket_start < :end"
+    insert_sql = (
+        f"INSERT INTO {table} ({', '.join(insert_columns)}) "
+        f"SELECT {', '.join(select_columns)} FROM rule_metrics "
+        f"WHERE source = :source AND timestamp >= :start AND timestamp < :end GROUP BY 1, 2, 3"
+    )
+    return delete_sql, insert_sql
+
+def _floor(moment: datetime, step: timedelta) -> datetime:
+    """Redondea hacia abajo a la hora o al dia (UTC)."""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if step == ONE_DAY:
+        moment = moment.replace(hour=0)
+    return moment
+
+def _ceil(moment: datetime, step: timedelta) -> datetime:
+    """Redondea hacia arriba a la hora o al dia (UTC)."""
+    floor = _floor(moment, step)
+    return floor if floor == moment else floor + step
+
+def split_range(start: datetime, end: datetime) -> list[tuple]:
+    """
+    Divide el rango [start, end) en segmentos (fuente, inicio, fin), usando el
+    agregado mas grueso que lo cubre: dias completos en rule_metrics_daily, horas
+    completas en rule_metrics_hourly y muestras crudas solo en los bordes parciales.
+    """
+    start = start.astimezone(timezone.utc)
+    end = end.astimezone(timezone.utc)
+    segments = []
+
+    def raw(segment_start, segment_end):
+        if segment_start < segment_end:
+            segments.append(("rule_metrics", segment_start, segment_end))
+
+    def hours(segment_start, segment_end):
+        hour_start, hour_end = _ceil(segment_start, ONE_HOUR), _floor(segment_end, ONE_HOUR)
+        if hour_start < hour_end:
+            raw(segment_start, hour_start)
+            segments.append(("rule_metrics_hourly", hour_start, hour_end))
+            raw(hour_end, segment_end)
+        else:
+            raw(segment_start, segment_end)
+
+    day_start, day_end = _ceil(start, ONE_DAY), _floor(end, ONE_DAY)
+    if day_start < day_end:
+        hours(start, day_start)
+        segments.append(("rule_metrics_daily", day_start, day_end))
+        hours(day_end, end)
+    else:
+        hours(start, end)
+    return segments
@@ -1,207 +1,654 @@
-from datetime import datetime, timezone
+import csv
+import io
+import os
+from datetime import date, datetime, timezone, timedelta
 from flask import jsonify
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import func, and_, text
+from sqlalchemy import func, and_, text, insert
 from sqlalchemy.dialects import postgresql
-from models.model import RuleMetric, Rule, InactiveRuleLog, MonthlyExecutionCount
+from sqlalchemy.util import await_only
+from models.model import RuleMetric, Rule, InactiveRuleLog, ExecutionLog, DEFAULT_SOURCE
+from schemas.record import RuleMetricRecord
+from services.snapshot import RuleSnapshots
+from services.catalog import RuleCatalog
+from services.rollup import ROLLUP_TABLES, rollup_upsert_sql, split_range
+from services.spans import EXTEND_SPANS_SQL, CLOSE_SPANS_SQL, split_by_activity, idle_rules_query
+from services.dedupe import BatchDeduplicator
+from services.suppress import SampleSuppressor
+from services.topk import TopRulesCache, top_rules_query
+from metrics.metrics import StageTimer, INGEST_STAGE_SECONDS
 from logger.logger import Logger
 
+# Tolerancia por defecto para considerar una regla sin uso
+DEFAULT_TOLERANCE = 100
+
+# Metricas que se pueden comparar en /api/v1/inactive -> columna en rule_metrics
+INACTIVITY_METRICS = {
+    "bytes": "bytes_matched",
+    "packets": "packets_matched",
+    "evaluations": "evaluations",
+    "states": "states_created",
+}
+
+# Primer argumento de pg_advisory_xact_lock(int, int): separa los bloqueos por
+# firewall de cualquier otro bloqueo consultivo de la base de datos
+SOURCE_LOCK_CLASS = 7301
+
+# Filas que se traen por viaje del cursor del lado del servidor al generar NDJSON
+INACTIVE_STREAM_BATCH = 500
+
 class Service:
     """Service class to that implements the logic"""
 
     def __init__(self, db_model):
-        self.logger = Logger()
+        self.logger = Logger(__name__)
         self.db_model = db_model
+        # Muestra anterior de cada regla para calcular deltas (se lee en la transaccion)
+        self.snapshots = RuleSnapshots()
+        # Filtro de reglas sin cambios de etiqueta para no reescribirlas
+        self.rule_catalog = RuleCatalog()
+        # INACTIVE_RULE_LOG=1 sigue escribiendo una fila por regla inactiva en cada
+        # ejecucion (inactive_rule_log) ademas de los periodos de inactividad
+        self.write_inactive_log = os.environ.get("INACTIVE_RULE_LOG", "0") == "1"
+        # Llaves de los lotes recientes para no guardar dos veces un reintento
+        self.dedupe = BatchDeduplicator()
+        # SUPPRESS_UNCHANGED=1 solo escribe las muestras con cambios (y una por periodo de heartbeat)
+        self.suppressor = SampleSuppressor()
+        # Resultados recientes de /api/v1/rules/top
+        self.top_cache = TopRulesCache()
 
-    def _upsert_monthly_execution_count(self, session) -> None:
-        """
-        Increments the execution count for the current month.
-        Inserts if the month does not exist, updates if it does.
+    def get_cache_stats(self) -> dict:
+        """Regresa las estadisticas de los caches en memoria."""
+        return {
+            "rule_catalog": self.rule_catalog.stats(),
+            "dedupe": self.dedupe.stats(),
+            "suppressed_samples": self.suppressor.stats(),
+            "top_rules": self.top_cache.stats()
+        }
+
+    def get_pool_stats(self) -> dict:
+        """Regresa el uso del pool de conexiones a la base de datos."""
+        return self.db_model.get_pool_stats()
+
+    def get_read_stats(self) -> dict:
+        """Regresa el uso del engine de lectura (vacio si las lecturas usan el pool principal)."""
+        return self.db_model.get_read_stats()
+
+    def _log_executions(self, session, batches: list[tuple]) -> None:
         """
-        # Calcular el primer día del mes actual en UTC
-        today_utc = datetime.now(timezone.utc)
-        current_month_start_date = today_utc.replace(day=1, hour=0, minute=0, second=0, microsecond=0).date()
+        Registra cada lote como una ejecucion de su firewall en execution_log.
 
-        # Usar INSERT ... ON CONFLICT DO UPDATE
-        insert_stmt = postgresql.insert(MonthlyExecutionCount).values(
-            month_start_date=current_month_start_date,
-            execution_count=1, # Si es una nueva entrada, el conteo inicial es 1
-            last_updated_at=today_utc
-        )
-        on_conflict_stmt = insert_stmt.on_conflict_do_update(
-            index_elements=['month_start_date'], # La columna con la restricción UNIQUE
-            set_={
-                'execution_count': MonthlyExecutionCount.execution_count + 1, # Incrementa el conteo
-                'last_updated_at': today_utc # Actualiza la marca de tiempo
-            }
-        )
-        session.execute(on_conflict_stmt)
-        self.logger.debug(f"Contador mensual de ejecuciones actualizado {current_month_start_date}.")
+        Solo se inserta: a diferencia del antiguo UPDATE de la fila del mes, dos
+        ingestas simultaneas no esperan el bloqueo de la misma fila ni dejan tuplas
+        muertas. El conteo exacto del mes es monthly_execution_counts (meses ya
+        compactados) + execution_log, ver la vista monthly_execution_totals.
+        """
+        rows = [(source, batch_timestamp) for source, batch_timestamp, _ in batches]
+        self._bulk_write(session, ExecutionLog.__table__, ("source", "executed_at"), rows)
+        self.logger.debug("%s ejecuciones registradas.", len(rows))
 
-    def add_metrics(self, rule_metrics_list: list[dict]) -> bool:
+    def add_metrics(self, rule_metrics_list: list[RuleMetricRecord], source: str = DEFAULT_SOURCE, dedupe_key: str = None):
         """
         Adds a list of parsed to the database.
         This method handles the business logic for saving rule metrics.
 
         Args:
-            rule_metrics_list: A list of dictionaries, where each dictionary
+            rule_metrics_list: A list of RuleMetricRecord, where each record
                                represents a parsed pfctl rule metric.
+            source: Identificador del firewall que envio el lote.
+            dedupe_key: Llave del lote (Idempotency-Key o huella del contenido).
         Returns:
             bool: True if insertion was successful, False otherwise.
+            BatchDeduplicator.DUPLICATE si la llave ya se habia guardado dentro de la ventana.
         """
-        self.logger.debug(f"Datos recibidos en add_metrics: {rule_metrics_list}")
+        self.logger.debug_payload("Datos recibidos en add_metrics (%s): %s", source, rule_metrics_list)
+        # Un solo timestamp para todas las filas del lote
+        saved, duplicates = self._save_batches([(source, datetime.now(timezone.utc), rule_metrics_list)], [dedupe_key])
+        if saved and duplicates:
+            return BatchDeduplicator.DUPLICATE
+        return saved
+
+    def add_metric_batches(self, batches: list[tuple], dedupe_keys: list = None) -> bool:
+        """
+        Guarda uno o varios lotes en una sola transaccion (group commit).
+
+        Cada lote es una ejecucion del script en un firewall: (source,
+        batch_timestamp, lista de RuleMetricRecord). Los lotes se escriben en
+        orden, cada uno con su propio timestamp, y los deltas de un lote se
+        calculan contra el lote anterior del mismo firewall en el grupo aunque
+        todavia no se haya hecho commit.
+
+        Las escrituras de un firewall se serializan con un bloqueo consultivo por
+        source; firewalls distintos no comparten filas y no se bloquean entre si.
+
+        `dedupe_keys` (opcional) trae la llave de cada lote: los lotes cuya llave ya
+        se guardo dentro de la ventana se omiten sin escribir nada.
+
+        Returns:
+            bool: True si todos los lotes se guardaron (u omitieron por duplicados), False si se hizo rollback.
+        """
+        return self._save_batches(batches, dedupe_keys)[0]
+
+    def _save_batches(self, batches: list[tuple], dedupe_keys: list = None) -> tuple[bool, set]:
+        """Internal method behind add_metric_batches. Regresa (guardado, indices de los lotes duplicados)."""
         session = None
+        duplicates = set()
+        # Tiempo por etapa para /metrics (se observa solo si se hizo commit)
+        timer = StageTimer(INGEST_STAGE_SECONDS)
         try:
+            # La particion del periodo debe existir antes del COPY (la crea `manage.py partitions`)
+            for _, batch_timestamp, _ in batches:
+                self.db_model.check_partitions(batch_timestamp)
+
             session = self.db_model.get_session()
 
-            # Añadir a rules
+            # Bloqueo por firewall, siempre en el mismo orden para no tener deadlocks entre grupos
+            sources = sorted({source for source, _, _ in batches})
+            self._lock_sources(session, sources)
+
+            # Lotes ya guardados con la misma llave (reintentos, cron encimado): se confirman sin escribir
+            if dedupe_keys and self.dedupe.enabled and any(key is not None for key in dedupe_keys):
+                with timer.stage("dedupe"):
+                    duplicates = self.dedupe.claim(session, [
+                        (source, key, batch_timestamp) for (source, batch_timestamp, _), key in zip(batches, dedupe_keys)
+                    ])
+                if duplicates:
+                    self.logger.info("Se omiten %s lotes duplicados.", len(duplicates))
+                    for index in duplicates:
+                        source, batch_timestamp, _ = batches[index]
+                        self.dedupe.remember(source, dedupe_keys[index], batch_timestamp)
+                    kept = [index for index in range(len(batches)) if index not in duplicates]
+                    batches = [batches[index] for index in kept]
+                    dedupe_keys = [dedupe_keys[index] for index in kept]
+                    if not batches:
+                        session.commit()
+                        return True, duplicates
+
+            # Deltas contra la ultima muestra guardada de cada regla (leida despues del bloqueo)
+            with timer.stage("deltas"):
+                previous = self.snapshots.load(session, batches)
+                pending_snapshots = {}
+                deltas = [
+                    self.snapshots.compute_deltas(source, records, previous, pending_snapshots)
+                    for source, _, records in batches
+                ]
+
+            # Modo por cambios: solo se escriben las muestras con algun contador distinto a la
+            # ultima guardada o la primera del periodo de heartbeat (los deltas omitidos son 0)
+            written = [range(len(records)) for _, _, records in batches]
+            pending_written = {}
+            if self.suppressor.enabled:
+                with timer.stage("suppress"):
+                    written = [
+                        self.suppressor.select(source, records, batch_timestamp, previous, pending_written)
+                        for source, batch_timestamp, records in batches
+                    ]
+
+            # Añadir a rules (solo las nuevas o con etiqueta distinta, la ultima etiqueta del grupo gana)
             self.logger.debug("Añadiendo/Actualizando datos en la tabla 'rules'")
-            self._upsert_rules(session, rule_metrics_list)
-
-            # Añadir rule metrics
-            self.logger.debug("Añadiendo datos en la tabla 'rule_metrics'")
-            self._add_rule_metrics(session, rule_metrics_list)
-
-            # Añadir inactive rule logs
-            self.logger.debug("Añadiendo datos en la tabla 'inactive_rule_log'")
-            # Logica para encontrar reglas sin uso
-            inactive_rules = self.get_inactive_rules_from_this_batch(rule_metrics_list)
-            self.logger.debug(f"Lista de reglas inactivas: {inactive_rules}")
-            self._add_inactive_rules_log(session, inactive_rules)
-
-            # Incrementar el contador de ejecuciones mensuales
-            self.logger.debug("Incrementando el contador de ejecuciones mensuales.")
-            self._upsert_monthly_execution_count(session) # Llamada a la nueva función
-
-            session.commit()
-            self.logger.info(f"Batch de métricas procesado y guardado exitosamente. Reglas: {len(rule_metrics_list)}")
-            return True
+            latest_rules = {source: {} for source in sources}
+            for source, _, records in batches:
+                for record in records:
+                    latest_rules[source][record.id] = record
+            changed_rules = {
+                source: self.rule_catalog.changed(source, list(records.values()), previous)
+                for source, records in latest_rules.items()
+            }
+            with timer.stage("rule_upsert"):
+                for source in sources:
+                    self._upsert_rules(session, source, changed_rules[source])
+
+            total_rules = 0
+            total_written = 0
+            for (source, batch_timestamp, rule_metrics_list), batch_deltas, indices in zip(batches, deltas, written):
+                # Añadir rule metrics
+                self.logger.debug("Añadiendo datos en la tabla 'rule_metrics'")
+                with timer.stage("metric_insert"):
+                    self._add_rule_metrics(
+                        session, source,
+                        [rule_metrics_list[index] for index in indices],
+                        [batch_deltas[index] for index in indices],
+                        batch_timestamp
+                    )
+                total_written += len(indices)
+
+                # Periodos de inactividad: se abren/extienden para las reglas sin trafico y se cierran para las demas
+                self.logger.debug("Actualizando 'inactivity_spans'")
+                with timer.stage("inactivity_spans"):
+                    self._update_inactivity_spans(session, source, rule_metrics_list, batch_timestamp)
+                if self.write_inactive_log:
+                    with timer.stage("inactive_log_insert"):
+                        inactive_rules = self.get_inactive_rules_from_this_batch(rule_metrics_list)
+                        self.logger.debug_payload("Lista de reglas inactivas: %s", inactive_rules)
+                        self._add_inactive_rules_log(session, source, inactive_rules, batch_timestamp)
+
+                # Actualizar los agregados por hora y por dia
+                self.logger.debug("Actualizando agregados en 'rule_metrics_hourly' y 'rule_metrics_daily'")
+                with timer.stage("rollup_upsert"):
+                    self._upsert_rollups(session, source, batch_timestamp)
+                total_rules += len(rule_metrics_list)
+
+            # Registrar las ejecuciones (contador mensual sin filas compartidas)
+            self.logger.debug("Registrando las ejecuciones en 'execution_log'.")
+            with timer.stage("counter_insert"):
+                self._log_executions(session, batches)
+            self._finish_batches(session, batches)
+
+            with timer.stage("commit"):
+                session.commit()
+            timer.observe()
+            # Los caches solo avanzan si los lotes quedaron guardados
+            if self.suppressor.enabled:
+                self.suppressor.update(total_written, total_rules - total_written)
+            if dedupe_keys:
+                for (source, batch_timestamp, _), key in zip(batches, dedupe_keys):
+                    self.dedupe.remember(source, key, batch_timestamp)
+            self.logger.info("Batch de métricas procesado y guardado exitosamente. Firewalls: %s, lotes: %s, reglas: %s", len(sources), len(batches), total_rules)
+            return True, duplicates
         except SQLAlchemyError as e:
             if session:
                 session.rollback()
                 self.logger.debug("Rollback")
-            self.logger.critical(f"Error en la base de datos durante la insercion: {e}")
-            return False
+            self.logger.critical("Error en la base de datos durante la insercion: %s", e)
+            return False, duplicates
         except Exception as e:
-            self.logger.critical(f"Ocurrio un error inesperado en el servicio durante la insercion: {e}")
-            return False
+            self.logger.critical("Ocurrio un error inesperado en el servicio durante la insercion: %s", e)
+            return False, duplicates
         finally:
             if session:
                 session.close()
                 self.logger.debug("Sesion cerrada")
 
-    def _upsert_rules(self, session, rule_metrics_list: list[dict]):
+    def _finish_batches(self, session, batches: list[tuple]) -> None:
+        """Internal hook that runs in the ingest transaction just before the commit (see services/backfill.py)."""
+
+    def _lock_sources(self, session, sources: list[str]) -> None:
+        """Internal method to take the per-firewall advisory locks (released on commit/rollback)."""
+        if session.get_bind().dialect.name != "postgresql":
+            return
+        for source in sources:
+            session.execute(
+                text("SELECT pg_advisory_xact_lock(:lock_class, hashtext(:source))"),
+                {"lock_class": SOURCE_LOCK_CLASS, "source": source}
+            )
+        self.logger.debug("Bloqueos por firewall tomados: %s", sources)
+
+    def _upsert_rules(self, session, source: str, rule_metrics_list: list[RuleMetricRecord]):
         """Internal method to add/update rules using ON CONFLICT for efficiency."""
+        if not rule_metrics_list:
+            self.logger.debug("Sin reglas nuevas o modificadas, se omite el upsert.")
+            return
         # Prepara los valores para la inserción en lote
         rule_values = []
         for data in rule_metrics_list:
             rule_values.append({
-                'rule_id': data['id'],
-                'rule_label': data['label']
+                'source': source,
+                'rule_id': data.id,
+                'rule_label': data.label
             })
 
         # Construye la declaración de inserción con ON CONFLICT DO UPDATE
         insert_stmt = postgresql.insert(Rule).values(rule_values)
         on_conflict_stmt = insert_stmt.on_conflict_do_update(
-            index_elements=['rule_id'], # El campo que define la unicidad
-            set_={'rule_label': insert_stmt.excluded.rule_label} # Actualiza el label si cambia
+            index_elements=['source', 'rule_id'], # Los campos que definen la unicidad
+            set_={'rule_label': insert_stmt.excluded.rule_label}, # Actualiza el label si cambia
+            where=Rule.rule_label.is_distinct_from(insert_stmt.excluded.rule_label) # Evita reescribir filas iguales
         )
         session.execute(on_conflict_stmt)
-        self.logger.debug(f"{len(rule_values)} reglas actualizadas en batch.")
+        self.logger.debug("%s reglas actualizadas en batch.", len(rule_values))
     
-    def _add_rule_metrics(self, session, rule_metrics_list: list[dict]):
+    def _bulk_write(self, session, table, columns: tuple, rows: list[tuple]) -> None:
+        """
+        Internal method to write many rows in the session's current transaction.
+
+        Con psycopg2 las filas se envian con COPY ... FROM STDIN desde un buffer en
+        memoria (sin un INSERT ni un RETURNING por fila); con asyncpg (asgi.py) con
+        COPY en formato binario (copy_records_to_table). Con otros drivers se usa un
+        INSERT de varias filas que no regresa nada.
+        """
+        if not rows:
+            return
+        connection = session.connection()
+        if connection.dialect.driver == "psycopg2":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            copy_sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+            with connection.connection.cursor() as cursor:
+                cursor.copy_expert(copy_sql, buffer)
+        elif connection.dialect.driver == "asyncpg":
+            # Dentro de greenlet_spawn: await_only cede el event loop mientras se envia el COPY
+            driver_connection = connection.connection.driver_connection
+            await_only(driver_connection.copy_records_to_table(table.name, records=rows, columns=list(columns)))
+        else:
+            connection.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+    def _add_rule_metrics(self, session, source: str, rule_metrics_list: list[RuleMetricRecord], deltas: list[tuple], batch_timestamp: datetime):
         """Internal method to add rule metrics in batch."""
-        metric_objects = []
-        for metric_data in rule_metrics_list:
-            metric_objects.append(RuleMetric(
-                rule_id=metric_data['id'],
-                evaluations=metric_data['evaluations'],
-                packets_matched=metric_data['packets_matched'],
-                bytes_matched=metric_data['bytes_matched'],
-                states_created=metric_data['states_created'],
-                state_packets=metric_data['state_packets'],
-                state_bytes=metric_data['state_bytes'],
-                input_output=metric_data.get('input_output')
-            ))
-        session.add_all(metric_objects) # Mejorar rendimiento: agregar todos a la vez
-        self.logger.debug(f"{len(metric_objects)} rule metrics agregadas en batch.")
-
-    def _add_inactive_rules_log(self, session, inactive_rules_data: list[dict]):
+        columns = (
+            "timestamp", "source", "rule_id", "evaluations", "packets_matched", "bytes_matched",
+            "states_created", "state_packets", "state_bytes", "input_output",
+            "evaluations_delta", "packets_matched_delta", "bytes_matched_delta",
+            "states_created_delta", "counter_reset",
+        )
+        rows = [
+            (
+                batch_timestamp,
+                source,
+                metric_data.id,
+                metric_data.evaluations,
+                metric_data.packets_matched,
+                metric_data.bytes_matched,
+                metric_data.states_created,
+                metric_data.state_packets,
+                metric_data.state_bytes,
+                metric_data.input_output
+            ) + metric_deltas
+            for metric_data, metric_deltas in zip(rule_metrics_list, deltas)
+        ]
+        self._bulk_write(session, RuleMetric.__table__, columns, rows)
+        self.logger.debug("%s rule metrics agregadas en batch.", len(rows))
+
+    def _add_inactive_rules_log(self, session, source: str, inactive_rules_data: list[dict], batch_timestamp: datetime):
         """Internal method to add inactive rule logs in batch."""
-        log_objects = []
-        for logs_data in inactive_rules_data:
-            log_objects.append(InactiveRuleLog(
-                rule_id=logs_data['rule_id'],
-            ))
-        session.add_all(log_objects) # Agregar todos a la vez
-        self.logger.debug(f"{len(log_objects)} inactive rule logs agregadas en batch.")
-
-    def get_inactive_rules(self, start_date: datetime, end_date: datetime) -> list[dict]:
+        rows = [(source, logs_data['rule_id'], batch_timestamp) for logs_data in inactive_rules_data]
+        self._bulk_write(session, InactiveRuleLog.__table__, ("source", "rule_id", "created_at"), rows)
+        self.logger.debug("%s inactive rule logs agregadas en batch.", len(rows))
+
+    def _update_inactivity_spans(self, session, source: str, rule_metrics_list: list[RuleMetricRecord], batch_timestamp: datetime):
+        """
+        Internal method to keep one open inactivity span per idle rule.
+
+        Una regla inactiva en ejecuciones seguidas actualiza su mismo periodo (sin
+        filas nuevas); al volver a tener trafico el periodo se cierra.
+        """
+        idle_ids, active_ids = split_by_activity(rule_metrics_list)
+        params = {"source": source, "batch_timestamp": batch_timestamp}
+        if active_ids:
+            session.execute(CLOSE_SPANS_SQL, dict(params, rule_ids=active_ids))
+        if idle_ids:
+            session.execute(EXTEND_SPANS_SQL, dict(params, rule_ids=idle_ids))
+        self.logger.debug("Periodos de inactividad actualizados: %s reglas inactivas, %s activas.", len(idle_ids), len(active_ids))
+
+    def _upsert_rollups(self, session, source: str, batch_timestamp: datetime) -> None:
+        """Internal method to fold the batch just written into the hourly/daily rollups."""
+        for table in ROLLUP_TABLES:
+            session.execute(text(rollup_upsert_sql(table)), {"source": source, "batch_timestamp": batch_timestamp})
+        self.logger.debug("Agregados por hora y por dia actualizados.")
+
+    def get_inactive_rules(self, start_date: datetime, end_date: datetime, tolerance: int = DEFAULT_TOLERANCE,
+                           metric: str = "bytes", after: int = None, limit: int = None,
+                           source: str = None, after_source: str = None) -> list[dict]:
+        """
+        Regresa las reglas cuya actividad en el rango fue menor a `tolerance`.
+
+        Args:
+            start_date: Inicio del rango (inclusivo). Sin zona horaria se interpreta en UTC.
+            end_date: Fin del rango (inclusivo).
+            tolerance: Actividad minima para considerar una regla en uso.
+            metric: Contador comparado: bytes, packets, evaluations o states.
+            after: Paginacion por llave: solo reglas con rule_id mayor a este valor.
+            limit: Numero maximo de reglas a regresar.
+            source: Firewall consultado; None consulta todos los firewalls.
+            after_source: Sin `source`, firewall de la ultima regla recibida (junto con `after`).
+        """
         session = None
         inactive_rules = []
         try:
-            session = self.db_model.get_session()
-            
-            # --- Consulta SQL para identificar reglas inactivas con funciones de ventana ---
-            # SQLAlchemy puede construir esto, pero a veces es más claro y fácil
-            # usar text() para consultas complejas con funciones de ventana,
-            # especialmente al principio.
-
-            # Tolerancia como una constante o parámetro
-            BYTES_TOLERANCE = 100
-
-            # Nota: Los placeholders ':start_date' y ':end_date' son para seguridad (prevención de SQL Injection)
-            sql_query = text(f"""
-                SELECT DISTINCT
-                    subquery.rule_id,
-                    subquery.rule_label
-                FROM (
-                    SELECT
-                        rm.rule_id,
-                        rm.rule_label,
-                        FIRST_VALUE(rm.bytes_matched) OVER (PARTITION BY rm.rule_id ORDER BY rm.timestamp ASC) AS first_bytes_matched,
-                        LAST_VALUE(rm.bytes_matched) OVER (PARTITION BY rm.rule_id ORDER BY rm.timestamp ASC RANGE BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS last_bytes_matched
-                    FROM
-                        rule_metrics rm
-                    WHERE
-                        rm.timestamp >= :start_date AND rm.timestamp <= :end_date
-                ) AS subquery
-                WHERE
-                    ABS(subquery.last_bytes_matched - subquery.first_bytes_matched) < :tolerance; -- Condición de inactividad con tolerancia
-            """)
-            
+            session = self.db_model.get_read_session()
+
+            sql_query, params = self._build_inactive_rules_query(
+                start_date, end_date, tolerance, metric, after, limit, source, after_source
+            )
+            if sql_query is None:
+                return []
+
             # Ejecutar la consulta con parámetros
-            result = session.execute(
-                sql_query,
-                {"start_date": start_date, "end_date": end_date, "tolerance": BYTES_TOLERANCE}
-            ).fetchall()
+            result = session.execute(sql_query, params).fetchall()
 
-            self.logger.debug(f"Resultados: {result}")
+            self.logger.debug_payload("Resultados: %s", result)
 
             # Convertir los resultados a una lista de diccionarios
             for row in result:
-                inactive_rules.append({"rule_id": row.rule_id, "rule_label": row.rule_label})
+                inactive_rules.append({"firewall": row.source, "rule_id": row.rule_id, "rule_label": row.rule_label})
 
-            self.logger.info(f"Found {len(inactive_rules)} inactive rules between {start_date} and {end_date}.")
+            self.logger.info("Found %s inactive rules between %s and %s.", len(inactive_rules), start_date, end_date)
             return inactive_rules
 
         except SQLAlchemyError as e:
-            self.logger.critical(f"Database error during inactive rules analysis: {e}")
+            self.logger.critical("Database error during inactive rules analysis: %s", e)
             return []
         except Exception as e:
-            self.logger.critical(f"An unexpected error occurred during inactive rules analysis: {e}")
+            self.logger.critical("An unexpected error occurred during inactive rules analysis: %s", e)
+            return []
+        finally:
+            if session:
+                session.close()
+
+    def get_idle_rules(self, min_days: int = None, month: date = None, source: str = None,
+                       after: int = None, after_source: str = None, limit: int = None) -> list[dict]:
+        """
+        Reglas inactivas segun los periodos de inactividad (inactivity_spans).
+
+        Args:
+            min_days: Reglas que siguen inactivas y llevan al menos estos dias sin trafico.
+            month: Reglas inactivas en todas las ejecuciones de su firewall en el mes (cualquier dia del mes).
+            source: Firewall consultado; None consulta todos los firewalls.
+            after, after_source, limit: Paginacion por llave, igual que get_inactive_rules.
+        """
+        session = None
+        try:
+            session = self.db_model.get_read_session()
+            sql_query, params = idle_rules_query(min_days, month, source, after, after_source, limit)
+            result = session.execute(sql_query, params).fetchall()
+            idle_rules = [{
+                "firewall": row.source,
+                "rule_id": row.rule_id,
+                "rule_label": row.rule_label,
+                "inactive_since": row.inactive_since.isoformat(),
+                "last_seen_inactive": row.last_seen_inactive.isoformat(),
+                "idle_days": round((row.last_seen_inactive - row.inactive_since).total_seconds() / 86400, 2),
+                "samples": row.samples
+            } for row in result]
+            self.logger.info("Found %s idle rules (min_days=%s, month=%s).", len(idle_rules), min_days, month)
+            return idle_rules
+        except SQLAlchemyError as e:
+            self.logger.critical("Database error during idle rules lookup: %s", e)
             return []
+        except Exception as e:
+            self.logger.critical("An unexpected error occurred during idle rules lookup: %s", e)
+            return []
+        finally:
+            if session:
+                session.close()
+
+    def iter_inactive_rules(self, start_date: datetime, end_date: datetime, tolerance: int = DEFAULT_TOLERANCE,
+                            metric: str = "bytes", after: int = None, limit: int = None,
+                            source: str = None, after_source: str = None):
+        """
+        Igual que get_inactive_rules, pero genera las reglas conforme llegan de un
+        cursor del lado del servidor (yield_per), sin cargar el resultado completo.
+        Los errores se propagan al consumidor.
+        """
+        session = None
+        try:
+            session = self.db_model.get_read_session()
+
+            sql_query, params = self._build_inactive_rules_query(
+                start_date, end_date, tolerance, metric, after, limit, source, after_source
+            )
+            if sql_query is None:
+                return
+
+            result = session.execute(sql_query.execution_options(yield_per=INACTIVE_STREAM_BATCH), params)
+            for row in result:
+                yield {"firewall": row.source, "rule_id": row.rule_id, "rule_label": row.rule_label}
         finally:
             if session:
                 session.close()
 
-    def get_inactive_rules_from_this_batch(self, rule_metrics_list: list[dict]) -> list[dict]:
+    def get_top_rules(self, start_date: datetime, end_date: datetime, metric: str = "bytes", order: str = "top",
+                      limit: int = 10, source: str = None) -> dict:
+        """
+        Reglas con mayor (order="top") o menor (order="bottom") actividad en [start_date, end_date).
+
+        La actividad de cada regla es la suma de los deltas de `metric` en el rango
+        (agregados por hora/dia y muestras crudas en los bordes); la base solo
+        conserva y regresa `limit` reglas (ver top_rules_query). Solo cuentan las
+        reglas con muestras en el rango. Regresa {"rules": [...], "total": actividad
+        de todas las reglas, "rules_counted": reglas consideradas, "cached": bool};
+        un diccionario vacio si fallo la consulta.
+        """
+        column = INACTIVITY_METRICS.get(metric)
+        if column is None:
+            raise ValueError(f"Metrica no soportada: {metric}")
+        if start_date.tzinfo is None:
+            start_date = start_date.replace(tzinfo=timezone.utc)
+        if end_date.tzinfo is None:
+            end_date = end_date.replace(tzinfo=timezone.utc)
+
+        cache_key = (start_date, end_date, metric, order, limit, source)
+        cached = self.top_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        session = None
+        try:
+            session = self.db_model.get_read_session()
+            sql_query, params = top_rules_query(column, start_date, end_date, order, limit, source)
+            result = session.execute(sql_query, params).fetchall() if sql_query is not None else []
+
+            total = int(result[0].total) if result else 0
+            top_rules = {
+                "rules": [{
+                    "firewall": row.source,
+                    "rule_id": row.rule_id,
+                    "rule_label": row.rule_label,
+                    "activity": int(row.activity),
+                    "share": round(int(row.activity) / total, 6) if total else 0.0
+                } for row in result],
+                "total": total,
+                "rules_counted": result[0].rules if result else 0
+            }
+            self.top_cache.put(cache_key, top_rules)
+            self.logger.info("Top %s de %s reglas por %s entre %s y %s.", len(result), top_rules["rules_counted"], metric, start_date, end_date)
+            return {**top_rules, "cached": False}
+
+        except SQLAlchemyError as e:
+            self.logger.critical("Database error during top rules query: %s", e)
+            return {}
+        except Exception as e:
+            self.logger.critical("An unexpected error occurred during top rules query: %s", e)
+            return {}
+        finally:
+            if session:
+                session.close()
+
+    def _build_inactive_rules_query(self, start_date: datetime, end_date: datetime, tolerance: int, metric: str,
+                                    after: int = None, limit: int = None, source: str = None, after_source: str = None):
+        """
+        Internal method to build the inactivity query.
+
+        La consulta parte de la tabla rules y para cada regla resuelve cada segmento
+        del rango con busquedas por indice (LATERAL), sin recorrer todas las filas:
+          - dias/horas completos: SUM del delta en rule_metrics_daily/hourly por su
+            llave primaria (source, rule_id, bucket_start);
+          - bordes parciales (menos de una hora): SUM del delta de las muestras del
+            borde en rule_metrics via idx_rule_metrics_source_rule_id_timestamp. Los
+            deltas ya traen resueltos los reinicios de contadores, igual que los agregados.
+        El costo es del orden de reglas x (log n + dias + muestras de los bordes) en lugar
+        de filas en el rango.
+        Con SUPPRESS_UNCHANGED=1 una regla sin cambios no tiene muestras en un borde
+        parcial: su actividad ahi es 0 y cuenta como reportada si tiene una muestra
+        desde el inicio del periodo de heartbeat que contiene start_date.
+        Las reglas se recorren en orden de (source, rule_id), la llave primaria de
+        rules, asi la consulta de un firewall solo lee su rango del indice y la de
+        toda la flota no ordena nada; la paginacion por llave (after/limit) se
+        detiene en cuanto junta `limit` reglas.
+        """
+        column = INACTIVITY_METRICS.get(metric)
+        if column is None:
+            raise ValueError(f"Metrica no soportada: {metric}")
+
+        # Fechas sin zona horaria se interpretan en UTC (igual que los agregados)
+        if start_date.tzinfo is None:
+            start_date = start_date.replace(tzinfo=timezone.utc)
+        if end_date.tzinfo is None:
+            end_date = end_date.replace(tzinfo=timezone.utc)
+        # end_date es inclusivo (p. ej. 23:59:59.999999)
+        end_exclusive = end_date + timedelta(microseconds=1)
+
+        # Nota: Los placeholders son para seguridad (prevención de SQL Injection)
+        params = {"tolerance": tolerance}
+        joins = []
+        for index, (table, segment_start, segment_end) in enumerate(split_range(start_date, end_exclusive)):
+            params[f"start_{index}"] = segment_start
+            params[f"end_{index}"] = segment_end
+            time_column = "timestamp" if table == "rule_metrics" else "bucket_start"
+            joins.append(f"""
+                LEFT JOIN LATERAL (
+                    SELECT SUM({column}_delta) AS activity, COUNT(*) AS samples
+                    FROM {table}
+                    WHERE source = r.source AND rule_id = r.rule_id AND {time_column} >= :start_{index} AND {time_column} < :end_{index}
+                ) s{index} ON TRUE""")
+
+        if not joins:
+            return None, params
+
+        activity = " + ".join(f"COALESCE(s{index}.activity, 0)" for index in range(len(joins)))
+        samples = " + ".join(f"COALESCE(s{index}.samples, 0)" for index in range(len(joins)))
+        presence = f"{samples} > 0"
+        lookback_start = self.suppressor.period_start(start_date) if self.suppressor.enabled else start_date
+        if lookback_start < start_date:
+            # Muestra del heartbeat (o del ultimo cambio) antes del borde inicial
+            presence = f"""({presence} OR EXISTS (
+                    SELECT 1 FROM rule_metrics
+                    WHERE source = r.source AND rule_id = r.rule_id AND timestamp >= :lookback_start AND timestamp < :start_0
+                ))"""
+            params["lookback_start"] = lookback_start
+
+        filters = []
+        if source is not None:
+            filters.append("AND r.source = :source")
+            params["source"] = source
+        if after is not None:
+            if source is None and after_source is not None:
+                # Toda la flota: la llave de la pagina es (source, rule_id)
+                filters.append("AND (r.source, r.rule_id) > (:after_source, :after)")
+                params["after_source"] = after_source
+            else:
+                filters.append("AND r.rule_id > :after")
+            params["after"] = after
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT :limit"
+            params["limit"] = limit
+
+        sql_query = text(f"""
+            SELECT
+                r.source,
+                r.rule_id,
+                r.rule_label
+            FROM
+                rules r
+                {"".join(joins)}
+            WHERE
+                {presence} -- Solo reglas con muestras en el rango
+                AND {activity} < :tolerance -- Condición de inactividad con tolerancia
+                {" ".join(filters)}
+            ORDER BY
+                r.source, r.rule_id
+            {limit_clause};
+        """)
+        return sql_query, params
+
+    def get_inactive_rules_from_this_batch(self, rule_metrics_list: list[RuleMetricRecord]) -> list[dict]:
         """
         Filters the given list of rule metrics to identify rules with 0 bytes_matched.
         These are considered "inactive" for the purpose of logging in inactive_rule_log.
 
         Args:
-            rule_metrics_list: A list of dictionaries, where each dictionary
+            rule_metrics_list: A list of RuleMetricRecord, where each record
                                represents a parsed pfctl rule metric from the current batch.
 
         Returns:
@@ -210,11 +657,11 @@ class Service:
         """
         inactive_rules = []
         for metric_data in rule_metrics_list:
-            if metric_data.get('bytes_matched', 0) == 0:
+            if metric_data.bytes_matched == 0:
                 # Solo necesitamos el id y el label para el log de inactividad
                 inactive_rules.append({
-                    'rule_id': metric_data['id'],
-                    'rule_label': metric_data['label']
+                    'rule_id': metric_data.id,
+                    'rule_label': metric_data.label
                 })
-        self.logger.info(f"Se detectaron {len(inactive_rules)} reglas inactivas en batch.")
+        self.logger.info("Se detectaron %s reglas inactivas en batch.", len(inactive_rules))
         return inactive_rules
\ No newline at end of file
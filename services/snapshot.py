@@ -0,0 +1,95 @@
+from collections import namedtuple
+from sqlalchemy import text
+from schemas.record import RuleMetricRecord
+
+# Etiqueta guardada de una regla y su ultima muestra: timestamp y contadores en el
+# orden de RuleSnapshots.SAMPLE_FIELDS (None si la regla no tiene muestras)
+PreviousSample = namedtuple("PreviousSample", ("label", "timestamp", "counters"))
+
+class RuleSnapshots:
+    """
+    Ultima muestra guardada de cada regla ((source, rule_id)) como referencia de los deltas.
+
+    Los contadores de pf son acumulativos y se reinician cuando se recargan las
+    reglas o se reinicia el firewall. Con la muestra anterior de cada regla se
+    calcula el delta de cada muestra y se detectan los reinicios.
+
+    La referencia se lee de rule_metrics dentro de la transaccion de ingesta, despues
+    del bloqueo del firewall (ver Service._lock_sources): no hay un cache por proceso
+    que otro worker, otro hilo o una carga de historicos pueda dejar atrasado.
+    """
+
+    # Contadores para los que se guarda el delta en rule_metrics (<campo>_delta)
+    DELTA_FIELDS = ("evaluations", "packets_matched", "bytes_matched", "states_created")
+
+    # Contadores que se leen de la muestra anterior (el modo por cambios compara todos, ver SampleSuppressor)
+    SAMPLE_FIELDS = DELTA_FIELDS + ("state_packets", "state_bytes", "input_output")
+
+    # Etiqueta y ultima muestra de cada regla del lote anterior a :before (timestamp
+    # NULL si no tiene). Con el indice (source, rule_id, timestamp) es una busqueda
+    # por regla que se detiene en la particion mas reciente con datos, sin ordenar la tabla.
+    PREVIOUS_SAMPLES_SQL = text(f"""
+        SELECT r.rule_id, r.rule_label, m.timestamp, {', '.join(f'm.{field}' for field in SAMPLE_FIELDS)}
+        FROM rules r
+        LEFT JOIN LATERAL (
+            SELECT timestamp, {', '.join(SAMPLE_FIELDS)} FROM rule_metrics
+            WHERE source = r.source AND rule_id = r.rule_id AND timestamp < :before
+            ORDER BY timestamp DESC LIMIT 1
+        ) m ON true
+        WHERE r.source = :source AND r.rule_id = ANY(CAST(:rule_ids AS bigint[]))
+    """)
+
+    def load(self, session, batches: list[tuple]) -> dict:
+        """
+        Lee la muestra anterior de las reglas de un grupo de lotes. Llamar con los bloqueos tomados.
+
+        Por firewall se busca la ultima muestra anterior a su primer lote del grupo;
+        los lotes siguientes usan los contadores de `pending` (ver compute_deltas).
+        Regresa (source, rule_id) -> PreviousSample; las reglas que no estan en rules no aparecen.
+        """
+        groups = {}
+        for source, batch_timestamp, records in batches:
+            first, rule_ids = groups.setdefault(source, [batch_timestamp, set()])
+            groups[source][0] = min(first, batch_timestamp)
+            rule_ids.update(record.id for record in records)
+        previous = {}
+        for source, (first, rule_ids) in groups.items():
+            result = session.execute(self.PREVIOUS_SAMPLES_SQL, {"source": source, "before": first, "rule_ids": sorted(rule_ids)})
+            for row in result:
+                previous[(source, row[0])] = PreviousSample(row[1], row[2], tuple(row[3:]) if row[2] is not None else None)
+        return previous
+
+    def compute_deltas(self, source: str, records: list[RuleMetricRecord], previous: dict, pending: dict) -> list[tuple]:
+        """
+        Calcula los deltas de un lote de un firewall contra la muestra anterior.
+
+        Regresa una tupla por registro: (evaluations, packets_matched, bytes_matched,
+        states_created, counter_reset). Si algun contador es menor que el anterior se
+        considera un reinicio y el delta es el valor nuevo completo. La primera muestra
+        de una regla no tiene referencia y su delta es 0.
+
+        `previous` es el resultado de load; `pending` guarda los contadores de lotes
+        del mismo grupo que aun no tienen commit, tiene prioridad y se actualiza con este lote.
+        """
+        deltas = []
+        delta_count = len(self.DELTA_FIELDS)
+        for record in records:
+            key = (source, record.id)
+            current = self.counters(record)
+            last = pending.get(key)
+            pending[key] = current
+            if last is None:
+                sample = previous.get(key)
+                if sample is not None and sample.counters is not None:
+                    last = sample.counters[:delta_count]
+            if last is None:
+                deltas.append((0,) * len(current) + (False,))
+            elif any(new < old for new, old in zip(current, last)):
+                deltas.append(current + (True,))
+            else:
+                deltas.append(tuple(new - old for new, old in zip(current, last)) + (False,))
+        return deltas
+
+    def counters(self, record: RuleMetricRecord) -> tuple:
+        """Contadores de un registro en el orden de DELTA_FIELDS."""
+        return (record.evaluations, record.packets_matched, record.bytes_matched, record.states_created)
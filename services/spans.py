@@ -0,0 +1,176 @@
+from datetime import date
+from sqlalchemy import text
+
+# Periodos de inactividad por regla (tabla inactivity_spans, ver migrations/versions/0004).
+# Una regla inactiva tiene un solo periodo abierto (closed_at IS NULL) que se extiende
+# en cada ejecucion mientras siga sin trafico y se cierra cuando vuelve a tener.
+
+# Abre el periodo de las reglas inactivas del lote o extiende el que ya esta abierto.
+# Solo se actualizan columnas sin indice: PostgreSQL hace HOT updates sin tocar los indices.
+EXTEND_SPANS_SQL = text("""
+    INSERT INTO inactivity_spans AS s (source, rule_id, inactive_since, last_seen_inactive, samples)
+    SELECT :source, rule_id, :batch_timestamp, :batch_timestamp, 1
+    FROM unnest(CAST(:rule_ids AS BIGINT[])) AS rule_id
+    ON CONFLICT (source, rule_id) WHERE closed_at IS NULL DO UPDATE SET
+        last_seen_inactive = EXCLUDED.last_seen_inactive,
+        samples = s.samples + 1
+    WHERE s.last_seen_inactive < EXCLUDED.last_seen_inactive
+""")
+
+# Cierra el periodo abierto de las reglas que volvieron a tener trafico
+CLOSE_SPANS_SQL = text("""
+    UPDATE inactivity_spans SET closed_at = :batch_timestamp
+    WHERE source = :source
+      AND closed_at IS NULL
+      AND rule_id = ANY(CAST(:rule_ids AS BIGINT[]))
+      AND last_seen_inactive < :batch_timestamp
+""")
+
+# Variantes por grupo de EXTEND_SPANS_SQL y CLOSE_SPANS_SQL para la carga de historicos
+# (services/backfill.py): una fila por regla con el resultado de todas las ejecuciones del grupo
+EXTEND_SPANS_MANY_SQL = text("""
+    INSERT INTO inactivity_spans AS s (source, rule_id, inactive_since, last_seen_inactive, samples)
+    SELECT :source, rule_id, inactive_since, last_seen_inactive, samples
+    FROM unnest(
+        CAST(:rule_ids AS BIGINT[]), CAST(:since AS TIMESTAMPTZ[]), CAST(:last_seen AS TIMESTAMPTZ[]), CAST(:samples AS INT[])
+    ) AS t(rule_id, inactive_since, last_seen_inactive, samples)
+    ON CONFLICT (source, rule_id) WHERE closed_at IS NULL DO UPDATE SET
+        last_seen_inactive = EXCLUDED.last_seen_inactive,
+        samples = s.samples + EXCLUDED.samples
+    WHERE s.last_seen_inactive < EXCLUDED.last_seen_inactive
+""")
+
+CLOSE_SPANS_MANY_SQL = text("""
+    UPDATE inactivity_spans s SET closed_at = t.closed_at
+    FROM unnest(CAST(:rule_ids AS BIGINT[]), CAST(:closed_at AS TIMESTAMPTZ[])) AS t(rule_id, closed_at)
+    WHERE s.source = :source
+      AND s.closed_at IS NULL
+      AND s.rule_id = t.rule_id
+      AND s.last_seen_inactive < t.closed_at
+""")
+
+# Periodos que empiezan dentro del grupo despues de un cierre (cerrados o el abierto final)
+INSERT_SPANS_SQL = text("""
+    INSERT INTO inactivity_spans (source, rule_id, inactive_since, last_seen_inactive, closed_at, samples)
+    SELECT :source, rule_id, inactive_since, last_seen_inactive, closed_at, samples
+    FROM unnest(
+        CAST(:rule_ids AS BIGINT[]), CAST(:since AS TIMESTAMPTZ[]), CAST(:last_seen AS TIMESTAMPTZ[]),
+        CAST(:closed_at AS TIMESTAMPTZ[]), CAST(:samples AS INT[])
+    ) AS t(rule_id, inactive_since, last_seen_inactive, closed_at, samples)
+""")
+
+def collapse_spans(batches) -> tuple[list, list, list]:
+    """
+    Resume los cambios de periodos de varias ejecuciones en orden de un firewall
+    ([(batch_timestamp, registros)]) con el mismo resultado que aplicar
+    EXTEND_SPANS_SQL y CLOSE_SPANS_SQL ejecucion por ejecucion.
+
+    Regresa (extender, cerrar, nuevos): el primer periodo de cada regla extiende el
+    que ya estaba abierto (rule_id, desde, hasta, muestras), el primer cierre cierra
+    el abierto (rule_id, cerrado) y los periodos siguientes se insertan completos
+    (rule_id, desde, hasta, cerrado o None, muestras).
+    """
+    runs = {}
+    for batch_timestamp, records in batches:
+        idle_ids, active_ids = split_by_activity(records)
+        for rule_id in idle_ids:
+            runs.setdefault(rule_id, []).append((batch_timestamp, True))
+        for rule_id in active_ids:
+            runs.setdefault(rule_id, []).append((batch_timestamp, False))
+
+    extend, close, spans = [], [], []
+    for rule_id, states in runs.items():
+        current = None
+        closed = False
+        for batch_timestamp, idle in states:
+            if idle:
+                if current is None:
+                    current = [batch_timestamp, batch_timestamp, 0]
+                current[1] = batch_timestamp
+                current[2] += 1
+                continue
+            if not closed:
+                if current is not None:
+                    extend.append((rule_id, *current))
+                close.append((rule_id, batch_timestamp))
+                closed = True
+            elif current is not None:
+                spans.append((rule_id, current[0], current[1], batch_timestamp, current[2]))
+            current = None
+        if current is not None:
+            if closed:
+                spans.append((rule_id, current[0], current[1], None, current[2]))
+            else:
+                extend.append((rule_id, *current))
+    return extend, close, spans
+
+def split_by_activity(records) -> tuple[list[int], list[int]]:
+    """Separa los ids de un lote en (inactivas, activas) con el mismo criterio que inactive_rule_log: 0 bytes."""
+    idle, active = [], []
+    for record in records:
+        (idle if record.bytes_matched == 0 else active).append(record.id)
+    return idle, active
+
+def idle_rules_query(min_days: int = None, month: date = None, source: str = None,
+                     after: int = None, after_source: str = None, limit: int = None):
+    """
+    Construye la consulta de reglas inactivas a partir de los periodos:
+      - min_days: periodo abierto con al menos `min_days` dias entre la primera y
+        la ultima ejecucion en que la regla se vio inactiva;
+      - month: reglas inactivas en TODAS las ejecuciones de su firewall en el mes
+        (el periodo empieza antes o en la primera ejecucion del mes y sigue en la ultima).
+    Regresa (consulta, parametros). Orden y paginacion por (source, rule_id), igual que /api/v1/inactive.
+    """
+    params = {}
+    joins = ""
+    if month is not None:
+        # Primera y ultima ejecucion de cada firewall en el mes (incluye meses ya compactados)
+        joins = """
+            JOIN monthly_execution_totals m
+                ON m.source = s.source AND m.month_start_date = :month_start"""
+        conditions = [
+            "s.inactive_since <= m.first_executed_at",
+            "s.last_seen_inactive >= m.last_executed_at",
+        ]
+        params["month_start"] = month.replace(day=1)
+    else:
+        conditions = [
+            "s.closed_at IS NULL",
+            "s.last_seen_inactive - s.inactive_since >= make_interval(days => :min_days)",
+        ]
+        params["min_days"] = min_days
+
+    if source is not None:
+        conditions.append("s.source = :source")
+        params["source"] = source
+    if after is not None:
+        if source is None and after_source is not None:
+            conditions.append("(s.source, s.rule_id) > (:after_source, :after)")
+            params["after_source"] = after_source
+        else:
+            conditions.append("s.rule_id > :after")
+        params["after"] = after
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT :limit"
+        params["limit"] = limit
+
+    sql_query = text(f"""
+        SELECT
+            s.source,
+            s.rule_id,
+            r.rule_label,
+            s.inactive_since,
+            s.last_seen_inactive,
+            s.samples
+        FROM
+            inactivity_spans s
+            JOIN rules r ON r.source = s.source AND r.rule_id = s.rule_id
+            {joins}
+        WHERE
+            {" AND ".join(conditions)}
+        ORDER BY
+            s.source, s.rule_id
+        {limit_clause};
+    """)
+    return sql_query, params
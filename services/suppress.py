@@ -0,0 +1,93 @@
+import os
+import threading
+from datetime import datetime, timezone
+from schemas.record import RuleMetricRecord
+from services.snapshot import RuleSnapshots
+
+class SampleSuppressor:
+    """
+    Almacenamiento por cambios de rule_metrics (SUPPRESS_UNCHANGED=1).
+
+    La mayoria de las reglas pasan mucho tiempo sin trafico y sus contadores no
+    cambian entre ejecuciones. En este modo una regla solo escribe su muestra si
+    algun contador cambio desde la ultima muestra guardada, o si es su primera
+    muestra del periodo de heartbeat. Una muestra que falta significa que los
+    contadores siguen igual que en la anterior (la serie queda codificada por
+    corridas) y su delta era 0, asi que las sumas de deltas no cambian.
+
+    El heartbeat se alinea a periodos UTC que dividen la hora: cada regla
+    reportada tiene al menos una muestra en cada hora, por lo que rule_metrics_hourly
+    y rule_metrics_daily (y las vistas sobre ellos) tienen las mismas filas que
+    con todas las muestras. Solo los bordes de menos de una hora de una consulta
+    necesitan ver la muestra del inicio del periodo (ver Service._build_inactive_rules_query).
+
+    Variables de entorno:
+        SUPPRESS_UNCHANGED: "1" activa el modo (por defecto 0, todas las muestras).
+        SAMPLE_HEARTBEAT_SECONDS: periodo del heartbeat, debe dividir 3600 (por defecto 3600).
+    """
+
+    # Contadores que se comparan con la ultima muestra guardada
+    FIELDS = RuleSnapshots.SAMPLE_FIELDS
+
+    def __init__(self):
+        self.enabled = os.environ.get("SUPPRESS_UNCHANGED", "0") == "1"
+        self.heartbeat = int(os.environ.get("SAMPLE_HEARTBEAT_SECONDS", "3600"))
+        if self.enabled and (self.heartbeat <= 0 or 3600 % self.heartbeat):
+            raise ValueError("SAMPLE_HEARTBEAT_SECONDS debe dividir 3600 (p. ej. 600, 900, 1800 o 3600)")
+        self._lock = threading.Lock()
+        # Muestras escritas y omitidas desde que inicio el proceso
+        self.written = 0
+        self.suppressed = 0
+
+    def period_start(self, moment: datetime) -> datetime:
+        """Inicio del periodo de heartbeat (UTC) que contiene `moment`."""
+        epoch = int(moment.timestamp())
+        return datetime.fromtimestamp(epoch - epoch % self.heartbeat, tz=timezone.utc)
+
+    def select(self, source: str, records: list[RuleMetricRecord], batch_timestamp: datetime, previous: dict, pending: dict) -> list[int]:
+        """
+        Indices de los registros del lote que se deben escribir.
+
+        `previous` es la ultima muestra guardada de cada regla, leida con el bloqueo del
+        firewall tomado (RuleSnapshots.load): con varios workers cada uno compara contra
+        lo que escribieron los demas. `pending` guarda las muestras elegidas en lotes del
+        mismo grupo que aun no tienen commit; tiene prioridad y se actualiza con este lote.
+        """
+        period = self.period_start(batch_timestamp)
+        selected = []
+        for index, record in enumerate(records):
+            key = (source, record.id)
+            current = (self.counters(record), period)
+            last = pending.get(key)
+            if last is None:
+                sample = previous.get(key)
+                if sample is not None and sample.counters is not None:
+                    last = (sample.counters, self.period_start(sample.timestamp))
+            if last == current:
+                continue
+            pending[key] = current
+            selected.append(index)
+        return selected
+
+    def update(self, written: int, suppressed: int) -> None:
+        """Suma las muestras escritas y omitidas. Se llama solo despues del commit."""
+        with self._lock:
+            self.written += written
+            self.suppressed += suppressed
+
+    def counters(self, record: RuleMetricRecord) -> tuple:
+        """Contadores de un registro en el orden de FIELDS."""
+        return (
+            record.evaluations, record.packets_matched, record.bytes_matched, record.states_created,
+            record.state_packets, record.state_bytes, record.input_output
+        )
+
+    def stats(self) -> dict:
+        """Contadores para /api/v1/stats."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "heartbeat_seconds": self.heartbeat,
+                "written": self.written,
+                "suppressed": self.suppressed
+            }
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from services.rollup import split_range
+
+# Ventanas fijas de /api/v1/rules/top: terminan al inicio de la hora actual, asi se
+# resuelven solo con rule_metrics_hourly/daily y el resultado no cambia durante la hora
+TOP_WINDOWS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(days=1),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+}
+
+def window_range(window: str, now: datetime = None) -> tuple[datetime, datetime]:
+    """Rango [inicio, fin) de una ventana fija, alineado a horas completas en UTC."""
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    end = now.replace(minute=0, second=0, microsecond=0)
+    return end - TOP_WINDOWS[window], end
+
+def top_rules_query(column: str, start: datetime, end: datetime, order: str = "top", limit: int = 10, source: str = None):
+    """
+    Consulta de las `limit` reglas con mayor (top) o menor (bottom) actividad en [start, end).
+
+    La actividad de una regla es la suma de <column>_delta de sus muestras en el
+    rango. Cada segmento se lee de la fuente mas gruesa que lo cubre (ver
+    split_range): dias y horas completos de los agregados y solo los bordes
+    parciales de rule_metrics. ORDER BY ... LIMIT se resuelve con un top-N
+    heapsort que solo guarda `limit` reglas en memoria y solo esas salen de la
+    base, con la actividad total y el numero de reglas con muestras en el rango.
+    Los empates se resuelven por (source, rule_id).
+    """
+    params = {"limit": limit}
+    segments = []
+    source_filter = "AND source = :source" if source is not None else ""
+    for index, (table, segment_start, segment_end) in enumerate(split_range(start, end)):
+        params[f"start_{index}"] = segment_start
+        params[f"end_{index}"] = segment_end
+        time_column = "timestamp" if table == "rule_metrics" else "bucket_start"
+        segments.append(f"""
+                SELECT source, rule_id, {column}_delta AS delta FROM {table}
+                WHERE {time_column} >= :start_{index} AND {time_column} < :end_{index} {source_filter}""")
+    if not segments:
+        return None, params
+    if source is not None:
+        params["source"] = source
+    direction = "DESC" if order == "top" else "ASC"
+    sql_query = text(f"""
+        SELECT t.source, t.rule_id, r.rule_label, t.activity, t.total, t.rules
+        FROM (
+            SELECT
+                source,
+                rule_id,
+                COALESCE(SUM(delta), 0) AS activity,
+                SUM(COALESCE(SUM(delta), 0)) OVER () AS total,
+                COUNT(*) OVER () AS rules
+            FROM ({" UNION ALL ".join(segments)}
+            ) segments
+            GROUP BY source, rule_id
+            ORDER BY activity {direction}, source, rule_id
+            LIMIT :limit
+        ) t
+        LEFT JOIN rules r ON r.source = t.source AND r.rule_id = t.rule_id
+        ORDER BY t.activity {direction}, t.source, t.rule_id
+    """)
+    return sql_query, params
+
+class TopRulesCache:
+    """
+    Resultados recientes de /api/v1/rules/top por (rango, metrica, orden, K, firewall).
+
+    Las ventanas fijas terminan en una hora completa, asi que cada refresco del
+    tablero dentro de la misma hora es un acierto. Cada resultado vale
+    TOP_CACHE_SECONDS para incluir los lotes que llegan tarde (ingesta asincrona,
+    backfill) y el cache guarda a lo mas TOP_CACHE_ENTRIES resultados (LRU).
+
+    Variables de entorno:
+        TOP_CACHE_SECONDS: vigencia de cada resultado, 0 desactiva el cache (por defecto 300).
+        TOP_CACHE_ENTRIES: resultados maximos en memoria (por defecto 256).
+    """
+
+    def __init__(self):
+        self.ttl = float(os.environ.get("TOP_CACHE_SECONDS", "300"))
+        self.max_entries = int(os.environ.get("TOP_CACHE_ENTRIES", "256"))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key: tuple):
+        """Resultado guardado para `key` si sigue vigente, si no None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, value) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Contadores para /api/v1/stats."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl
+            }
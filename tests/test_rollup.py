@@ -0,0 +1,60 @@
+# Pruebas de split_range (services/rollup.py): los segmentos cubren el rango sin huecos
+# ni traslapes y solo usan los agregados en horas y dias completos (UTC).
+
+from datetime import datetime, timedelta, timezone
+import pytest
+from services.rollup import split_range
+
+UTC = timezone.utc
+
+def at(day: int, hour: int = 0, minute: int = 0, second: int = 0) -> datetime:
+    return datetime(2025, 3, day, hour, minute, second, tzinfo=UTC)
+
+def assert_covers(segments: list, start: datetime, end: datetime) -> None:
+    assert segments[0][1] == start
+    assert segments[-1][2] == end
+    for (_, _, previous_end), (_, next_start, _) in zip(segments, segments[1:]):
+        assert previous_end == next_start
+    for table, segment_start, segment_end in segments:
+        assert segment_start < segment_end
+        if table == "rule_metrics_daily":
+            assert segment_start.hour == segment_start.minute == 0 and segment_end.hour == segment_end.minute == 0
+        elif table == "rule_metrics_hourly":
+            assert segment_start.minute == segment_start.second == 0 and segment_end.minute == segment_end.second == 0
+
+def test_partial_hour_is_raw():
+    assert split_range(at(1, 10, 5), at(1, 10, 50)) == [("rule_metrics", at(1, 10, 5), at(1, 10, 50))]
+
+def test_exact_hours_use_hourly():
+    assert split_range(at(1, 10), at(1, 13)) == [("rule_metrics_hourly", at(1, 10), at(1, 13))]
+
+def test_exact_days_use_daily():
+    assert split_range(at(1), at(4)) == [("rule_metrics_daily", at(1), at(4))]
+
+def test_edges_around_days():
+    assert split_range(at(1, 22, 30), at(3, 1, 15)) == [
+        ("rule_metrics", at(1, 22, 30), at(1, 23)),
+        ("rule_metrics_hourly", at(1, 23), at(2)),
+        ("rule_metrics_daily", at(2), at(3)),
+        ("rule_metrics_hourly", at(3), at(3, 1)),
+        ("rule_metrics", at(3, 1), at(3, 1, 15)),
+    ]
+
+def test_crossing_midnight_without_full_day():
+    assert split_range(at(1, 23, 30), at(2, 0, 30)) == [("rule_metrics", at(1, 23, 30), at(2, 0, 30))]
+
+def test_other_time_zone_is_converted_to_utc():
+    zone = timezone(timedelta(hours=-6))
+    start = datetime(2025, 3, 1, 18, 0, tzinfo=zone)
+    end = datetime(2025, 3, 2, 18, 0, tzinfo=zone)
+    assert split_range(start, end) == [("rule_metrics_daily", at(2), at(3))]
+
+@pytest.mark.parametrize("start,end", [
+    (at(1, 0, 0, 1), at(1, 23, 59, 59)),
+    (at(1, 5, 59, 59), at(1, 6, 0, 1)),
+    (at(1, 12), at(9, 12)),
+    (at(1), at(1, 0, 0, 1)),
+    (at(28, 23, 59), at(31, 0, 1)),
+])
+def test_segments_cover_range(start, end):
+    assert_covers(split_range(start, end), start, end)
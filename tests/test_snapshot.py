@@ -0,0 +1,52 @@
+# Pruebas de RuleSnapshots.compute_deltas (services/snapshot.py): deltas contra la muestra
+# guardada, encadenamiento de lotes del mismo grupo (pending) y reinicio de contadores.
+
+from datetime import datetime, timezone
+from schemas.record import RuleMetricRecord
+from services.snapshot import RuleSnapshots, PreviousSample
+
+T0 = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+def record(rule_id: int, evaluations: int, packets: int = 0, bytes_matched: int = 0, states: int = 0) -> RuleMetricRecord:
+    return RuleMetricRecord(rule_id, f"r{rule_id}", evaluations, packets, bytes_matched, states, 0, 0, 0)
+
+def stored(evaluations: int, packets: int = 0, bytes_matched: int = 0, states: int = 0) -> PreviousSample:
+    return PreviousSample("r1", T0, (evaluations, packets, bytes_matched, states, 0, 0, 0))
+
+def test_first_sample_has_zero_delta():
+    previous = {("fw1", 1): PreviousSample("r1", None, None)}
+    assert RuleSnapshots().compute_deltas("fw1", [record(1, 50, 5, 500, 1)], previous, {}) == [(0, 0, 0, 0, False)]
+
+def test_delta_against_stored_sample():
+    previous = {("fw1", 1): stored(100, 10, 1000, 2)}
+    deltas = RuleSnapshots().compute_deltas("fw1", [record(1, 150, 12, 1600, 2)], previous, {})
+    assert deltas == [(50, 2, 600, 0, False)]
+
+def test_counter_reset_uses_new_value():
+    previous = {("fw1", 1): stored(100, 10, 1000, 2)}
+    deltas = RuleSnapshots().compute_deltas("fw1", [record(1, 150, 3, 1600, 2)], previous, {})
+    assert deltas == [(150, 3, 1600, 2, True)]
+
+def test_reset_then_climb_back():
+    # 100 -> 0 -> 150: el delta acumulado es 0 + 150, no 150 - 100
+    snapshots = RuleSnapshots()
+    previous = {("fw1", 1): stored(100)}
+    pending = {}
+    first = snapshots.compute_deltas("fw1", [record(1, 0)], previous, pending)
+    second = snapshots.compute_deltas("fw1", [record(1, 150)], previous, pending)
+    assert first == [(0, 0, 0, 0, True)]
+    assert second == [(150, 0, 0, 0, False)]
+    assert first[0][0] + second[0][0] == 150
+
+def test_pending_has_priority_over_stored_sample():
+    snapshots = RuleSnapshots()
+    previous = {("fw1", 1): stored(100)}
+    pending = {}
+    snapshots.compute_deltas("fw1", [record(1, 120)], previous, pending)
+    assert snapshots.compute_deltas("fw1", [record(1, 125)], previous, pending) == [(5, 0, 0, 0, False)]
+    assert pending[("fw1", 1)] == (125, 0, 0, 0)
+
+def test_sources_do_not_share_samples():
+    previous = {("fw1", 1): stored(100)}
+    deltas = RuleSnapshots().compute_deltas("fw2", [record(1, 150)], previous, {})
+    assert deltas == [(0, 0, 0, 0, False)]
@@ -0,0 +1,94 @@
+# Pruebas sin base de datos de collapse_spans (services/spans.py): el resumen por grupo
+# que usa la carga de historicos debe dejar inactivity_spans igual que EXTEND_SPANS_SQL y
+# CLOSE_SPANS_SQL aplicados ejecucion por ejecucion (Service._update_inactivity_spans).
+
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+from schemas.record import RuleMetricRecord
+from services.spans import collapse_spans, split_by_activity
+
+T0 = datetime(2025, 3, 1, 22, 0, tzinfo=timezone.utc)
+
+def record(rule_id: int, bytes_matched: int) -> RuleMetricRecord:
+    return RuleMetricRecord(rule_id, f"r{rule_id}", 1, 1, bytes_matched, 0, 0, 0, 0)
+
+def open_span(spans: list, rule_id: int):
+    for span in spans:
+        if span["rule_id"] == rule_id and span["closed_at"] is None:
+            return span
+    return None
+
+def extend(spans: list, rule_id: int, since: datetime, last_seen: datetime, samples: int) -> None:
+    """EXTEND_SPANS_SQL / EXTEND_SPANS_MANY_SQL: ON CONFLICT sobre el periodo abierto."""
+    span = open_span(spans, rule_id)
+    if span is None:
+        spans.append({"rule_id": rule_id, "since": since, "last_seen": last_seen, "closed_at": None, "samples": samples})
+    elif span["last_seen"] < last_seen:
+        span["last_seen"] = last_seen
+        span["samples"] += samples
+
+def close(spans: list, rule_id: int, closed_at: datetime) -> None:
+    """CLOSE_SPANS_SQL / CLOSE_SPANS_MANY_SQL."""
+    span = open_span(spans, rule_id)
+    if span is not None and span["last_seen"] < closed_at:
+        span["closed_at"] = closed_at
+
+def apply_per_run(spans: list, batches: list) -> list:
+    """Como la API: cierre y despues extension en cada ejecucion."""
+    for batch_timestamp, records in batches:
+        idle_ids, active_ids = split_by_activity(records)
+        for rule_id in active_ids:
+            close(spans, rule_id, batch_timestamp)
+        for rule_id in idle_ids:
+            extend(spans, rule_id, batch_timestamp, batch_timestamp, 1)
+    return spans
+
+def apply_collapsed(spans: list, batches: list) -> list:
+    """Como BackfillService._update_spans_for_group: extender, cerrar e insertar."""
+    extended, closed, inserted = collapse_spans(batches)
+    for rule_id, since, last_seen, samples in extended:
+        extend(spans, rule_id, since, last_seen, samples)
+    for rule_id, closed_at in closed:
+        close(spans, rule_id, closed_at)
+    for rule_id, since, last_seen, closed_at, samples in inserted:
+        spans.append({"rule_id": rule_id, "since": since, "last_seen": last_seen, "closed_at": closed_at, "samples": samples})
+    return spans
+
+def normalized(spans: list) -> list:
+    return sorted((s["rule_id"], s["since"], s["last_seen"], s["closed_at"] or datetime.max.replace(tzinfo=timezone.utc), s["samples"]) for s in spans)
+
+def runs(pattern: str, rule_id: int = 1, start: int = 0) -> list:
+    """Ejecuciones cada 5 minutos: 'i' = sin trafico, 'a' = con trafico."""
+    return [
+        (T0 + timedelta(minutes=5 * (start + index)), [record(rule_id, 0 if state == "i" else 10)])
+        for index, state in enumerate(pattern)
+    ]
+
+def previous_span(rule_id: int = 1) -> list:
+    """Periodo abierto guardado antes del grupo."""
+    return [{"rule_id": rule_id, "since": T0 - timedelta(hours=2), "last_seen": T0 - timedelta(minutes=5), "closed_at": None, "samples": 24}]
+
+@pytest.mark.parametrize("pattern", ["i", "a", "iiii", "aaaa", "iaia", "aiai", "iiaaiiaai", "aiiiaiii", "iaaaaai"])
+@pytest.mark.parametrize("before", [list, previous_span])
+def test_collapse_matches_per_run(pattern, before):
+    batches = runs(pattern)
+    assert normalized(apply_collapsed(before(), batches)) == normalized(apply_per_run(before(), batches))
+
+def test_idle_active_idle_active_spans():
+    extended, closed, inserted = collapse_spans(runs("iiaiia"))
+    assert extended == [(1, T0, T0 + timedelta(minutes=5), 2)]
+    assert closed == [(1, T0 + timedelta(minutes=10))]
+    assert inserted == [(1, T0 + timedelta(minutes=15), T0 + timedelta(minutes=20), T0 + timedelta(minutes=25), 2)]
+
+def test_random_groups_match_per_run():
+    rng = random.Random(18)
+    for _ in range(200):
+        rules = range(1, 6)
+        batches = [
+            (T0 + timedelta(minutes=5 * index), [record(rule_id, rng.choice((0, 0, 10))) for rule_id in rules if rng.random() < 0.9])
+            for index in range(rng.randint(1, 15))
+        ]
+        before = [span for rule_id in rules if rng.random() < 0.5 for span in previous_span(rule_id)]
+        copy = [dict(span) for span in before]
+        assert normalized(apply_collapsed(before, batches)) == normalized(apply_per_run(copy, batches))
@@ -0,0 +1,265 @@
+# wire.py
+
+import gzip
+import io
+import json
+import os
+import zlib
+from flask.json.provider import DefaultJSONProvider
+
+# Dependencias opcionales: sin ellas se usa json de la biblioteca estandar y
+# los cuerpos zstd / MessagePack se rechazan con 415
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Tipos de contenido de MessagePack aceptados en /api/v1/data
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# Limite del cuerpo ya descomprimido (evita que un cuerpo pequeño se expanda sin control)
+MAX_DECODED_BYTES = int(os.environ.get("MAX_DECODED_BYTES", str(256 * 1024 * 1024)))
+
+# Compresion de respuestas: tamaño minimo y nivel (gzip 1-9, zstd 1-22)
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "5"))
+ZSTD_LEVEL = int(os.environ.get("ZSTD_LEVEL", "3"))
+# En streaming se envia un bloque comprimido cada tantos bytes sin comprimir
+STREAM_FLUSH_BYTES = 16 * 1024
+
+class BodyDecodeError(ValueError):
+    """Cuerpo de la peticion que no se puede decodificar. `status` es el codigo HTTP a responder."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def request_encodings() -> tuple:
+    """Content-Encoding aceptados en las peticiones (zstd solo si esta instalado)."""
+    return ("gzip", "zstd") if zstandard is not None else ("gzip",)
+
+def response_encodings() -> list:
+    """Content-Encoding que se ofrecen en las respuestas, en orden de preferencia."""
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+def content_encoding(value: str) -> str:
+    """
+    Normaliza el encabezado Content-Encoding de la peticion. Regresa None para
+    'identity' o sin encabezado; lanza BodyDecodeError (415) si no se soporta.
+    """
+    value = (value or "").strip().lower()
+    if value in ("", "identity"):
+        return None
+    if value == "x-gzip":
+        value = "gzip"
+    if value not in request_encodings():
+        raise BodyDecodeError(f"Content-Encoding no soportado: {value}", 415)
+    return value
+
+def open_decoder(stream, encoding: str):
+    """Envuelve el stream de la peticion con un lector que descomprime (soporta readline)."""
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if encoding == "zstd":
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream))
+    return stream
+
+def iter_decoded_lines(stream, encoding: str, max_bytes: int = None):
+    """
+    Genera las lineas (bytes) del cuerpo descomprimido sin materializarlo.
+    Lanza BodyDecodeError si el cuerpo esta corrupto o supera `max_bytes` (413).
+    """
+    max_bytes = MAX_DECODED_BYTES if max_bytes is None else max_bytes
+    reader = open_decoder(stream, encoding)
+    total = 0
+    try:
+        while True:
+            line = reader.readline(max_bytes - total + 1)
+            if not line:
+                return
+            total += len(line)
+            if total > max_bytes:
+                raise BodyDecodeError("Cuerpo descomprimido demasiado grande", 413)
+            yield line
+    except BodyDecodeError:
+        raise
+    except (OSError, EOFError, zlib.error) as e:
+        raise BodyDecodeError(f"Cuerpo {encoding} invalido: {e}") from e
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise BodyDecodeError(f"Cuerpo {encoding} invalido: {e}") from e
+        raise
+
+async def aiter_decoded_lines(chunks, encoding: str, max_bytes: int = None):
+    """
+    Variante asincrona de iter_decoded_lines para el cuerpo de Quart (iterable
+    asincrono de fragmentos). Genera listas con las lineas completas (bytes, con
+    su salto de linea) de cada fragmento, descomprimidas si hay `encoding`.
+    """
+    max_bytes = MAX_DECODED_BYTES if max_bytes is None else max_bytes
+    if encoding == "gzip":
+        decoder = zlib.decompressobj(31)
+    elif encoding == "zstd":
+        decoder = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decoder = None
+    pending = b""
+    total = 0
+    try:
+        async for chunk in chunks:
+            if decoder is not None:
+                chunk = decoder.decompress(chunk)
+                total += len(chunk)
+                if total > max_bytes:
+                    raise BodyDecodeError("Cuerpo descomprimido demasiado grande", 413)
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            if lines:
+                yield [line + b"\n" for line in lines]
+        if decoder is not None and not decoder.eof:
+            raise BodyDecodeError(f"Cuerpo {encoding} incompleto")
+        if pending:
+            yield [pending]
+    except BodyDecodeError:
+        raise
+    except zlib.error as e:
+        raise BodyDecodeError(f"Cuerpo {encoding} invalido: {e}") from e
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise BodyDecodeError(f"Cuerpo {encoding} invalido: {e}") from e
+        raise
+
+def decode_body(data: bytes, encoding: str, max_bytes: int = None) -> bytes:
+    """Descomprime un cuerpo completo (JSON o MessagePack) con el mismo limite."""
+    if encoding is None:
+        return data
+    return b"".join(iter_decoded_lines(io.BytesIO(data), encoding, max_bytes))
+
+def iter_msgpack_lines(data: bytes):
+    """
+    Lineas de un cuerpo MessagePack: un arreglo de cadenas (igual que el JSON)
+    o una secuencia de cadenas sueltas, una por linea.
+    """
+    if msgpack is None:
+        raise BodyDecodeError("MessagePack no esta disponible en el servidor", 415)
+    unpacker = msgpack.Unpacker(raw=False, max_buffer_size=max(len(data), 1))
+    unpacker.feed(data)
+    try:
+        for item in unpacker:
+            if isinstance(item, list):
+                yield from item
+            else:
+                yield item
+    except (ValueError, msgpack.UnpackException) as e:
+        raise BodyDecodeError(f"Cuerpo MessagePack invalido: {e}") from e
+
+def negotiate_encoding(accept_encodings) -> str:
+    """Mejor Content-Encoding para la respuesta segun Accept-Encoding (None = sin comprimir)."""
+    if not RESPONSE_COMPRESSION:
+        return None
+    return accept_encodings.best_match(response_encodings())
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+class StreamCompressor:
+    """
+    Compresion por fragmentos de una respuesta en streaming (NDJSON): el cliente
+    recibe lo generado cada STREAM_FLUSH_BYTES sin esperar a que termine la respuesta.
+    """
+
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: formato gzip
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+        self._pending = 0
+
+    def feed(self, chunk) -> bytes:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = self._compressor.compress(chunk)
+        self._pending += len(chunk)
+        if self._pending >= STREAM_FLUSH_BYTES:
+            data += self._compressor.flush(self._flush_mode)
+            self._pending = 0
+        return data
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+def compress_stream(chunks, encoding: str):
+    """Comprime una respuesta en streaming conforme se generan los fragmentos."""
+    compressor = StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            data = compressor.feed(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+async def acompress_stream(chunks, encoding: str):
+    """Variante asincrona de compress_stream (respuestas de Quart)."""
+    compressor = StreamCompressor(encoding)
+    try:
+        async for chunk in chunks:
+            data = compressor.feed(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "aclose", None)
+        if close is not None:
+            await close()
+
+def dumps_line(obj) -> bytes:
+    """Serializa un objeto en una linea JSON (NDJSON)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj) + "\n").encode("utf-8")
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask (jsonify, request.get_json) con orjson.
+    Conserva el formato de Flask: llaves ordenadas y fechas como http_date.
+    Sin orjson se comporta igual que DefaultJSONProvider.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+    def _dumps_bytes(self, obj) -> bytes:
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)